@@ -0,0 +1,337 @@
+# trading-signals-website/backtest.py
+
+"""Backtest 18 combo (và các rule của RULES_FILE) trên nến lịch sử Binance
+
+    python backtest.py --start 2023-01-01 --end 2024-01-01 --interval 15m --workers 4
+
+Nến lịch sử được tải theo trang và lưu CSV trong HISTORY_DIR (chạy lại chỉ tải phần
+còn thiếu). Mỗi symbol chạy add_indicators + evaluate_combos một lần trên toàn bộ
+chuỗi rồi mô phỏng SL/TP vector hóa, các symbol chạy song song bằng process pool.
+Kết quả ghi vào BACKTEST_RESULTS_FILE, app đọc file này để hiển thị success_rate.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from config import COINS, INTERVAL, FETCH_WORKERS, HISTORY_DIR, BACKTEST_RESULTS_FILE
+from engine import (
+    BINANCE_MAX_LIMIT, KLINE_COLUMNS, MIN_CANDLES,
+    request_klines, interval_to_ms, parse_kline, add_indicators, evaluate_combos, features
+)
+from rules import rule_book
+
+logger = logging.getLogger("backtest")
+
+# Số nến trước `start` dùng để làm nóng indicator (EMA200)
+WARMUP_CANDLES = 300
+# Lệnh chưa chạm SL/TP sau HORIZON nến thì đóng ở giá close (96 nến = 1 ngày trên 15m)
+DEFAULT_HORIZON = 96
+
+# =============================================================================
+# HISTORY
+# =============================================================================
+
+def _to_ms(value):
+    """'2024-01-01' / ISO datetime (UTC) -> epoch milliseconds"""
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+def _history_path(history_dir, symbol, interval):
+    return os.path.join(history_dir, f"{symbol}_{interval}.csv")
+
+def read_history(symbol, interval, history_dir=HISTORY_DIR):
+    """Raw closed klines (KLINE_COLUMNS, open_time in ms) cached on disk; empty frame if none"""
+    path = _history_path(history_dir, symbol, interval)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=KLINE_COLUMNS)
+    return pd.read_csv(path)
+
+def _fetch_page(symbol, interval, start_ms, max_retries=5):
+    params = {"symbol": symbol, "interval": interval, "startTime": start_ms, "limit": BINANCE_MAX_LIMIT}
+    raw_klines = request_klines(symbol, params, max_retries)
+    if raw_klines is None:
+        raise RuntimeError(f"Không tải được lịch sử {symbol} từ {start_ms}")
+    return [parse_kline(k) for k in raw_klines]
+
+def download_history(symbol, interval, start_ms, end_ms, history_dir=HISTORY_DIR):
+    """Đảm bảo cache CSV phủ [start_ms, end_ms): chỉ tải các trang còn thiếu ở cuối
+
+    Nếu cache bắt đầu muộn hơn start_ms thì tải lại từ đầu.
+    """
+    interval_ms = interval_to_ms(interval)
+    cached = read_history(symbol, interval, history_dir)
+    now_ms = int(time.time() * 1000)
+
+    if cached.empty or cached["open_time"].iloc[0] > start_ms:
+        cached = pd.DataFrame(columns=KLINE_COLUMNS)
+        cursor = start_ms
+    else:
+        cursor = int(cached["open_time"].iloc[-1]) + interval_ms
+
+    rows = []
+    while cursor < min(end_ms, now_ms):
+        page = _fetch_page(symbol, interval, cursor)
+        rows.extend(row for row in page if row[6] < now_ms)
+        if len(page) < BINANCE_MAX_LIMIT:
+            break
+        cursor = page[-1][0] + interval_ms
+
+    if not rows:
+        return len(cached)
+
+    history = pd.concat([cached, pd.DataFrame(rows, columns=KLINE_COLUMNS)], ignore_index=True)
+    history = history.drop_duplicates("open_time", keep="last").sort_values("open_time")
+    path = _history_path(history_dir, symbol, interval)
+    os.makedirs(history_dir, exist_ok=True)
+    history.to_csv(f"{path}.tmp", index=False)
+    os.replace(f"{path}.tmp", path)
+    logger.info(f"📥 {symbol} {interval}: +{len(rows)} nến, tổng {len(history)}")
+    return len(history)
+
+def download_histories(symbols, interval, start_ms, end_ms, history_dir=HISTORY_DIR):
+    """download_history song song cho nhiều symbol, kèm WARMUP_CANDLES nến trước start_ms
+
+    Returns các symbol đã tải đủ lịch sử (theo thứ tự `symbols`); symbol tải lỗi được log
+    và bỏ ra để không backtest trên lịch sử thiếu.
+    """
+    warmup_ms = WARMUP_CANDLES * interval_to_ms(interval)
+    failed = set()
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="history") as executor:
+        futures = {
+            executor.submit(download_history, symbol, interval, start_ms - warmup_ms, end_ms, history_dir): symbol
+            for symbol in symbols
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                failed.add(futures[future])
+                logger.error(f"❌ Không tải đủ lịch sử {futures[future]} {interval}, bỏ symbol này: {e}")
+    return [symbol for symbol in symbols if symbol not in failed]
+
+# =============================================================================
+# SIMULATION
+# =============================================================================
+
+TRADE_FIELDS = ["bar", "exit_bar", "direction", "r", "rr", "outcome"]
+
+def _empty_trades():
+    return {field: np.empty(0) for field in TRADE_FIELDS}
+
+def simulate_trades(series, high, low, close, horizon=DEFAULT_HORIZON, start=0):
+    """Mô phỏng SL/TP cho mọi tín hiệu của một ComboSeries từ nến `start` trở đi
+
+    Vào lệnh ở giá entry khi nến tín hiệu đóng, xét `horizon` nến kế tiếp:
+    nến đầu tiên chạm TP là thắng, chạm SL là thua; SL và TP cùng chạm trong một
+    nến thì tính thua (không biết thứ tự trong nến). Hết horizon mà chưa chạm thì
+    đóng ở giá close; lệnh chưa đủ horizon nến ở cuối dữ liệu bị bỏ qua.
+    Mỗi combo chỉ giữ một lệnh tại một thời điểm.
+
+    Returns dict of arrays TRADE_FIELDS: r là lãi/lỗ theo R (1R = |entry - sl|),
+    rr là R:R kế hoạch, outcome 1 thắng / -1 thua / 0 hết hạn.
+    """
+    n = len(close)
+    signal = series.signal
+    idx = np.flatnonzero(signal[start:]) + start
+    if not len(idx):
+        return _empty_trades()
+
+    direction = signal[idx].astype(float)
+    entry, sl, tp = series.entry[idx], series.sl[idx], series.tp[idx]
+    risk = np.abs(entry - sl)
+    valid = np.isfinite(entry) & np.isfinite(sl) & np.isfinite(tp) & (risk > 0)
+    idx, direction, entry, sl, tp, risk = (a[valid] for a in (idx, direction, entry, sl, tp, risk))
+    if not len(idx):
+        return _empty_trades()
+
+    # Cửa sổ horizon nến sau mỗi nến tín hiệu: hàng i là các nến i+1 .. i+horizon
+    pad = np.full(horizon, np.nan)
+    window_high = sliding_window_view(np.concatenate([high[1:], pad]), horizon)[idx]
+    window_low = sliding_window_view(np.concatenate([low[1:], pad]), horizon)[idx]
+
+    is_long = (direction > 0)[:, None]
+    hit_tp = np.where(is_long, window_high >= tp[:, None], window_low <= tp[:, None])
+    hit_sl = np.where(is_long, window_low <= sl[:, None], window_high >= sl[:, None])
+    first_tp = np.where(hit_tp.any(axis=1), hit_tp.argmax(axis=1), horizon)
+    first_sl = np.where(hit_sl.any(axis=1), hit_sl.argmax(axis=1), horizon)
+
+    loss = (first_sl < horizon) & (first_sl <= first_tp)
+    win = (first_tp < horizon) & ~loss
+    expired = ~win & ~loss
+    complete = ~expired | (idx + horizon < n)
+
+    exit_bar = np.where(loss, idx + 1 + first_sl, np.where(win, idx + 1 + first_tp, idx + horizon))
+    rr = np.abs(tp - entry) / risk
+    expired_r = direction * (close[np.minimum(exit_bar, n - 1)] - entry) / risk
+    r = np.where(win, rr, np.where(loss, -1.0, expired_r))
+    outcome = np.where(win, 1, np.where(loss, -1, 0))
+
+    # Một lệnh mỗi lúc: bỏ tín hiệu xuất hiện khi lệnh trước còn mở
+    keep = np.zeros(len(idx), dtype=bool)
+    last_exit = -1
+    for i in np.flatnonzero(complete):
+        if idx[i] > last_exit:
+            keep[i] = True
+            last_exit = exit_bar[i]
+
+    trades = dict(bar=idx, exit_bar=exit_bar, direction=direction, r=r, rr=rr, outcome=outcome)
+    return {field: values[keep] for field, values in trades.items()}
+
+def summarize(trades):
+    """Win rate, expectancy (R), tổng R, drawdown lớn nhất (R) và R:R trung bình của một tập lệnh"""
+    order = np.argsort(trades["exit_time"], kind="stable") if "exit_time" in trades else slice(None)
+    r = np.asarray(trades["r"], dtype=float)[order]
+    outcome = np.asarray(trades["outcome"])[order]
+    wins, losses = int((outcome == 1).sum()), int((outcome == -1).sum())
+    decided = wins + losses
+
+    equity = np.cumsum(r)
+    peak = np.maximum.accumulate(np.concatenate([[0.0], equity]))[1:]
+    return {
+        "trades": int(len(r)),
+        "wins": wins,
+        "losses": losses,
+        "expired": int(len(r)) - decided,
+        "win_rate": round(wins / decided * 100, 1) if decided else 0,
+        "expectancy_r": round(float(r.mean()), 3) if len(r) else 0,
+        "total_r": round(float(r.sum()), 2),
+        "max_drawdown_r": round(float((peak - equity).max()), 2) if len(r) else 0,
+        "avg_rr": round(float(np.mean(trades["rr"])), 2) if len(r) else 0
+    }
+
+# =============================================================================
+# RUNNER
+# =============================================================================
+
+def load_frame(symbol, interval, start_ms, end_ms, history_dir=HISTORY_DIR):
+    """Lịch sử [start_ms, end_ms) kèm WARMUP_CANDLES nến làm nóng, đã tính indicators
+
+    Returns (df, close_times, start) với `start` là vị trí nến đầu tiên >= start_ms và
+    close_times là close_time (ms) từng nến, hoặc None nếu không đủ MIN_CANDLES nến.
+    """
+    raw = read_history(symbol, interval, history_dir)
+    raw = raw[raw["open_time"] < end_ms].reset_index(drop=True)
+    first = int(np.searchsorted(raw["open_time"].to_numpy(), start_ms))
+    raw = raw.iloc[max(0, first - WARMUP_CANDLES):].reset_index(drop=True)
+    start = min(first, WARMUP_CANDLES)
+    if len(raw) - start < MIN_CANDLES:
+        return None
+
+    df = raw.copy()
+    df["open_time"] = pd.to_datetime(df["open_time"], unit="ms", utc=True)
+    df["close_time"] = pd.to_datetime(df["close_time"], unit="ms", utc=True)
+    return add_indicators(df), raw["close_time"].to_numpy(), start
+
+def backtest_symbol(symbol, interval, start_ms, end_ms, horizon=DEFAULT_HORIZON, history_dir=HISTORY_DIR):
+    """Chạy mọi combo trên lịch sử của một symbol; trả về (symbol, {combo_name: trades})"""
+    loaded = load_frame(symbol, interval, start_ms, end_ms, history_dir)
+    if loaded is None:
+        return symbol, {}
+    df, close_times, start = loaded
+
+    high, low, close = (df[column].to_numpy(dtype=float) for column in ("high", "low", "close"))
+    trades_by_name = {}
+    # 18 combo và các rule của RULES_FILE dùng chung một Features
+    frame = features(df)
+    for series in evaluate_combos(frame) + rule_book.current().evaluate(frame, interval):
+        trades = simulate_trades(series, high, low, close, horizon, start)
+        trades["exit_time"] = close_times[np.minimum(trades["exit_bar"], len(close) - 1).astype(int)]
+        for name, side in ((series.long_name, 1), (series.short_name, -1)):
+            mask = trades["direction"] == side
+            if not mask.any():
+                continue
+            part = {field: values[mask] for field, values in trades.items()}
+            if name in trades_by_name:
+                part = {field: np.concatenate([trades_by_name[name][field], part[field]]) for field in part}
+            trades_by_name[name] = part
+    return symbol, trades_by_name
+
+def _merge(trade_sets):
+    return {field: np.concatenate([trades[field] for trades in trade_sets]) for field in trade_sets[0]}
+
+def run_backtest(symbols, interval, start, end, horizon=DEFAULT_HORIZON, workers=None,
+                 history_dir=HISTORY_DIR, output=BACKTEST_RESULTS_FILE, download=True):
+    """Tải lịch sử, backtest song song theo symbol và ghi kết quả theo combo/symbol ra JSON"""
+    started = time.time()
+    start_ms, end_ms = _to_ms(start), _to_ms(end)
+
+    skipped = []
+    if download:
+        complete = download_histories(symbols, interval, start_ms, end_ms, history_dir)
+        skipped = [symbol for symbol in symbols if symbol not in complete]
+        if not complete:
+            # Không ghi đè BACKTEST_RESULTS_FILE bằng kết quả rỗng
+            raise RuntimeError(f"Không tải được lịch sử {interval} của symbol nào")
+        symbols = complete
+    downloaded = time.time()
+
+    args = [(symbol, interval, start_ms, end_ms, horizon, history_dir) for symbol in symbols]
+    if workers == 1:
+        results = [backtest_symbol(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(backtest_symbol, *zip(*args)))
+
+    by_symbol, by_combo = {}, {}
+    for symbol, trades_by_name in results:
+        by_symbol[symbol] = {name: summarize(trades) for name, trades in sorted(trades_by_name.items())}
+        for name, trades in trades_by_name.items():
+            by_combo.setdefault(name, []).append(trades)
+
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "interval": interval,
+        "start": start,
+        "end": end,
+        "horizon": horizon,
+        "symbols": list(symbols),
+        "skipped_symbols": skipped,
+        "combos": {name: summarize(_merge(sets)) for name, sets in sorted(by_combo.items())},
+        "by_symbol": by_symbol
+    }
+    if output:
+        with open(f"{output}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        os.replace(f"{output}.tmp", output)
+
+    logger.info(f"✅ Backtest xong {len(symbols)} symbols: tải lịch sử {downloaded - started:.1f}s, "
+                f"tổng {time.time() - started:.1f}s")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest các combo trên nến lịch sử Binance")
+    parser.add_argument("--symbols", nargs="+", default=COINS)
+    parser.add_argument("--interval", default=INTERVAL)
+    parser.add_argument("--start", required=True, help="YYYY-MM-DD (UTC)")
+    parser.add_argument("--end", default=datetime.now(timezone.utc).strftime("%Y-%m-%d"))
+    parser.add_argument("--horizon", type=int, default=DEFAULT_HORIZON, help="số nến tối đa giữ lệnh")
+    parser.add_argument("--workers", type=int, default=None, help="số process (1 = chạy tuần tự)")
+    parser.add_argument("--history-dir", default=HISTORY_DIR)
+    parser.add_argument("--output", default=BACKTEST_RESULTS_FILE)
+    parser.add_argument("--no-download", action="store_true", help="chỉ dùng lịch sử đã có trên đĩa")
+    args = parser.parse_args()
+
+    try:
+        report = run_backtest(args.symbols, args.interval, args.start, args.end, args.horizon, args.workers,
+                              args.history_dir, args.output, download=not args.no_download)
+    except RuntimeError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    for name, stats in report["combos"].items():
+        print(f"{name:40s} {stats['trades']:6d} lệnh  win {stats['win_rate']:5.1f}%  "
+              f"E {stats['expectancy_r']:+.3f}R  DD {stats['max_drawdown_r']:.1f}R  RR {stats['avg_rr']:.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+# trading-signals-website/benchmark.py
+
+"""Benchmark indicators, combos, key lookup, stats và API trên dữ liệu tổng hợp
+
+    python benchmark.py                                  # chạy và ghi baseline
+    python benchmark.py --compare benchmark_baseline.json  # chạy lại, so với baseline
+    python benchmark.py --only indicators combos --rows 500 5000
+
+Nến OHLCV (random walk) và store signals/keys đều sinh từ seed cố định, nên hai lần
+chạy trên cùng máy đo cùng một khối lượng việc. Mỗi case tự chọn số lần lặp để một
+mẫu dài ít nhất MIN_SAMPLE_SECONDS rồi lấy median của `--repeat` mẫu. Kết quả ghi ra
+JSON; --compare báo các case chậm hơn baseline quá `--threshold` và thoát với mã 1.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import argparse
+import platform
+import statistics
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from config import TIMEFRAME_STYLES, KEY_TYPES
+from engine import BASE_INTERVAL, COMBOS, interval_to_ms, add_indicators, evaluate_combos
+from events import StoreRelay
+from storage import KeyIndex, StatsAggregator, VoteBuffer, create_store
+
+logger = logging.getLogger("benchmark")
+
+DEFAULT_OUTPUT = "benchmark_baseline.json"
+DEFAULT_ROWS = (500, 5_000, 100_000)
+DEFAULT_SIGNALS = (1_000, 10_000, 100_000)
+DEFAULT_KEYS = 10_000
+GROUPS = ("indicators", "combos", "keys", "stats", "api")
+SEED = 42
+
+# Một mẫu đo phải dài ít nhất chừng này để độ phân giải của timer không đáng kể
+MIN_SAMPLE_SECONDS = 0.02
+# Case chậm hơn baseline quá tỉ lệ này bị coi là regression
+DEFAULT_THRESHOLD = 0.25
+
+# =============================================================================
+# SYNTHETIC DATA
+# =============================================================================
+
+def synthetic_ohlcv(rows, seed=SEED, interval=BASE_INTERVAL, start_price=100.0):
+    """DataFrame OHLCV như backtest đưa vào add_indicators: random walk log-normal, high/low bao quanh open/close"""
+    rng = np.random.default_rng(seed)
+    interval_ms = interval_to_ms(interval)
+    open_time = (1_700_000_000_000 // interval_ms) * interval_ms + np.arange(rows, dtype=np.int64) * interval_ms
+    close = start_price * np.exp(np.cumsum(rng.normal(0, 0.004, rows)))
+    open_ = np.concatenate(([start_price], close[:-1]))
+    spread = np.abs(rng.normal(0, 0.002, rows))
+    high = np.maximum(open_, close) * (1 + spread)
+    low = np.minimum(open_, close) * (1 - spread)
+    volume = rng.lognormal(4, 0.5, rows)
+    return pd.DataFrame({
+        "open_time": pd.to_datetime(open_time, unit="ms", utc=True),
+        "open": open_, "high": high, "low": low, "close": close, "volume": volume,
+        "close_time": pd.to_datetime(open_time + interval_ms - 1, unit="ms", utc=True),
+        "quote_volume": volume * close,
+        "trades": rng.integers(50, 5_000, rows)
+    })
+
+def synthetic_signals(count, symbols, seed=SEED, now=None):
+    """`count` signals rải đều 60 ngày gần nhất; ~30% active, còn lại đã đóng (win/loss/expired)"""
+    rng = np.random.default_rng(seed)
+    now = now or datetime.now(timezone.utc)
+    combo_names = [f"Combo{i}" for i in range(1, len(COMBOS) + 1)]
+    intervals = list(TIMEFRAME_STYLES)
+    ages = np.sort(rng.uniform(0, 60 * 86_400, count))[::-1]
+    signals = []
+    for i in range(count):
+        timestamp = now - timedelta(seconds=float(ages[i]))
+        direction = "LONG" if rng.random() < 0.5 else "SHORT"
+        entry = float(rng.uniform(1, 50_000))
+        risk = entry * 0.01
+        sign = 1 if direction == "LONG" else -1
+        interval = intervals[i % len(intervals)]
+        signal = {
+            "id": str(uuid.UUID(int=int(rng.integers(0, 2 ** 63)) << 64 | i)),
+            "timestamp": timestamp.isoformat(),
+            "coin": symbols[i % len(symbols)],
+            "direction": direction,
+            "entry": entry, "sl": entry - sign * risk, "tp": entry + sign * 2 * risk, "rr": 2.0,
+            "combo_name": f"{combo_names[i % len(combo_names)]}_{direction}",
+            "interval": interval,
+            "timeframe": TIMEFRAME_STYLES[interval],
+            "status": "active",
+            "votes_win": int(rng.integers(0, 5)),
+            "votes_lose": int(rng.integers(0, 5)),
+            "voted_ips": []
+        }
+        if rng.random() < 0.7:
+            closed_at = min(timestamp + timedelta(hours=float(rng.uniform(1, 24))), now)
+            signal.update(status="closed", outcome=str(rng.choice(["win", "loss", "expired"])),
+                          closed_by="price", closed_at=closed_at.isoformat())
+        signals.append(signal)
+    return signals
+
+def synthetic_keys(count, seed=SEED, now=None):
+    """`count` access key, một nửa đã được nickname nhận"""
+    rng = np.random.default_rng(seed)
+    now = now or datetime.now(timezone.utc)
+    key_types = list(KEY_TYPES)
+    keys = {}
+    for i in range(count):
+        key_type = key_types[i % len(key_types)]
+        keys[f"key_{i}"] = {
+            "key": f"bench-{i}-{int(rng.integers(0, 2 ** 62)):x}",
+            "type": key_type,
+            "duration_hours": KEY_TYPES[key_type],
+            "created_at": now.isoformat(),
+            "expires_at": (now + timedelta(hours=KEY_TYPES[key_type])).isoformat(),
+            "is_active": True,
+            "used_by": f"user{i}" if i % 2 else None,
+            "used_at": now.isoformat() if i % 2 else None
+        }
+    return keys
+
+def build_store(backend, directory, signals, keys):
+    """Store mới trong `directory` đã nạp sẵn signals và keys"""
+    os.makedirs(directory, exist_ok=True)
+    path = lambda name: os.path.join(directory, name)
+    store = create_store(backend, path("signals.db"), path("signals.json"), path("keys.json"), path("users.json"))
+    store.init()
+    store.add_signals(signals)
+    for key_id, key_data in keys.items():
+        store.save_key(key_id, key_data)
+    if backend == "json":
+        # Gộp journal ngay, để compaction nền không chạy xen vào lúc đo
+        store.compact()
+    return store
+
+# =============================================================================
+# TIMING
+# =============================================================================
+
+def _run(fn, number):
+    started = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return time.perf_counter() - started
+
+def measure(fn, repeat):
+    """Thời gian một lần gọi `fn` (giây): median/min/mean của `repeat` mẫu
+
+    Lần gọi đầu tiên chỉ để làm nóng (load index, cache của store) và không được tính.
+    """
+    fn()
+    number = 1
+    elapsed = _run(fn, number)
+    while elapsed < MIN_SAMPLE_SECONDS and number < 1_000_000:
+        number *= 10
+        elapsed = _run(fn, number)
+    samples = [elapsed / number] + [_run(fn, number) / number for _ in range(repeat - 1)]
+    return {
+        "median": statistics.median(samples), "min": min(samples), "mean": statistics.fmean(samples),
+        "number": number, "repeat": repeat
+    }
+
+class Suite:
+    """Gom kết quả các case theo tên"""
+
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = {}
+
+    def case(self, name, fn):
+        self.results[name] = result = measure(fn, self.repeat)
+        print(f"{name:60s} {format_seconds(result['median']):>10s}  (min {format_seconds(result['min'])}, "
+              f"x{result['number']})")
+        return result
+
+def format_seconds(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("µs", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
+
+# =============================================================================
+# BENCHMARKS
+# =============================================================================
+
+def bench_engine(suite, rows_list, symbols, groups):
+    """add_indicators, từng combo và evaluate_combos trên `symbols` frame mỗi cỡ (thời gian cho cả nhóm symbol)"""
+    for rows in rows_list:
+        frames = [synthetic_ohlcv(rows, seed=SEED + i) for i in range(len(symbols))]
+        if "indicators" in groups:
+            suite.case(f"indicators/add_indicators/rows={rows}", lambda: [add_indicators(df) for df in frames])
+        if "combos" in groups:
+            indicator_frames = [add_indicators(df) for df in frames]
+            for combo in COMBOS:
+                suite.case(f"combos/{combo.__name__}/rows={rows}",
+                           lambda combo=combo: [combo(df) for df in indicator_frames])
+            # Cả 18 combo trên một Features chung (feature dẫn xuất tính một lần mỗi frame)
+            suite.case(f"combos/evaluate_combos/rows={rows}",
+                       lambda: [evaluate_combos(df) for df in indicator_frames])
+
+def bench_storage(suite, backend, store, keys, groups, label):
+    """Key lookup, validate_key và stats trên một store đã nạp dữ liệu"""
+    if "keys" in groups:
+        key_index = KeyIndex(store)
+        hit = keys[f"key_{len(keys) // 2}"]["key"] if keys else ""
+        suite.case(f"keys/find_hit/{backend}/{label}", lambda: key_index.find(hit))
+        suite.case(f"keys/find_miss/{backend}/{label}", lambda: key_index.find("missing-key"))
+        suite.case(f"keys/reload/{backend}/{label}", lambda: store.list_keys())
+    if "stats" in groups:
+        signal_stats = StatsAggregator(store)
+        suite.case(f"stats/rebuild/{backend}/{label}", signal_stats.rebuild)
+        suite.case(f"stats/snapshot/{backend}/{label}", signal_stats.snapshot)
+
+def bench_api(suite, web, backend, store, keys, symbols, label):
+    """Độ trễ các endpoint qua Flask test client, app trỏ vào store tổng hợp"""
+    # Mọi object của app giữ store (kể cả vote buffer và relay SSE) đều trỏ sang store tổng hợp
+    saved = {name: getattr(web, name) for name in ("store", "key_index", "signal_stats", "votes", "relay")}
+    stats = StatsAggregator(store)
+    web.store, web.key_index, web.signal_stats = store, KeyIndex(store), stats
+    web.votes = VoteBuffer(stats, saved["votes"].close_after, saved["votes"].interval)
+    web.relay = StoreRelay(web.broker, store.signals_version, web.signal_changes)
+    try:
+        web.app.config["TESTING"] = True
+        client = web.app.test_client()
+        with client.session_transaction() as session:
+            session["user"] = {"nickname": "bench", "is_admin": True,
+                               "login_time": datetime.now(timezone.utc).isoformat()}
+
+        def get(url, **kwargs):
+            return lambda: client.get(url, **kwargs).close()
+
+        etag = client.get("/api/signals").headers.get("ETag")
+        cursor = client.get("/api/signals?limit=100").headers.get("X-Next-Cursor", "")
+        suite.case(f"api/signals/{backend}/{label}", get("/api/signals"))
+        suite.case(f"api/signals_all_page/{backend}/{label}", get("/api/signals?status=all&limit=100"))
+        suite.case(f"api/signals_cursor/{backend}/{label}", get(f"/api/signals?limit=100&cursor={cursor}"))
+        suite.case(f"api/signals_coin/{backend}/{label}", get(f"/api/signals?status=all&limit=100&coin={symbols[0]}"))
+        suite.case(f"api/signals_304/{backend}/{label}", get("/api/signals", headers={"If-None-Match": etag}))
+        suite.case(f"api/stats/{backend}/{label}", get("/api/stats"))
+        if keys:
+            form = {"nickname": "bench-miss", "access_key": "missing-key"}
+            suite.case(f"api/login_bad_key/{backend}/{label}", lambda: client.post("/login", data=form).close())
+    finally:
+        for name, value in saved.items():
+            setattr(web, name, value)
+
+def import_app(directory):
+    """Import app.py với file log/DB mặc định nằm trong thư mục tạm"""
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        import app as web
+    finally:
+        os.chdir(cwd)
+    # Mỗi lần login sai app log một warning
+    logging.getLogger("app").setLevel(logging.ERROR)
+    return web
+
+def run_benchmarks(args):
+    suite = Suite(args.repeat)
+    groups = set(args.only)
+    symbols = [f"SYM{i}USDT" for i in range(args.symbols)]
+
+    if groups & {"indicators", "combos"}:
+        bench_engine(suite, args.rows, symbols, groups)
+
+    if groups & {"keys", "stats", "api"}:
+        with tempfile.TemporaryDirectory(prefix="signals-bench-") as directory:
+            web = import_app(directory) if "api" in groups else None
+            keys = synthetic_keys(args.keys)
+            for count in args.signals:
+                signals = synthetic_signals(count, symbols)
+                for backend in args.backend:
+                    started = time.perf_counter()
+                    store = build_store(backend, os.path.join(directory, f"{backend}-{count}"), signals, keys)
+                    logger.info(f"📦 {backend}: {count} signals + {len(keys)} keys nạp trong "
+                                f"{time.perf_counter() - started:.1f}s")
+                    label = f"signals={count},keys={len(keys)}"
+                    bench_storage(suite, backend, store, keys, groups, label)
+                    if web is not None:
+                        bench_api(suite, web, backend, store, keys, symbols, label)
+    return suite.results
+
+# =============================================================================
+# BASELINE
+# =============================================================================
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__
+    }
+
+def compare(baseline, results, threshold):
+    """In bảng so sánh với baseline; trả về danh sách case bị regression"""
+    if baseline.get("environment") != environment():
+        print("⚠️ Baseline được đo trên môi trường khác, so sánh chỉ mang tính tham khảo")
+    regressions = []
+    print(f"\n{'case':60s} {'baseline':>10s} {'now':>10s} {'change':>8s}")
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:60s} {'-':>10s} {format_seconds(result['median']):>10s}      new")
+            continue
+        change = result["median"] / before["median"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = " ⚠️"
+        print(f"{name:60s} {format_seconds(before['median']):>10s} {format_seconds(result['median']):>10s} "
+              f"{change:+7.1%}{flag}")
+    missing = sorted(set(baseline["results"]) - set(results))
+    if missing:
+        print(f"ℹ️ {len(missing)} case trong baseline không được chạy lần này")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark indicators, combos, key lookup, stats và API")
+    parser.add_argument("--only", nargs="+", choices=GROUPS, default=list(GROUPS))
+    parser.add_argument("--rows", nargs="+", type=int, default=list(DEFAULT_ROWS), help="số nến mỗi symbol")
+    parser.add_argument("--symbols", type=int, default=3, help="số symbol cho indicators/combos")
+    parser.add_argument("--signals", nargs="+", type=int, default=list(DEFAULT_SIGNALS),
+                        help="cỡ store signals (vd. 1000 1000000)")
+    parser.add_argument("--keys", type=int, default=DEFAULT_KEYS, help="số access key trong store")
+    parser.add_argument("--backend", nargs="+", choices=("sqlite", "json"), default=["sqlite", "json"])
+    parser.add_argument("--repeat", type=int, default=5, help="số mẫu mỗi case")
+    parser.add_argument("--output", help=f"file JSON kết quả (mặc định {DEFAULT_OUTPUT} khi không --compare)")
+    parser.add_argument("--compare", metavar="BASELINE", help="so với file baseline đã ghi trước đó")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="tỉ lệ chậm hơn baseline bị coi là regression (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = run_benchmarks(args)
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "environment": environment(),
+        "config": {key: getattr(args, key) for key in ("only", "rows", "symbols", "signals", "keys", "backend", "repeat")},
+        "results": results
+    }
+    output = args.output or (None if args.compare else DEFAULT_OUTPUT)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Đã ghi {len(results)} case vào {output}")
+
+    if baseline is not None:
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} case chậm hơn baseline quá {args.threshold:.0%}")
+            sys.exit(1)
+        print("\n✅ Không có regression")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# trading-signals-website/candles.py
+
+"""Kho nến dạng cột: mỗi field là một mảng NumPy cấp phát sẵn, dùng lại giữa các lần scan
+
+ColumnarRing giữ tối đa `capacity` dòng gần nhất cho mỗi (symbol, interval), nên bộ nhớ
+bị chặn ở số symbol × capacity × số field. Combo đọc qua CandleView: mỗi cột là một
+view (không copy) của vùng dữ liệu hiện tại.
+
+Ghi chỉ nối vào phần trống phía sau; khi hết chỗ thì cấp phát buffer mới và chép
+`capacity` dòng cuối sang, không bao giờ ghi đè tại chỗ. Nhờ vậy một CandleView đã
+lấy ra vẫn đúng (là snapshot) dù sau đó thread khác ghi thêm nến.
+"""
+
+import numpy as np
+
+class CandleView:
+    """Mapping tên cột -> mảng NumPy cùng độ dài, đủ cho combo (_col/_mask) và resolve"""
+
+    def __init__(self, columns):
+        self._columns = columns
+        self._length = len(next(iter(columns.values()))) if columns else 0
+
+    def __getitem__(self, name):
+        return self._columns[name]
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    def tail(self, n):
+        """n dòng cuối (vẫn là view)"""
+        if n >= self._length:
+            return self
+        return CandleView({name: values[self._length - n:] for name, values in self._columns.items()})
+
+    def slice(self, start, stop=None):
+        return CandleView({name: values[start:stop] for name, values in self._columns.items()})
+
+    def select(self, mask):
+        """Các dòng có mask True (copy, như df[mask])"""
+        return CandleView({name: values[mask] for name, values in self._columns.items()})
+
+    def row(self, index):
+        """Một dòng dạng dict với scalar Python (float32 được nâng lên float khi tính tiếp)"""
+        return {name: values[index].item() for name, values in self._columns.items()}
+
+    def rows(self):
+        """Toàn bộ dòng dạng list (để ghi JSON)"""
+        return [list(row) for row in zip(*(values.tolist() for values in self._columns.values()))]
+
+class ColumnarRing:
+    """`capacity` dòng gần nhất của các field trong `dtypes` ({tên: dtype}), mỗi field một mảng"""
+
+    def __init__(self, dtypes, capacity, slack=None):
+        self.dtypes = dict(dtypes)
+        self.capacity = capacity
+        # Phần trống phía sau: hết chỗ mới phải cấp phát + chép, tức một lần mỗi `slack` dòng
+        self.slack = slack or max(capacity // 4, 64)
+        self._buffers = self._allocate()
+        self._start = 0
+        self._end = 0
+
+    def _allocate(self):
+        return {name: np.empty(self.capacity + self.slack, dtype=dtype) for name, dtype in self.dtypes.items()}
+
+    def __len__(self):
+        return self._end - self._start
+
+    def _reserve(self, count):
+        """Đảm bảo còn chỗ cho `count` dòng mới; bỏ các dòng cũ vượt capacity"""
+        if self._end + count <= self.capacity + self.slack:
+            return
+        keep = min(len(self), self.capacity - count)
+        buffers = self._allocate()
+        for name, values in self._buffers.items():
+            buffers[name][:keep] = values[self._end - keep:self._end]
+        self._buffers, self._start, self._end = buffers, 0, keep
+
+    def extend(self, columns):
+        """Nối thêm các dòng cho dưới dạng {tên: mảng}; chỉ giữ `capacity` dòng cuối"""
+        count = len(next(iter(columns.values())))
+        if count > self.capacity:
+            columns = {name: values[count - self.capacity:] for name, values in columns.items()}
+            count = self.capacity
+        if not count:
+            return
+        self._reserve(count)
+        for name, values in self._buffers.items():
+            values[self._end:self._end + count] = columns[name]
+        self._end += count
+        if len(self) > self.capacity:
+            self._start = self._end - self.capacity
+
+    def extend_rows(self, rows):
+        """Nối thêm các dòng dạng list theo thứ tự field (vd. kline đã parse)"""
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        self.extend({name: np.asarray(columns[i], dtype=dtype) for i, (name, dtype) in enumerate(self.dtypes.items())})
+
+    def append(self, row):
+        """Nối thêm một dòng dạng dict {tên: giá trị}"""
+        self._reserve(1)
+        for name, values in self._buffers.items():
+            values[self._end] = row[name]
+        self._end += 1
+        if len(self) > self.capacity:
+            self._start += 1
+
+    def clear(self):
+        self._buffers = self._allocate()
+        self._start = self._end = 0
+
+    def view(self):
+        """CandleView zero-copy của các dòng hiện có"""
+        return CandleView({name: values[self._start:self._end] for name, values in self._buffers.items()})
+
+    @property
+    def nbytes(self):
+        return sum(values.nbytes for values in self._buffers.values())
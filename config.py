@@ -13,9 +13,43 @@ COINS = [
 ]
 
 INTERVAL = os.getenv("INTERVAL", "15m")
+# Multi-timeframe: chỉ interval nhỏ nhất được tải từ sàn, các interval lớn hơn resample từ nó
+INTERVALS = [i.strip() for i in os.getenv("INTERVALS", INTERVAL).split(",") if i.strip()]
 LIMIT = int(os.getenv("LIMIT", "500"))
 SQUEEZE_THRESHOLD = float(os.getenv("SQUEEZE_THRESHOLD", "0.015"))
+# Signal cùng (coin, combo, direction) trong COOLDOWN_MINUTES bị bỏ; signal của combo khác trên
+# cùng nến có entry/SL/TP lệch không quá SIGNAL_DEDUP_TOLERANCE × entry cũng bị bỏ (trùng)
 COOLDOWN_MINUTES = int(os.getenv("COOLDOWN_MINUTES", "30"))
+SIGNAL_DEDUP_TOLERANCE = float(os.getenv("SIGNAL_DEDUP_TOLERANCE", "0.001"))
+# Signal chưa chạm TP/SL sau số giờ này thì đóng với outcome "expired"
+SIGNAL_EXPIRY_HOURS = int(os.getenv("SIGNAL_EXPIRY_HOURS", "48"))
+
+# Phong cách giao dịch theo timeframe (bộ lọc scalping/intraday/swing trên dashboard)
+TIMEFRAME_STYLES = {
+    "1m": "scalping", "3m": "scalping", "5m": "scalping", "15m": "scalping",
+    "30m": "intraday", "1h": "intraday", "2h": "intraday",
+    "4h": "swing", "6h": "swing", "12h": "swing", "1d": "swing"
+}
+
+# Fetch song song: số thread và ngân sách request/giây cho mỗi host sàn
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "8"))
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "10"))
+# Số process chạy indicators + combos song song khi scan; 0 hoặc 1 = chạy tuần tự trong scanner
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", "0"))
+
+# Nguồn nến: "rest" (cron scan sau mỗi nến base) hoặc "stream" (websocket, đánh giá ngay khi nến đóng)
+INGESTION_MODE = os.getenv("INGESTION_MODE", "rest")
+BINANCE_STREAM_URL = os.getenv("BINANCE_STREAM_URL", "wss://stream.binance.com:9443")
+
+# File lock chọn một process scanner (leader) chạy scheduler nếu lỡ chạy nhiều scanner
+SCHEDULER_LOCK_FILE = os.getenv("SCHEDULER_LOCK_FILE", "scheduler.lock")
+
+# Combo khai báo (xem rules.py): JSON hoặc YAML, sửa file là scanner và web app tự nạp lại
+RULES_FILE = os.getenv("RULES_FILE", "rules.json")
+
+# Backtest: thư mục nến lịch sử và file kết quả (nguồn của success_rate)
+HISTORY_DIR = os.getenv("HISTORY_DIR", "history")
+BACKTEST_RESULTS_FILE = os.getenv("BACKTEST_RESULTS_FILE", "backtest_results.json")
 
 # =============================================================================
 # CẤU HÌNH WEBSITE & BẢO MẬT
@@ -25,6 +59,26 @@ ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "admin")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin123")
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key-change-in-production")
 
+# Số kết nối SSE (/api/stream) tối đa mỗi process; mỗi kết nối giữ một thread của gunicorn
+SSE_MAX_CLIENTS = int(os.getenv("SSE_MAX_CLIENTS", "200"))
+# Vote tới trong cửa sổ này (giây) được ghi chung một transaction; mỗi vote chờ lô của nó được ghi
+VOTE_FLUSH_INTERVAL = float(os.getenv("VOTE_FLUSH_INTERVAL", "0.2"))
+
+# Storage: "sqlite" (mặc định, WAL) hoặc "json" (3 file JSON như bản cũ làm snapshot + journal append-only)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")
+DATABASE_FILE = os.getenv("DATABASE_FILE", "trading_signals.db")
+
+# File paths (dùng chung bởi web app và scanner)
+DATA_FILE = 'trading_signals.json'
+KEYS_FILE = 'access_keys.json'
+USERS_FILE = 'users.json'
+KLINES_CACHE_DIR = 'klines_cache'
+
+# Metrics của scanner (thời gian từng pha, retry HTTP, độ trễ scheduler) -> /metrics của web app
+METRICS_FILE = os.getenv("METRICS_FILE", "metrics.json")
+# Nếu đặt, /metrics yêu cầu header "Authorization: Bearer <token>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
 # Key types và durations (giờ)
 KEY_TYPES = {
     "24h": 24,
@@ -38,12 +92,13 @@ KEY_TYPES = {
 # MÔ TẢ COMBO
 # =============================================================================
 
+# success_rate không ghi cứng ở đây: app lấy từ BACKTEST_RESULTS_FILE (python backtest.py)
+
 COMBO_DETAILS = {
     "FVG Squeeze Pro": {
         "description": "Kết hợp Squeeze Momentum và FVG (Fair Value Gap)",
         "conditions": "BB Width < 0.015, Volume spike > 130%, Giá trên EMA200",
         "rr_ratio": "1:3",
-        "timeframe": "15m-1h",
-        "success_rate": "72%"
+        "timeframe": "15m-1h"
     }
 }
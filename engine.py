@@ -0,0 +1,1331 @@
+# trading-signals-website/engine.py
+
+"""Trading engine: tải nến, indicators, combos và kết quả theo giá của signal
+
+Không đọc/ghi store: scanner.py dùng engine để tạo và đóng signals, backtest.py dùng
+cùng các combo trên dữ liệu lịch sử. Web app (app.py) không import module này.
+"""
+
+import os
+import json
+import math
+import time
+import uuid
+import logging
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse
+
+import requests
+import numpy as np
+import pandas as pd
+from requests.adapters import HTTPAdapter
+from ta.trend import MACD, EMAIndicator
+from ta.momentum import RSIIndicator
+from ta.volatility import BollingerBands, AverageTrueRange
+
+from config import (
+    INTERVAL, INTERVALS, TIMEFRAME_STYLES, LIMIT, SQUEEZE_THRESHOLD, SIGNAL_EXPIRY_HOURS,
+    FETCH_WORKERS, RATE_LIMIT_PER_SECOND, KLINES_CACHE_DIR
+)
+from candles import CandleView, ColumnarRing
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# TRADING ENGINE (giữ nguyên từ code trước)
+# =============================================================================
+
+BINANCE_API_URL = "https://api.binance.com"
+BINANCE_HOST = urlparse(BINANCE_API_URL).netloc
+
+# Số nến tối thiểu để tính indicator (ATR/BB/MACD cần ít nhất ~35 nến)
+MIN_CANDLES = 50
+
+# Các trường giữ lại từ mỗi kline của Binance (bỏ taker_buy_* và ignore)
+KLINE_COLUMNS = ["open_time", "open", "high", "low", "close", "volume",
+                 "close_time", "quote_volume", "trades"]
+# Kiểu lưu trong kho nến (cùng thứ tự KLINE_COLUMNS): giá giữ float64 vì SL/TP so tới từng tick,
+# volume chỉ so với ngưỡng nên float32 là đủ; thời gian là epoch milliseconds
+KLINE_DTYPES = {
+    "open_time": np.int64, "open": np.float64, "high": np.float64, "low": np.float64, "close": np.float64,
+    "volume": np.float32, "close_time": np.int64, "quote_volume": np.float32, "trades": np.int32
+}
+DAY_MS = 86_400_000
+
+INTERVAL_UNITS_MS = {"m": 60_000, "h": 3_600_000, "d": 86_400_000, "w": 604_800_000}
+# Nến tuần của Binance bắt đầu thứ Hai, epoch (1970-01-01) là thứ Năm
+INTERVAL_OFFSETS_MS = {"w": 4 * 86_400_000}
+
+# Số nến tối đa mỗi request /api/v3/klines
+BINANCE_MAX_LIMIT = 1000
+
+def interval_to_ms(interval):
+    """Convert a Binance interval string ("15m", "4h", ...) to milliseconds"""
+    return int(interval[:-1]) * INTERVAL_UNITS_MS[interval[-1]]
+
+# Chỉ tải interval nhỏ nhất, các interval còn lại resample từ nó
+BASE_INTERVAL = min(INTERVALS, key=interval_to_ms)
+for _interval in INTERVALS:
+    if interval_to_ms(_interval) % interval_to_ms(BASE_INTERVAL):
+        raise ValueError(f"Interval {_interval} không phải bội số của {BASE_INTERVAL}")
+# Cache nến base đủ dài để resample ra LIMIT nến của interval lớn nhất
+BASE_LIMIT = LIMIT * max(interval_to_ms(i) for i in INTERVALS) // interval_to_ms(BASE_INTERVAL)
+
+def parse_kline(raw):
+    """Parse one raw Binance kline row into the numeric layout of KLINE_COLUMNS"""
+    return [
+        int(raw[0]), float(raw[1]), float(raw[2]), float(raw[3]), float(raw[4]),
+        float(raw[5]), int(raw[6]), float(raw[7]), int(raw[8])
+    ]
+
+def resample_candles(candles, interval, base_interval):
+    """Gộp nến base_interval thành nến interval (bội số của base), chỉ giữ các bucket đủ nến"""
+    if interval == base_interval or not candles:
+        return candles
+    base_ms, target_ms = interval_to_ms(base_interval), interval_to_ms(interval)
+    offset = INTERVAL_OFFSETS_MS.get(interval[-1], 0)
+
+    bucket = (candles["open_time"] - offset) // target_ms * target_ms + offset
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(bucket)] - 1
+    # Bucket thiếu nến là nến chưa đóng (cuối chuỗi) hoặc bị hụt dữ liệu
+    complete = ends - starts + 1 == target_ms // base_ms
+
+    def total(column, dtype):
+        return np.add.reduceat(candles[column], starts, dtype=dtype)
+
+    resampled = CandleView({
+        "open_time": bucket[starts],
+        "open": candles["open"][starts],
+        "high": np.maximum.reduceat(candles["high"], starts),
+        "low": np.minimum.reduceat(candles["low"], starts),
+        "close": candles["close"][ends],
+        "volume": total("volume", np.float64).astype(np.float32),
+        "close_time": bucket[starts] + target_ms - 1,
+        "quote_volume": total("quote_volume", np.float64).astype(np.float32),
+        "trades": total("trades", np.int64).astype(np.int32)
+    })
+    return resampled.select(complete)
+
+class KlineCache:
+    """Cache nến đã đóng theo (symbol, interval), lưu xuống đĩa để restart không phải backfill
+
+    Trong bộ nhớ mỗi (symbol, interval) là một ColumnarRing `limit` dòng; get/merge trả về
+    CandleView zero-copy nên mỗi lần scan không phải dựng lại DataFrame từ cache.
+
+    Trên đĩa là snapshot `<symbol>_<interval>.json` + journal `.json.journal` (JSON Lines):
+    merge chỉ append các nến mới vào journal, snapshot được ghi lại (file tạm + os.replace,
+    rồi xóa journal) khi journal dài quá `limit` dòng, khi cache bị thay hoặc có khoảng trống.
+    Load bỏ qua dòng journal đã có trong snapshot nên crash giữa hai bước không nhân đôi nến.
+    """
+
+    def __init__(self, cache_dir, limit):
+        self.cache_dir = cache_dir
+        self.limit = limit
+        self.backfilled = set()  # (symbol, interval) đã tải đủ `limit` nến trong process này
+        self._rings = {}
+        self._journaled = {}  # (symbol, interval) -> số dòng trong journal
+        self._io_locks = {}   # (symbol, interval) -> Lock: ghi file theo đúng thứ tự merge
+        self._lock = threading.Lock()
+
+    def _path(self, symbol, interval):
+        return os.path.join(self.cache_dir, f"{symbol}_{interval}.json")
+
+    def _journal_path(self, symbol, interval):
+        return f"{self._path(symbol, interval)}.journal"
+
+    def _load(self, symbol, interval):
+        """Snapshot + các dòng journal nối tiếp nó; trả về (rows, số dòng journal)"""
+        path = self._path(symbol, interval)
+        rows = []
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    rows = json.load(f)[-self.limit:]
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠️ Cache klines {path} lỗi, sẽ tải lại từ đầu: {e}")
+                rows = []
+
+        journal_path = self._journal_path(symbol, interval)
+        journaled = 0
+        try:
+            with open(journal_path, 'rb+') as f:
+                data = f.read()
+                # Dòng cuối ghi dở (crash giữa lúc append): cắt bỏ để dòng sau không dính vào nó
+                end = data.rfind(b"\n") + 1
+                f.truncate(end)
+        except FileNotFoundError:
+            return rows, 0
+        except OSError as e:
+            logger.warning(f"⚠️ Journal klines {journal_path} lỗi, bỏ qua: {e}")
+            return rows, 0
+        for line in data[:end].splitlines():
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            journaled += 1
+            if rows and row[0] <= rows[-1][0]:
+                continue  # đã có trong snapshot
+            if rows and row[0] > rows[-1][6] + 1:
+                # Khoảng trống: get_klines tải lại từ nến cuối liền mạch, lần merge sau ghi lại snapshot
+                return rows[-self.limit:], self.limit
+            rows.append(row)
+        return rows[-self.limit:], journaled
+
+    def _save(self, symbol, interval, rows):
+        path = self._path(symbol, interval)
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(rows, f, separators=(',', ':'))
+            os.replace(tmp_path, path)
+            try:
+                os.remove(self._journal_path(symbol, interval))
+            except FileNotFoundError:
+                pass
+        except OSError as e:
+            logger.error(f"❌ Lỗi lưu cache klines {path}: {e}")
+
+    def _append(self, symbol, interval, rows):
+        path = self._journal_path(symbol, interval)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write("".join(json.dumps(row, separators=(',', ':')) + "\n" for row in rows))
+        except OSError as e:
+            logger.error(f"❌ Lỗi ghi journal klines {path}: {e}")
+
+    def _ring(self, symbol, interval, replace=False):
+        key = (symbol, interval)
+        ring = self._rings.get(key)
+        if ring is None or replace:
+            ring = self._rings[key] = ColumnarRing(KLINE_DTYPES, self.limit)
+            self._journaled[key] = 0
+            if not replace:
+                rows, self._journaled[key] = self._load(symbol, interval)
+                ring.extend_rows(rows)
+        return ring
+
+    def get(self, symbol, interval):
+        """Return the cached closed candles as a CandleView, loading them from disk on first use"""
+        with self._lock:
+            return self._ring(symbol, interval).view()
+
+    def merge(self, symbol, interval, new_rows, replace=False):
+        """Append candles newer than the cached ones, trim to limit and persist"""
+        key = (symbol, interval)
+        with self._lock:
+            ring = self._ring(symbol, interval, replace)
+            candles = ring.view()
+            rewrite = replace
+            if candles and new_rows and new_rows[0][0] > candles["close_time"][-1] + 1:
+                # Có khoảng trống giữa cache và dữ liệu mới -> bỏ cache cũ
+                ring.clear()
+                candles = ring.view()
+                rewrite = True
+            last_open = candles["open_time"][-1] if candles else None
+            fresh = [r for r in new_rows if last_open is None or r[0] > last_open]
+            if not fresh and not replace:
+                return candles
+            ring.extend_rows(fresh)
+            candles = ring.view()
+            # Journal dài quá `limit` dòng thì ghi lại snapshot (mỗi nến được ghi tối đa hai lần)
+            rewrite = rewrite or self._journaled[key] + len(fresh) > self.limit
+            self._journaled[key] = 0 if rewrite else self._journaled[key] + len(fresh)
+            io_lock = self._io_locks.setdefault(key, threading.Lock())
+            io_lock.acquire()
+        try:
+            if rewrite:
+                self._save(symbol, interval, candles.rows())
+            else:
+                # Dòng đúng như trong ring (float32) để journal và snapshot khớp nhau
+                self._append(symbol, interval, candles.tail(len(fresh)).rows())
+        finally:
+            io_lock.release()
+        return candles
+
+kline_cache = KlineCache(KLINES_CACHE_DIR, BASE_LIMIT)
+
+class HostRateLimiter:
+    """Token bucket theo host, dùng chung cho mọi thread fetch"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._buckets = {}  # host -> (tokens, last_refill, paused_until)
+        self._lock = threading.Lock()
+
+    def acquire(self, host):
+        """Block until one request to host fits in the budget"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, last, paused_until = self._buckets.get(host, (self.burst, now, 0.0))
+                tokens = min(self.burst, tokens + (now - last) * self.rate)
+                if now >= paused_until and tokens >= 1:
+                    self._buckets[host] = (tokens - 1, now, paused_until)
+                    return
+                self._buckets[host] = (tokens, now, paused_until)
+                wait = max(paused_until - now, (1 - tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, host, seconds):
+        """Stop every thread from hitting host for a while (exchange backoff)"""
+        with self._lock:
+            now = time.monotonic()
+            tokens, last, paused_until = self._buckets.get(host, (self.burst, now, 0.0))
+            self._buckets[host] = (tokens, last, max(paused_until, now + seconds))
+
+def create_http_session(pool_size):
+    """Session dùng chung để giữ kết nối keep-alive giữa các lần fetch"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+http_session = create_http_session(FETCH_WORKERS)
+rate_limiter = HostRateLimiter(RATE_LIMIT_PER_SECOND)
+
+def request_klines(symbol, params, max_retries=3):
+    """GET /api/v3/klines over the pooled session within the host rate budget; None after max_retries"""
+    for attempt in range(max_retries):
+        rate_limiter.acquire(BINANCE_HOST)
+        try:
+            response = http_session.get(f"{BINANCE_API_URL}/api/v3/klines", params=params, timeout=10)
+            metrics.inc("signals_binance_requests_total", status=response.status_code)
+            if response.status_code in (418, 429):
+                metrics.inc("signals_binance_retries_total", reason="rate_limit")
+                retry_after = int(response.headers.get("Retry-After", 2 ** attempt))
+                logger.warning(f"⚠️ Binance rate limit khi tải {symbol}, tạm dừng {retry_after}s")
+                rate_limiter.pause(BINANCE_HOST, retry_after)
+                continue
+            response.raise_for_status()
+            return response.json()
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(f"⚠️ Lỗi tải klines {symbol} (lần {attempt + 1}/{max_retries}): {e}")
+            metrics.inc("signals_binance_retries_total", reason="error")
+            time.sleep(2 ** attempt)
+    logger.error(f"❌ Không tải được klines {symbol} sau {max_retries} lần thử")
+    metrics.inc("signals_binance_failures_total")
+    return None
+
+def get_klines(symbol, max_retries=3, interval=INTERVAL):
+    """Fetch klines from Binance with enhanced error handling
+
+    Chỉ tải các nến mới hơn close_time cuối cùng trong cache rồi gộp vào,
+    nên mỗi lần scan thường chỉ tốn 1-2 nến. Lần đầu (hoặc khi hụt quá nhiều nến)
+    tải lại đủ kline_cache.limit nến, chia nhiều trang nếu vượt BINANCE_MAX_LIMIT.
+    Chỉ trả về nến đã đóng, dạng CandleView của kline_cache (None nếu chưa có nến nào).
+    """
+    cached = kline_cache.get(symbol, interval)
+    limit = kline_cache.limit
+    now_ms = int(time.time() * 1000)
+    interval_ms = interval_to_ms(interval)
+
+    if cached and (len(cached) >= limit or (symbol, interval) in kline_cache.backfilled):
+        last_close = int(cached["close_time"][-1])
+        if now_ms <= last_close + interval_ms:
+            # Nến kế tiếp chưa đóng, cache đã mới nhất
+            return cached
+        missing = (now_ms - last_close) // interval_ms + 1
+        if missing < min(limit, BINANCE_MAX_LIMIT):
+            params = {"symbol": symbol, "interval": interval, "startTime": last_close + 1, "limit": missing + 1}
+            raw_klines = request_klines(symbol, params, max_retries)
+            if raw_klines is None:
+                return cached
+            closed = [parse_kline(k) for k in raw_klines if int(k[6]) < now_ms]
+            return kline_cache.merge(symbol, interval, closed)
+
+    # Tải lại `limit` nến gần nhất
+    raw_klines = []
+    start_time = now_ms - limit * interval_ms if limit > BINANCE_MAX_LIMIT else None
+    while True:
+        params = {"symbol": symbol, "interval": interval, "limit": min(limit, BINANCE_MAX_LIMIT)}
+        if start_time is not None:
+            params["startTime"] = start_time
+        page = request_klines(symbol, params, max_retries)
+        if page is None:
+            return cached or None
+        raw_klines.extend(page)
+        if start_time is None or len(page) < BINANCE_MAX_LIMIT:
+            break
+        start_time = int(page[-1][0]) + interval_ms
+
+    closed = [parse_kline(k) for k in raw_klines if int(k[6]) < now_ms]
+    candles = kline_cache.merge(symbol, interval, closed, replace=True)
+    kline_cache.backfilled.add((symbol, interval))
+    return candles or None
+
+def timed_get_klines(symbol, interval=INTERVAL):
+    """get_klines + ghi thời gian fetch của từng symbol vào metrics"""
+    with metrics.timer("signals_fetch_seconds", symbol=symbol):
+        return get_klines(symbol, interval=interval)
+
+def fetch_all_klines(symbols, interval=INTERVAL):
+    """Fetch klines for many symbols concurrently over the pooled session"""
+    frames = {}
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="fetch") as executor:
+        futures = {executor.submit(timed_get_klines, symbol, interval=interval): symbol for symbol in symbols}
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                frames[symbol] = future.result()
+            except Exception as e:
+                logger.error(f"❌ Lỗi fetch {symbol}: {e}")
+                frames[symbol] = None
+    return {symbol: frames.get(symbol) for symbol in symbols}
+
+def add_indicators(df):
+    """Add technical indicators to dataframe"""
+    close, high, low, volume = df["close"], df["high"], df["low"], df["volume"]
+
+    for window in (8, 21, 50, 200):
+        df[f"ema{window}"] = EMAIndicator(close, window=window).ema_indicator()
+
+    macd = MACD(close)
+    df["macd"] = macd.macd()
+    df["macd_signal"] = macd.macd_signal()
+    df["macd_hist"] = macd.macd_diff()
+
+    df["rsi14"] = RSIIndicator(close, window=14).rsi()
+
+    bb = BollingerBands(close, window=20, window_dev=2)
+    df["bb_upper"] = bb.bollinger_hband()
+    df["bb_middle"] = bb.bollinger_mavg()
+    df["bb_lower"] = bb.bollinger_lband()
+    df["bb_width"] = (df["bb_upper"] - df["bb_lower"]) / df["bb_middle"]
+
+    df["atr"] = AverageTrueRange(high, low, close, window=14).average_true_range()
+
+    # Keltner Channel: EMA20 ± 1.5 ATR (dùng cho điều kiện squeeze)
+    kc_middle = EMAIndicator(close, window=20).ema_indicator()
+    df["kc_upper"] = kc_middle + 1.5 * df["atr"]
+    df["kc_lower"] = kc_middle - 1.5 * df["atr"]
+
+    # VWAP reset theo phiên ngày UTC
+    typical_price = (high + low + close) / 3
+    session_day = df["open_time"].dt.floor("D")
+    df["vwap"] = ((typical_price * volume).groupby(session_day).cumsum() /
+                  volume.groupby(session_day).cumsum())
+
+    df["volume_ma20"] = volume.rolling(20).mean()
+
+    # Thân nến và râu nến
+    df["body"] = (close - df["open"]).abs()
+    df["upper_wick"] = high - df[["open", "close"]].max(axis=1)
+    df["lower_wick"] = df[["open", "close"]].min(axis=1) - low
+
+    # Fair Value Gap: khoảng trống giữa nến i-2 và nến i
+    df["fvg_bull"] = low > high.shift(2)
+    df["fvg_bear"] = high < low.shift(2)
+
+    return df
+
+# -----------------------------------------------------------------------------
+# Streaming indicators: cập nhật O(1) mỗi nến, kết quả khớp add_indicators
+# -----------------------------------------------------------------------------
+
+INDICATOR_COLUMNS = [
+    "ema8", "ema21", "ema50", "ema200", "macd", "macd_signal", "macd_hist", "rsi14",
+    "bb_upper", "bb_middle", "bb_lower", "bb_width", "atr", "kc_upper", "kc_lower",
+    "vwap", "volume_ma20", "body", "upper_wick", "lower_wick", "fvg_bull", "fvg_bear"
+]
+# Indicator chỉ dùng để so với ngưỡng thì lưu float32; các cột ra giá (EMA, ATR, BB...) giữ float64
+FLOAT32_INDICATORS = {"rsi14", "bb_width", "volume_ma20"}
+INDICATOR_DTYPES = dict(KLINE_DTYPES, **{
+    column: np.bool_ if column.startswith("fvg_") else np.float32 if column in FLOAT32_INDICATORS else np.float64
+    for column in INDICATOR_COLUMNS
+})
+
+class _Ewm:
+    """Incremental pandas ewm(adjust=False).mean(), replicating its update arithmetic"""
+
+    def __init__(self, span=None, alpha=None, min_periods=0):
+        # pandas đổi span/alpha sang center of mass rồi mới tính lại alpha
+        com = (span - 1) / 2.0 if span is not None else (1 - alpha) / alpha
+        self.alpha = 1. / (1. + com)
+        self.min_periods = min_periods
+        self.value = np.nan
+        self.count = 0
+
+    def update(self, x):
+        if x == x:
+            if self.count == 0:
+                self.value = x
+            elif self.value != x:
+                old_wt = 1. - self.alpha
+                self.value = (old_wt * self.value + self.alpha * x) / (old_wt + self.alpha)
+            self.count += 1
+        return self.value if self.count >= self.min_periods and self.count else np.nan
+
+class _RollingWindow:
+    """Rolling mean / population std over a fixed window using running sums"""
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque(maxlen=window)
+        self._anchor = 0.0
+        self._sum = 0.0
+        self._sumsq = 0.0
+        self._updates = 0
+
+    def update(self, x):
+        if len(self.values) == self.window:
+            dropped = self.values[0] - self._anchor
+            self._sum -= dropped
+            self._sumsq -= dropped * dropped
+        self.values.append(x)
+        self._updates += 1
+        if self._updates % self.window == 0:
+            # Tính lại tổng quanh giá trị trung bình hiện tại để không tích lũy sai số
+            self._anchor = sum(self.values) / len(self.values)
+            deviations = [v - self._anchor for v in self.values]
+            self._sum = sum(deviations)
+            self._sumsq = sum(d * d for d in deviations)
+        else:
+            deviation = x - self._anchor
+            self._sum += deviation
+            self._sumsq += deviation * deviation
+
+    def mean(self):
+        if len(self.values) < self.window:
+            return np.nan
+        return self._anchor + self._sum / self.window
+
+    def std(self):
+        if len(self.values) < self.window:
+            return np.nan
+        mean_dev = self._sum / self.window
+        return math.sqrt(max(self._sumsq / self.window - mean_dev * mean_dev, 0.0))
+
+class IndicatorState:
+    """Trạng thái indicator của một symbol, cập nhật từng nến thay vì tính lại cả frame
+
+    Các dòng (nến + indicator) nằm trong một ColumnarRing `maxlen` dòng dùng lại qua các lần scan.
+    """
+
+    def __init__(self, maxlen=LIMIT):
+        self.emas = {window: _Ewm(span=window, min_periods=window) for window in (8, 21, 50, 200)}
+        self.ema20 = _Ewm(span=20, min_periods=20)
+        self.macd_fast = _Ewm(span=12, min_periods=12)
+        self.macd_slow = _Ewm(span=26, min_periods=26)
+        self.macd_signal = _Ewm(span=9, min_periods=9)
+        self.rsi_up = _Ewm(alpha=1 / 14, min_periods=14)
+        self.rsi_down = _Ewm(alpha=1 / 14, min_periods=14)
+        self.bb = _RollingWindow(20)
+        self.volume_ma = _RollingWindow(20)
+        self.atr = 0.0
+        self.true_ranges = []
+        self.vwap_day = None
+        self.vwap_pv = 0.0
+        self.vwap_volume = 0.0
+        self.recent = deque(maxlen=2)  # (high, low) của 2 nến trước
+        self.prev_close = np.nan
+        self.count = 0
+        self.last_open_time = None
+        self.rows = ColumnarRing(INDICATOR_DTYPES, maxlen)
+
+    def update(self, candle):
+        """Consume one closed candle (mapping with KLINE_COLUMNS, times in ms) and return its indicator row"""
+        open_, high, low, close = candle["open"], candle["high"], candle["low"], candle["close"]
+        volume = candle["volume"]
+        row = dict(candle)
+
+        for window, ema in self.emas.items():
+            row[f"ema{window}"] = ema.update(close)
+
+        macd = self.macd_fast.update(close) - self.macd_slow.update(close)
+        macd_signal = self.macd_signal.update(macd)
+        row["macd"] = macd
+        row["macd_signal"] = macd_signal
+        row["macd_hist"] = macd - macd_signal
+
+        diff = close - self.prev_close
+        avg_up = self.rsi_up.update(diff if diff > 0 else 0.0)
+        avg_down = self.rsi_down.update(-(diff if diff < 0 else 0.0))
+        if avg_down != avg_down:
+            row["rsi14"] = np.nan
+        elif avg_down == 0:
+            row["rsi14"] = 100.0
+        else:
+            row["rsi14"] = 100 - (100 / (1 + avg_up / avg_down))
+
+        self.bb.update(close)
+        bb_middle, bb_std = self.bb.mean(), self.bb.std()
+        row["bb_upper"] = bb_middle + 2 * bb_std
+        row["bb_middle"] = bb_middle
+        row["bb_lower"] = bb_middle - 2 * bb_std
+        row["bb_width"] = (row["bb_upper"] - row["bb_lower"]) / bb_middle
+
+        # ATR kiểu ta: 0 trước nến thứ 14, nến thứ 14 là trung bình TR, sau đó làm mượt Wilder
+        if self.count == 0:
+            true_range = high - low
+        else:
+            true_range = max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+        if self.count < 13:
+            self.true_ranges.append(true_range)
+        elif self.count == 13:
+            self.true_ranges.append(true_range)
+            self.atr = np.sum(np.array(self.true_ranges)) / 14
+            self.true_ranges = []
+        else:
+            self.atr = (self.atr * 13 + true_range) / 14.0
+        row["atr"] = self.atr
+
+        kc_middle = self.ema20.update(close)
+        row["kc_upper"] = kc_middle + 1.5 * self.atr
+        row["kc_lower"] = kc_middle - 1.5 * self.atr
+
+        session_day = candle["open_time"] // DAY_MS
+        if session_day != self.vwap_day:
+            self.vwap_day = session_day
+            self.vwap_pv = 0.0
+            self.vwap_volume = 0.0
+        self.vwap_pv += (high + low + close) / 3 * volume
+        self.vwap_volume += volume
+        row["vwap"] = self.vwap_pv / self.vwap_volume if self.vwap_volume else np.nan
+
+        self.volume_ma.update(volume)
+        row["volume_ma20"] = self.volume_ma.mean()
+
+        row["body"] = abs(close - open_)
+        row["upper_wick"] = high - max(open_, close)
+        row["lower_wick"] = min(open_, close) - low
+
+        if len(self.recent) == 2:
+            row["fvg_bull"] = low > self.recent[0][0]
+            row["fvg_bear"] = high < self.recent[0][1]
+        else:
+            row["fvg_bull"] = row["fvg_bear"] = False
+        self.recent.append((high, low))
+
+        self.prev_close = close
+        self.count += 1
+        self.last_open_time = candle["open_time"]
+        self.rows.append(row)
+        return row
+
+    def frame(self):
+        """CandleView zero-copy of the retained candles, same columns as add_indicators"""
+        return self.rows.view()
+
+indicator_states = {}
+
+def get_indicator_frame(symbol, candles, interval=INTERVAL):
+    """Feed only the candles the symbol's IndicatorState has not seen yet and return its frame"""
+    key = (symbol, interval)
+    state = indicator_states.get(key)
+    open_time = candles["open_time"]
+    first_new = 0
+    if state is not None and state.last_open_time is not None:
+        first_new = int(np.searchsorted(open_time, state.last_open_time, side="right"))
+        contiguous = first_new > 0 and (
+            first_new == len(candles) or open_time[first_new] - state.last_open_time == interval_to_ms(interval)
+        )
+        if not contiguous:
+            state = None
+    if state is None:
+        # Lần đầu hoặc bị hụt nến: warm-up lại từ toàn bộ frame
+        state = IndicatorState(maxlen=len(candles))
+        first_new = 0
+        indicator_states[key] = state
+
+    for index in range(first_new, len(candles)):
+        state.update(candles.row(index))
+    return state.frame()
+
+# =============================================================================
+# SIGNALS - tạo signal từ combo và kết quả theo giá
+# =============================================================================
+
+def build_signal(symbol, direction, entry, sl, tp, combo_name, interval=INTERVAL):
+    """Tạo bản ghi tín hiệu mới từ kết quả của một combo"""
+    risk = abs(entry - sl)
+    return {
+        "id": str(uuid.uuid4()),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "coin": symbol,
+        "direction": direction,
+        "entry": float(entry),
+        "sl": float(sl),
+        "tp": float(tp),
+        "rr": round(abs(tp - entry) / risk, 1) if risk else 0,
+        "combo_name": combo_name,
+        "interval": interval,
+        "timeframe": TIMEFRAME_STYLES.get(interval, "intraday"),
+        "status": "active",
+        "votes_win": 0,
+        "votes_lose": 0,
+        "voted_ips": []
+    }
+
+# Nến cuối cùng đã scan của mỗi (symbol, interval): interval lớn chỉ có nến mới vài lần mỗi ngày
+last_scanned = {}
+
+def scan_symbol(symbol, base_candles, rules=None):
+    """Evaluate every interval of one symbol whose last closed candle is new; returns new signals
+
+    `rules` (a rules.RuleSet) runs after the built-in COMBOS on the same shared Features.
+    """
+    new_signals = []
+    for interval in INTERVALS:
+        candles = resample_candles(base_candles, interval, BASE_INTERVAL).tail(LIMIT)
+        if len(candles) < MIN_CANDLES:
+            logger.warning(f"⚠️ Bỏ qua {symbol} {interval}: không đủ dữ liệu nến")
+            continue
+        last_candle = int(candles["open_time"][-1])
+        if last_scanned.get((symbol, interval)) == last_candle:
+            continue
+        try:
+            with metrics.timer("signals_indicators_seconds", symbol=symbol, interval=interval):
+                # Một Features cho cả 18 combo: feature dùng chung chỉ tính một lần
+                df = features(get_indicator_frame(symbol, candles, interval))
+            for combo in COMBOS:
+                # Label theo combo + interval (không theo symbol) để số series không nhân lên 18 lần
+                with metrics.timer("signals_combo_seconds", combo=combo.__name__, interval=interval):
+                    result = combo(df)
+                if result:
+                    new_signals.append(build_signal(symbol, *result, interval=interval))
+                    logger.info(f"📈 {symbol} {interval} {result[0]} - {result[4]}")
+            if rules:
+                # Một timer cho cả bộ rule: label theo rule sẽ nhân số series lên theo số variant
+                with metrics.timer("signals_rules_seconds", interval=interval):
+                    results = rules.signals(df, interval)
+                for result in results:
+                    new_signals.append(build_signal(symbol, *result, interval=interval))
+                    logger.info(f"📈 {symbol} {interval} {result[0]} - {result[4]} (rule)")
+            last_scanned[(symbol, interval)] = last_candle
+        except Exception as e:
+            logger.error(f"❌ Lỗi xử lý {symbol} {interval}: {e}")
+    return new_signals
+
+def _first_hit(mask):
+    """Index of the first True in mask, len(mask) if none"""
+    return int(mask.argmax()) if mask.any() else len(mask)
+
+def resolve_signal(signal, high, low, close_time, now):
+    """Kết quả theo giá của một signal active trên các nến đã đóng sau thời điểm phát signal
+
+    Nến đầu tiên chạm TP là win, chạm SL là loss; SL và TP cùng chạm trong một nến
+    thì tính loss (như backtest). Chưa chạm mà quá SIGNAL_EXPIRY_HOURS thì expired.
+    Returns the closed signal dict, or None while it stays active.
+    """
+    issued = datetime.fromisoformat(signal['timestamp'])
+    start = int(np.searchsorted(close_time, issued.timestamp() * 1000, side="right"))
+    high, low, close_time = high[start:], low[start:], close_time[start:]
+
+    if signal['direction'] == 'LONG':
+        hit_tp, hit_sl = _first_hit(high >= signal['tp']), _first_hit(low <= signal['sl'])
+    else:
+        hit_tp, hit_sl = _first_hit(low <= signal['tp']), _first_hit(high >= signal['sl'])
+
+    if hit_sl < len(close_time) and hit_sl <= hit_tp:
+        outcome, hit = "loss", hit_sl
+    elif hit_tp < len(close_time):
+        outcome, hit = "win", hit_tp
+    elif now - issued >= timedelta(hours=SIGNAL_EXPIRY_HOURS):
+        return dict(signal, status="closed", outcome="expired", closed_by="price", closed_at=now.isoformat())
+    else:
+        return None
+
+    closed_at = datetime.fromtimestamp(close_time[hit] / 1000, tz=timezone.utc)
+    return dict(signal, status="closed", outcome=outcome, closed_by="price", closed_at=closed_at.isoformat())
+
+# =============================================================================
+# COMBO ENGINE - đánh giá vector hóa trên toàn bộ chuỗi nến
+# =============================================================================
+
+# signal: +1 LONG, -1 SHORT, 0 không có tín hiệu; entry/sl/tp là NaN ở nến không có tín hiệu
+ComboSeries = namedtuple("ComboSeries", ["signal", "entry", "sl", "tp", "long_name", "short_name"])
+
+def _col(df, name):
+    # Cột float64 của CandleView/DataFrame được dùng trực tiếp (không copy), cột khác nâng lên float64
+    values = np.asarray(df[name])
+    return values if values.dtype == np.float64 else values.astype(float)
+
+def _mask(df, name):
+    return np.asarray(df[name], dtype=bool)
+
+def _shift(values, periods=1):
+    """Shift an array forward by `periods` bars, padding with NaN (like Series.shift)"""
+    result = np.full(len(values), np.nan)
+    if periods < len(values):
+        result[periods:] = values[:len(values) - periods]
+    return result
+
+def _shift_mask(mask, periods=1):
+    result = np.zeros(len(mask), dtype=bool)
+    if periods < len(mask):
+        result[periods:] = mask[:len(mask) - periods]
+    return result
+
+def _rolling(values, window, lag=0, how="min"):
+    """Rolling min/max over the `window` bars ending `lag` bars back, i.e. iloc[-(window + lag):-lag]"""
+    result = getattr(pd.Series(values).rolling(window, min_periods=1), how)().to_numpy()
+    return _shift(result, lag) if lag else result
+
+def _recent(mask, window):
+    """True where the mask fired in any of the last `window` bars, i.e. iloc[-window:].any()"""
+    return pd.Series(mask, dtype=float).rolling(window, min_periods=1).max().to_numpy() > 0
+
+def _expanding_max(values, window=LIMIT):
+    """Max over every bar so far, capped to the last `window` bars (the live scan frame)"""
+    if len(values) <= window:
+        return np.fmax.accumulate(values)
+    return pd.Series(values).rolling(window, min_periods=1).max().to_numpy()
+
+def _expanding_mean(values, window=LIMIT):
+    """Mean over every bar so far, capped to the last `window` bars (the live scan frame)"""
+    if len(values) <= window:
+        return np.cumsum(values) / np.arange(1, len(values) + 1)
+    return pd.Series(values).rolling(window, min_periods=1).mean().to_numpy()
+
+def _ratio(wick, body):
+    """wick / body, 0 where the candle has no body"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(body > 0, wick / body, 0.0)
+
+class Features:
+    """Cột và feature dẫn xuất dùng chung giữa các combo của một frame, mỗi thứ tính một lần
+
+    Bọc DataFrame (backtest) hoặc CandleView (scan live); f[name] trả về cột như _col/_mask.
+    Mảng trong cache là read-only vì cả 18 combo (và các rule của rules.py) cùng đọc chung.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self._cache = {}
+
+    def cached(self, key, compute):
+        """compute() một lần cho mỗi key trong frame này"""
+        value = self._cache.get(key)
+        if value is None:
+            value = compute()
+            value.setflags(write=False)
+            self._cache[key] = value
+        return value
+
+    def __getitem__(self, name):
+        def load():
+            values = np.asarray(self.df[name])
+            return values if values.dtype in (np.float64, np.bool_) else values.astype(float)
+        return self.cached(name, load)
+
+    def __len__(self):
+        return len(self.df)
+
+    def shift(self, name, periods=1):
+        return self.cached(("shift", name, periods), lambda: _shift(self[name], periods))
+
+    def green(self):
+        """Nến tăng (close > open)"""
+        return self.cached("green", lambda: self["close"] > self["open"])
+
+    def rolling(self, name, window, lag=0, how="min"):
+        """Min/max trượt của cột (đáy Order Block, vùng hỗ trợ/kháng cự), như _rolling"""
+        return self.cached(("rolling", name, window, lag, how), lambda: _rolling(self[name], window, lag, how))
+
+    def recent(self, name, window):
+        """Mask `name` bật trong `window` nến gần nhất, như _recent"""
+        return self.cached(("recent", name, window), lambda: _recent(self[name], window))
+
+    def fvg_high(self):
+        """Running max của high các nến FVG tăng"""
+        return self.cached("fvg_high", lambda: _expanding_max(np.where(self["fvg_bull"], self["high"], np.nan)))
+
+    def wick_ratio(self, wick="lower_wick"):
+        """Râu nến / thân nến (0 khi không có thân)"""
+        return self.cached(("wick_ratio", wick), lambda: _ratio(self[wick], self["body"]))
+
+    def expanding_mean(self, name):
+        return self.cached(("expanding_mean", name), lambda: _expanding_mean(self[name]))
+
+    def expanding_max(self, name):
+        return self.cached(("expanding_max", name), lambda: _expanding_max(self[name]))
+
+def features(df):
+    """Features của frame; frame đã là Features thì dùng lại (để các combo chia sẻ cache)"""
+    return df if isinstance(df, Features) else Features(df)
+
+def _combo_series(long_name, long, entry, sl, tp, short=None, sl_short=None, tp_short=None, short_name=None):
+    signal = long.astype(np.int8)
+    if short is not None:
+        short = short & ~long
+        signal = signal - short.astype(np.int8)
+        sl = np.where(short, sl_short, sl)
+        tp = np.where(short, tp_short, tp)
+    active = signal != 0
+    return ComboSeries(
+        signal,
+        np.where(active, entry, np.nan),
+        np.where(active, sl, np.nan),
+        np.where(active, tp, np.nan),
+        long_name,
+        short_name or long_name
+    )
+
+def signal_at(series, index=-1):
+    """Read one bar of a ComboSeries as the (direction, entry, sl, tp, name) tuple used by scan()"""
+    direction = series.signal[index]
+    if direction == 0:
+        return None
+    name = series.long_name if direction > 0 else series.short_name
+    return ("LONG" if direction > 0 else "SHORT", float(series.entry[index]),
+            float(series.sl[index]), float(series.tp[index]), name)
+
+def _last_signal(series_fn, df, label):
+    try:
+        return signal_at(series_fn(df))
+    except Exception as e:
+        logger.error(f"{label} error: {e}")
+    return None
+
+# Ngưỡng và hệ số ATR của SL/TP là tham số keyword của từng combo, mặc định là giá trị chạy
+# live; evaluate_combos/scan dùng mặc định, sweep.py quét các tham số này theo lưới
+def combo1_fvg_squeeze_pro_series(df, squeeze=SQUEEZE_THRESHOLD, vol_spike=1.3, rsi_max=68, sl_atr=1.5, tp_atr=3.0):
+    """FVG Squeeze Pro"""
+    df = features(df)
+    close, atr, ema200 = _col(df, "close"), _col(df, "atr"), _col(df, "ema200")
+    bb_upper, bb_lower = _col(df, "bb_upper"), _col(df, "bb_lower")
+    prev_close = df.shift("close")
+
+    in_squeeze = ((_col(df, "bb_width") < squeeze) &
+                  (bb_upper < _col(df, "kc_upper")) &
+                  (bb_lower > _col(df, "kc_lower")))
+    breakout_up = (close > bb_upper) & (prev_close <= df.shift("bb_upper"))
+    breakout_down = (close < bb_lower) & (prev_close >= df.shift("bb_lower"))
+    volume_ok = _col(df, "volume") > _col(df, "volume_ma20") * vol_spike
+
+    long = in_squeeze & breakout_up & volume_ok & (close > ema200) & (_col(df, "rsi14") < rsi_max)
+    short = in_squeeze & breakout_down & volume_ok & (close < ema200)
+    return _combo_series("FVG Squeeze Pro", long, close, close - sl_atr * atr, close + tp_atr * atr,
+                         short=short, sl_short=close + sl_atr * atr, tp_short=close - tp_atr * atr)
+
+def combo2_macd_ob_retest_series(df, retest_atr=0.5, vol_mult=1.1, sl_atr=1.0, tp_atr=2.5):
+    """MACD Order Block Retest"""
+    df = features(df)
+    close, low, atr = _col(df, "close"), _col(df, "low"), _col(df, "atr")
+    macd, macd_signal = _col(df, "macd"), _col(df, "macd_signal")
+    volume = _col(df, "volume")
+
+    macd_cross_up = (macd > macd_signal) & (df.shift("macd") <= df.shift("macd_signal"))
+
+    # 3 nến tăng liên tiếp -> OB là đáy của 3 nến trước đó
+    green = df.green()
+    three_green = green & _shift_mask(green, 1) & _shift_mask(green, 2)
+    ob_zone = np.where(three_green, df.rolling("low", 3, lag=2, how="min"), np.nan)
+
+    retest = low <= ob_zone + atr * retest_atr
+    vol_confirm = volume > df.expanding_mean("volume") * vol_mult
+
+    long = macd_cross_up & (close > _col(df, "ema200")) & retest & vol_confirm
+    return _combo_series("MACD Order Block Retest", long, close, ob_zone - sl_atr * atr, close + tp_atr * atr)
+
+def combo3_stop_hunt_squeeze_series(df, wick_ratio=2, squeeze=SQUEEZE_THRESHOLD, sl_atr=1.0, tp_atr=2.8):
+    """Stop Hunt Squeeze"""
+    df = features(df)
+    close, low, atr = _col(df, "close"), _col(df, "low"), _col(df, "atr")
+
+    # Nến tăng xét râu dưới, nến giảm xét râu trên
+    wicks = np.where(df.green(), df.wick_ratio("lower_wick"), df.wick_ratio("upper_wick"))
+    stop_hunt = wicks > wick_ratio
+
+    in_squeeze = _col(df, "bb_width") < squeeze
+    breakout_up = close > _col(df, "bb_upper")
+
+    long = in_squeeze & stop_hunt & breakout_up
+    return _combo_series("Stop Hunt Squeeze", long, close, low - sl_atr * atr, close + tp_atr * atr)
+
+def combo4_fvg_ema_pullback_series(df, fvg_window=5, sl_atr=0.8, tp_atr=2.0):
+    """FVG EMA Pullback"""
+    df = features(df)
+    close, low, atr = _col(df, "close"), _col(df, "low"), _col(df, "atr")
+    ema8, ema21 = _col(df, "ema8"), _col(df, "ema21")
+
+    fvg_pullback = df.recent("fvg_bull", fvg_window) & (low <= df.fvg_high())
+    cross_up = (ema8 > ema21) & (df.shift("ema8") <= df.shift("ema21"))
+
+    long = fvg_pullback & cross_up
+    return _combo_series("FVG EMA Pullback", long, close, low - atr * sl_atr, close + tp_atr * atr)
+
+def combo5_fvg_macd_divergence_series(df, fvg_window=8, rsi_max=30, sl_atr=1.0, tp_atr=2.5):
+    """FVG + MACD Divergence"""
+    df = features(df)
+    close, low, atr = _col(df, "close"), _col(df, "low"), _col(df, "atr")
+    hist = _col(df, "macd_hist")
+
+    divergence = (hist > df.shift("macd_hist", 2)) & (low < df.shift("low", 2))
+    fvg = df.recent("fvg_bull", fvg_window)
+    rsi_ok = _col(df, "rsi14") < rsi_max
+
+    long = divergence & fvg & rsi_ok
+    return _combo_series("FVG + MACD Divergence", long, close,
+                         df.rolling("low", 5, how="min") - sl_atr * atr, close + tp_atr * atr)
+
+def combo6_ob_liquidity_grab_series(df, wick_ratio=2.5, sl_atr=1.0, tp_atr=1.8):
+    """Order Block + Liquidity Grab"""
+    df = features(df)
+    close, low, atr = _col(df, "close"), _col(df, "low"), _col(df, "atr")
+
+    ob = df.rolling("low", 3, lag=3, how="min")
+    liquidity_grab = df.wick_ratio() > wick_ratio
+    retest_ob = close > ob
+    macd_pos = _col(df, "macd_hist") > 0
+
+    long = liquidity_grab & retest_ob & macd_pos
+    return _combo_series("Order Block + Liquidity Grab", long, close, low - sl_atr * atr, close + tp_atr * atr)
+
+def combo7_stop_hunt_fvg_retest_series(df, wick_ratio=2, fvg_window=3, sl_atr=0.5, tp_atr=1.5):
+    """Stop Hunt + FVG Retest"""
+    df = features(df)
+    close, low, atr = _col(df, "close"), _col(df, "low"), _col(df, "atr")
+
+    stop_hunt = df.wick_ratio() > wick_ratio
+    fvg_after = df.recent("fvg_bull", fvg_window)
+    retest = low <= _shift(df.expanding_max("high"))
+
+    long = stop_hunt & fvg_after & retest
+    return _combo_series("Stop Hunt + FVG Retest", long, close, low - sl_atr * atr, close + tp_atr * atr)
+
+def combo8_fvg_macd_hist_spike_series(df, fvg_window=5, sl_atr=1.0, tp_atr=2.5):
+    """FVG + MACD Hist Spike"""
+    df = features(df)
+    close, low, atr = _col(df, "close"), _col(df, "low"), _col(df, "atr")
+    hist = _col(df, "macd_hist")
+
+    # Histogram tăng 3 nến liên tiếp (cần ít nhất 5 nến)
+    rising = hist > df.shift("macd_hist")
+    hist_spike = (rising & _shift_mask(rising, 1) & _shift_mask(rising, 2) &
+                  (np.arange(len(hist)) >= 4))
+    fvg = df.recent("fvg_bull", fvg_window)
+    price_above_vwap = close > _col(df, "vwap")
+
+    long = hist_spike & fvg & price_above_vwap
+    return _combo_series("FVG + MACD Hist Spike", long, close, low - sl_atr * atr, close + tp_atr * atr)
+
+def combo9_ob_fvg_confluence_series(df, fvg_window=10, confluence_atr=0.5, vol_mult=1.5, sl_atr=1.0, tp_atr=2.0):
+    """OB + FVG Confluence"""
+    df = features(df)
+    close, open_ = _col(df, "close"), _col(df, "open")
+    atr, volume = _col(df, "atr"), _col(df, "volume")
+
+    ob = df.rolling("low", 5, lag=5, how="min")
+    fvg_zone = np.where(df.recent("fvg_bull", fvg_window), df.fvg_high(), 0.0)
+
+    confluence = (fvg_zone > 0) & (np.abs(ob - fvg_zone) < atr * confluence_atr)
+    engulfing = df.green() & (open_ < df.shift("close"))
+    volume_delta = volume > df.expanding_mean("volume") * vol_mult
+
+    long = confluence & engulfing & volume_delta
+    return _combo_series("OB + FVG Confluence", long, close,
+                         np.minimum(ob, fvg_zone) - sl_atr * atr, close + tp_atr * atr)
+
+def combo10_smc_ultimate_series(df, squeeze=SQUEEZE_THRESHOLD, fvg_window=5, wick_ratio=2, sl_atr=1.0, tp_atr=3.5):
+    """SMC Ultimate"""
+    df = features(df)
+    close, low, atr = _col(df, "close"), _col(df, "low"), _col(df, "atr")
+    hist = _col(df, "macd_hist")
+
+    in_squeeze = _col(df, "bb_width") < squeeze
+    fvg = df.recent("fvg_bull", fvg_window)
+    macd_up = (hist > 0) & (hist > df.shift("macd_hist"))
+    liquidity = df.wick_ratio() > wick_ratio
+    ob_retest = low <= df.rolling("low", 3, lag=2, how="min")
+
+    long = in_squeeze & fvg & macd_up & liquidity & ob_retest
+    return _combo_series("SMC Ultimate", long, close, low - sl_atr * atr, close + tp_atr * atr)
+
+def combo11_fvg_ob_liquidity_break_series(df, fvg_window=3, vol_spike=1.5, sl_atr=0.5, tp_atr=2.0):
+    """FVG + Order Block + Liquidity Break"""
+    df = features(df)
+    close, atr = _col(df, "close"), _col(df, "atr")
+
+    # FVG bullish (nến hiện tại hoặc 2 nến trước)
+    fvg = df.recent("fvg_bull", fvg_window)
+
+    # Order Block
+    ob = df.rolling("low", 5, how="min")
+
+    # Liquidity Break
+    liquidity_break = close > df.rolling("high", 5, how="max")
+
+    # Volume
+    volume_ok = _col(df, "volume") > _col(df, "volume_ma20") * vol_spike
+
+    long = fvg & liquidity_break & volume_ok
+    return _combo_series("FVG OB Liquidity Break", long, close, ob - sl_atr * atr, close + tp_atr * atr)
+
+def combo12_liquidity_grab_fvg_retest_series(df, wick_ratio=2.5, fvg_window=5, sl_atr=0.8, tp_atr=1.8):
+    """Liquidity Grab + FVG Retest"""
+    df = features(df)
+    close, low, atr = _col(df, "close"), _col(df, "low"), _col(df, "atr")
+    hist = _col(df, "macd_hist")
+
+    # Liquidity Grab
+    liquidity_grab = df.wick_ratio() > wick_ratio
+
+    # FVG Retest
+    fvg_retest = df.recent("fvg_bull", fvg_window) & (low <= df.fvg_high())
+
+    # MACD
+    macd_ok = (hist > 0) & (hist > df.shift("macd_hist"))
+
+    long = liquidity_grab & fvg_retest & macd_ok
+    return _combo_series("Liquidity Grab FVG Retest", long, close, low - sl_atr * atr, close + tp_atr * atr)
+
+def combo13_fvg_macd_momentum_scalp_series(df, fvg_window=2, max_atr_pct=0.02, sl_atr=0.5, tp_atr=1.2):
+    """COMBO 13: FVG + MACD Momentum Scalp"""
+    df = features(df)
+    close, low, atr = _col(df, "close"), _col(df, "low"), _col(df, "atr")
+    hist = _col(df, "macd_hist")
+
+    # FVG recent
+    fvg = df.recent("fvg_bull", fvg_window) & df.green()
+
+    # MACD momentum
+    macd_mom = (_col(df, "macd") > _col(df, "macd_signal")) & (np.abs(hist) > np.abs(df.shift("macd_hist")))
+
+    # VWAP
+    above_vwap = close > _col(df, "vwap")
+
+    # Low volatility
+    low_vol = (atr / close) < max_atr_pct
+
+    long = fvg & macd_mom & above_vwap & low_vol
+    return _combo_series("FVG MACD Momentum Scalp", long, close, low - sl_atr * atr, close + tp_atr * atr)
+
+def combo14_ob_liquidity_macd_div_series(df, wick_ratio=2.0, sl_atr=0.3, tp_atr=2.5):
+    """COMBO 14: Order Block + Liquidity + MACD Divergence"""
+    df = features(df)
+    close, low, atr = _col(df, "close"), _col(df, "low"), _col(df, "atr")
+    hist = _col(df, "macd_hist")
+
+    # Order Block
+    ob = df.rolling("low", 5, lag=2, how="min")
+
+    # Liquidity sweep
+    liquidity = df.wick_ratio() > wick_ratio
+
+    # MACD Divergence
+    divergence = (hist > df.shift("macd_hist", 2)) & (low < df.shift("low", 2))
+
+    # Entry confirmation
+    entry_ok = close > ob
+
+    long = liquidity & divergence & entry_ok
+    return _combo_series("OB Liquidity MACD Div", long, close, ob - sl_atr * atr, close + tp_atr * atr)
+
+def combo15_vwap_ema_volume_scalp_series(df, vol_spike=1.8, rsi_max=60, sl_atr=0.5, tp_atr=1.0):
+    """COMBO 15: VWAP + EMA Cross + Volume Spike Scalp"""
+    df = features(df)
+    close, low, atr = _col(df, "close"), _col(df, "low"), _col(df, "atr")
+    ema8, ema21 = _col(df, "ema8"), _col(df, "ema21")
+
+    # EMA Cross (8 & 21)
+    ema_cross = (ema8 > ema21) & (df.shift("ema8") <= df.shift("ema21"))
+
+    # Price above VWAP
+    above_vwap = close > _col(df, "vwap")
+
+    # Volume spike (180% of 20-period average)
+    volume_ok = _col(df, "volume") > _col(df, "volume_ma20") * vol_spike
+
+    # RSI not overbought (below 60)
+    rsi_ok = _col(df, "rsi14") < rsi_max
+
+    long = ema_cross & above_vwap & volume_ok & rsi_ok
+    return _combo_series("VWAP EMA Volume Scalp", long, close, low - sl_atr * atr, close + tp_atr * atr)
+
+def combo16_rsi_extreme_bounce_series(df, rsi_low=25, rsi_high=75, wick_body=2, vol_spike=1.2,
+                                      sl_atr=0.8, tp_atr=1.5):
+    """COMBO 16: RSI Extreme + Price Action Bounce"""
+    df = features(df)
+    close, open_, high, low = _col(df, "close"), _col(df, "open"), _col(df, "high"), _col(df, "low")
+    atr, rsi = _col(df, "atr"), _col(df, "rsi14")
+    body, upper_wick, lower_wick = _col(df, "body"), _col(df, "upper_wick"), _col(df, "lower_wick")
+    prev_open, prev_close = df.shift("open"), df.shift("close")
+
+    # Price Action Bounce patterns
+    bullish_engulfing = ((close > open_) & (prev_close < prev_open) &
+                         (close > prev_open) & (open_ < prev_close))
+    bearish_engulfing = ((close < open_) & (prev_close > prev_open) &
+                         (close < prev_open) & (open_ > prev_close))
+    hammer = ((body > 0) & (lower_wick > wick_body * body) &
+              (upper_wick < 0.2 * body) & (close > open_))
+    shooting_star = ((body > 0) & (upper_wick > wick_body * body) &
+                     (lower_wick < 0.2 * body) & (close < open_))
+
+    # Volume confirmation
+    vol_ok = _col(df, "volume") > _col(df, "volume_ma20") * vol_spike
+
+    # LONG: RSI oversold + bullish pattern, SHORT: RSI overbought + bearish pattern
+    long = (rsi < rsi_low) & (bullish_engulfing | hammer) & vol_ok
+    short = (rsi > rsi_high) & (bearish_engulfing | shooting_star) & vol_ok
+    return _combo_series("RSI Extreme Bounce LONG", long, close, low - sl_atr * atr, close + tp_atr * atr,
+                         short=short, sl_short=high + sl_atr * atr, tp_short=close - tp_atr * atr,
+                         short_name="RSI Extreme Bounce SHORT")
+
+def combo17_ema_stack_volume_confirmation_series(df, vol_spike=1.5, rsi_max=65, sl_atr=0.3, tp_atr=1.8):
+    """COMBO 17: EMA Stack + Volume Confirmation"""
+    df = features(df)
+    close, low, atr = _col(df, "close"), _col(df, "low"), _col(df, "atr")
+    ema8, ema21, ema50, ema200 = (_col(df, "ema8"), _col(df, "ema21"),
+                                  _col(df, "ema50"), _col(df, "ema200"))
+
+    # EMA Stack đẹp (xếp chồng tăng)
+    ema_stack = (ema8 > ema21) & (ema21 > ema50) & (ema50 > ema200)
+
+    # Giá trên tất cả EMA
+    price_above_all = (close > ema8) & (close > ema21) & (close > ema50) & (close > ema200)
+
+    # Volume tăng ít nhất 50% so với trung bình
+    volume_confirm = _col(df, "volume") > _col(df, "volume_ma20") * vol_spike
+
+    # RSI không quá mua (dưới 65)
+    rsi_ok = _col(df, "rsi14") < rsi_max
+
+    # Pullback về EMA8 hoặc EMA21 rồi bật lên
+    pullback_bounce = ((low <= ema8) & (close > ema8)) | ((low <= ema21) & (close > ema21))
+
+    long = ema_stack & price_above_all & volume_confirm & rsi_ok & pullback_bounce
+    # SL dưới EMA21 hoặc low của nến
+    return _combo_series("EMA Stack Volume Confirmation", long, close,
+                         np.minimum(ema21, low) - sl_atr * atr, close + tp_atr * atr)
+
+def combo18_support_resistance_break_retest_series(df, vol_spike=1.8, retest_atr=0.2, sl_atr=0.5, tp_atr=2.0):
+    """COMBO 18: Support/Resistance Break + Retest"""
+    df = features(df)
+    close, high, low, atr = _col(df, "close"), _col(df, "high"), _col(df, "low"), _col(df, "atr")
+    macd, macd_signal, hist = _col(df, "macd"), _col(df, "macd_signal"), _col(df, "macd_hist")
+    prev_close = df.shift("close")
+
+    # Support/Resistance của 19 nến trước đó
+    resistance_level = df.rolling("high", 19, lag=1, how="max")
+    support_level = df.rolling("low", 19, lag=1, how="min")
+
+    resistance_break = (close > resistance_level) & (prev_close <= resistance_level)
+    support_break = (close < support_level) & (prev_close >= support_level)
+
+    # Volume xác nhận breakout (tăng ít nhất 80%)
+    volume_spike = _col(df, "volume") > _col(df, "volume_ma20") * vol_spike
+
+    # Retest: resistance thành support / support thành resistance
+    retest_long = (low <= resistance_level + atr * retest_atr) & (close > resistance_level)
+    retest_short = (high >= support_level - atr * retest_atr) & (close < support_level)
+
+    # MACD xác nhận momentum
+    macd_confirm_long = (macd > macd_signal) & (hist > 0)
+    macd_confirm_short = (macd < macd_signal) & (hist < 0)
+
+    long = volume_spike & resistance_break & retest_long & macd_confirm_long
+    short = volume_spike & support_break & ~resistance_break & retest_short & macd_confirm_short
+    return _combo_series("Resistance Break Retest", long, close,
+                         resistance_level - sl_atr * atr, close + tp_atr * atr,
+                         short=short, sl_short=support_level + sl_atr * atr, tp_short=close - tp_atr * atr,
+                         short_name="Support Break Retest")
+
+COMBO_SERIES = [
+    combo1_fvg_squeeze_pro_series, combo2_macd_ob_retest_series, combo3_stop_hunt_squeeze_series,
+    combo4_fvg_ema_pullback_series, combo5_fvg_macd_divergence_series, combo6_ob_liquidity_grab_series,
+    combo7_stop_hunt_fvg_retest_series, combo8_fvg_macd_hist_spike_series,
+    combo9_ob_fvg_confluence_series, combo10_smc_ultimate_series,
+    combo11_fvg_ob_liquidity_break_series, combo12_liquidity_grab_fvg_retest_series,
+    combo13_fvg_macd_momentum_scalp_series, combo14_ob_liquidity_macd_div_series,
+    combo15_vwap_ema_volume_scalp_series, combo16_rsi_extreme_bounce_series,
+    combo17_ema_stack_volume_confirmation_series, combo18_support_resistance_break_retest_series
+]
+
+def evaluate_combos(df):
+    """Run every combo over the whole frame in one pass; returns one ComboSeries per combo"""
+    df = features(df)
+    return [series_fn(df) for series_fn in COMBO_SERIES]
+
+# Trading combos - chỉ đọc nến cuối từ kết quả vector hóa (dùng cho scan live)
+def combo1_fvg_squeeze_pro(df):
+    """FVG Squeeze Pro"""
+    return _last_signal(combo1_fvg_squeeze_pro_series, df, "Combo1")
+
+def combo2_macd_ob_retest(df):
+    """MACD Order Block Retest"""
+    return _last_signal(combo2_macd_ob_retest_series, df, "Combo2")
+
+def combo3_stop_hunt_squeeze(df):
+    """Stop Hunt Squeeze"""
+    return _last_signal(combo3_stop_hunt_squeeze_series, df, "Combo3")
+
+def combo4_fvg_ema_pullback(df):
+    """FVG EMA Pullback"""
+    return _last_signal(combo4_fvg_ema_pullback_series, df, "Combo4")
+
+def combo5_fvg_macd_divergence(df):
+    """FVG + MACD Divergence"""
+    return _last_signal(combo5_fvg_macd_divergence_series, df, "Combo5")
+
+def combo6_ob_liquidity_grab(df):
+    """Order Block + Liquidity Grab"""
+    return _last_signal(combo6_ob_liquidity_grab_series, df, "Combo6")
+
+def combo7_stop_hunt_fvg_retest(df):
+    """Stop Hunt + FVG Retest"""
+    return _last_signal(combo7_stop_hunt_fvg_retest_series, df, "Combo7")
+
+def combo8_fvg_macd_hist_spike(df):
+    """FVG + MACD Hist Spike"""
+    return _last_signal(combo8_fvg_macd_hist_spike_series, df, "Combo8")
+
+def combo9_ob_fvg_confluence(df):
+    """OB + FVG Confluence"""
+    return _last_signal(combo9_ob_fvg_confluence_series, df, "Combo9")
+
+def combo10_smc_ultimate(df):
+    """SMC Ultimate"""
+    return _last_signal(combo10_smc_ultimate_series, df, "Combo10")
+
+def combo11_fvg_ob_liquidity_break(df):
+    """FVG + Order Block + Liquidity Break"""
+    return _last_signal(combo11_fvg_ob_liquidity_break_series, df, "Combo11")
+
+def combo12_liquidity_grab_fvg_retest(df):
+    """Liquidity Grab + FVG Retest"""
+    return _last_signal(combo12_liquidity_grab_fvg_retest_series, df, "Combo12")
+
+def combo13_fvg_macd_momentum_scalp(df):
+    """COMBO 13: FVG + MACD Momentum Scalp"""
+    return _last_signal(combo13_fvg_macd_momentum_scalp_series, df, "Combo13")
+
+def combo14_ob_liquidity_macd_div(df):
+    """COMBO 14: Order Block + Liquidity + MACD Divergence"""
+    return _last_signal(combo14_ob_liquidity_macd_div_series, df, "Combo14")
+
+def combo15_vwap_ema_volume_scalp(df):
+    """COMBO 15: VWAP + EMA Cross + Volume Spike Scalp"""
+    return _last_signal(combo15_vwap_ema_volume_scalp_series, df, "Combo15")
+
+def combo16_rsi_extreme_bounce(df):
+    """COMBO 16: RSI Extreme + Price Action Bounce"""
+    return _last_signal(combo16_rsi_extreme_bounce_series, df, "Combo16")
+
+def combo17_ema_stack_volume_confirmation(df):
+    """COMBO 17: EMA Stack + Volume Confirmation"""
+    return _last_signal(combo17_ema_stack_volume_confirmation_series, df, "Combo17")
+
+def combo18_support_resistance_break_retest(df):
+    """COMBO 18: Support/Resistance Break + Retest"""
+    return _last_signal(combo18_support_resistance_break_retest_series, df, "Combo18")
+
+COMBOS = [
+    combo1_fvg_squeeze_pro, combo2_macd_ob_retest, combo3_stop_hunt_squeeze,
+    combo4_fvg_ema_pullback, combo5_fvg_macd_divergence, combo6_ob_liquidity_grab,
+    combo7_stop_hunt_fvg_retest, combo8_fvg_macd_hist_spike, combo9_ob_fvg_confluence,
+    combo10_smc_ultimate, combo11_fvg_ob_liquidity_break, combo12_liquidity_grab_fvg_retest,
+    combo13_fvg_macd_momentum_scalp, combo14_ob_liquidity_macd_div, combo15_vwap_ema_volume_scalp,
+    combo16_rsi_extreme_bounce, combo17_ema_stack_volume_confirmation,
+    combo18_support_resistance_break_retest
+]
@@ -0,0 +1,120 @@
+# trading-signals-website/events.py
+
+import json
+import time
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+def format_sse(event, data, event_id=None):
+    """Một message Server-Sent Events (data là JSON một dòng)"""
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+class EventBroker:
+    """Fan-out sự kiện tới các client SSE
+
+    Mỗi sự kiện được serialize một lần rồi đẩy vào hàng đợi của từng client, nên chi phí
+    server tỉ lệ với số sự kiện chứ không phải số viewer x tần suất poll. Client đọc chậm
+    (hàng đợi đầy) bị ngắt, trình duyệt sẽ tự kết nối lại.
+    """
+
+    def __init__(self, max_clients=200, queue_size=100):
+        self.max_clients = max_clients
+        self.queue_size = queue_size
+        self.event_id = 0
+        self._clients = set()
+        self._lock = threading.Lock()
+
+    @property
+    def client_count(self):
+        return len(self._clients)
+
+    def subscribe(self):
+        """Hàng đợi mới cho một client; None khi đã đủ max_clients"""
+        with self._lock:
+            if len(self._clients) >= self.max_clients:
+                return None
+            client = queue.Queue(maxsize=self.queue_size)
+            client.dropped = False
+            self._clients.add(client)
+            return client
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self._clients.discard(client)
+
+    def publish(self, event, data):
+        """Gửi một sự kiện tới mọi client đang kết nối"""
+        with self._lock:
+            if not self._clients:
+                return
+            self.event_id += 1
+            message = format_sse(event, data, self.event_id)
+            clients = list(self._clients)
+        for client in clients:
+            try:
+                client.put_nowait(message)
+            except queue.Full:
+                client.dropped = True
+                self.unsubscribe(client)
+                logger.warning("⚠️ Ngắt client SSE đọc quá chậm")
+
+    def stream(self, client, initial=(), heartbeat=15):
+        """Generator SSE cho một client: các sự kiện `initial`, rồi sự kiện mới hoặc heartbeat"""
+        try:
+            yield "retry: 5000\n\n"
+            for event, data in initial:
+                yield format_sse(event, data)
+            while not client.dropped:
+                try:
+                    yield client.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(client)
+
+class StoreRelay:
+    """Đẩy thay đổi trong store tới client SSE của process này, bất kể process nào đã ghi
+
+    Với nhiều worker gunicorn, signal/vote được ghi ở một process nhưng dashboard có thể
+    đang nối tới process khác. Mỗi `interval` giây relay đọc version của store (rẻ); chỉ
+    khi có client và version đổi mới gọi changes() -> [(event, data), ...] rồi publish.
+    """
+
+    def __init__(self, broker, version, changes, interval=1.0):
+        self.broker = broker
+        self.version = version
+        self.changes = changes
+        self.interval = interval
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Chạy thread relay (gọi nhiều lần cũng chỉ chạy một thread)"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="store-relay", daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        last_version = self.version()
+        while True:
+            time.sleep(self.interval)
+            if not self.broker.client_count:
+                continue
+            try:
+                version = self.version()
+                if version == last_version:
+                    continue
+                last_version = version
+                for event, data in self.changes():
+                    self.broker.publish(event, data)
+            except Exception as e:
+                logger.error(f"❌ Lỗi relay thay đổi tới SSE: {e}")
@@ -0,0 +1,308 @@
+# trading-signals-website/kline_stream.py
+
+"""Nhận nến qua websocket kline stream của Binance thay cho REST polling
+
+KlineStream subscribe combined stream `<symbol>@kline_<interval>` cho mọi coin và gọi
+callback ngay khi một nến đóng; tự reconnect với backoff và gọi on_connect sau mỗi lần
+kết nối để backfill qua REST phần bị lỡ. KlineReplayServer là websocket server tối giản
+phát lại nến đã lưu theo đúng định dạng của Binance, dùng để test mà không cần sàn:
+
+    python kline_stream.py --cache-dir klines_cache --port 8765 --delay 0.2
+    INGESTION_MODE=stream BINANCE_STREAM_URL=ws://127.0.0.1:8765 python scanner.py
+"""
+
+import os
+import re
+import json
+import time
+import base64
+import socket
+import struct
+import hashlib
+import logging
+import argparse
+import threading
+
+try:
+    import websocket
+except ImportError:  # websocket-client chỉ cần khi INGESTION_MODE=stream
+    websocket = None
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# CLIENT
+# =============================================================================
+
+def stream_url(base_url, symbols, interval):
+    """Combined stream URL cho kline của nhiều symbol"""
+    streams = "/".join(f"{symbol.lower()}@kline_{interval}" for symbol in symbols)
+    return f"{base_url}/stream?streams={streams}"
+
+def parse_stream_kline(message):
+    """Kline message -> (symbol, row theo KLINE_COLUMNS, nến đã đóng?); None nếu không phải kline"""
+    data = json.loads(message)
+    data = data.get("data", data)
+    if data.get("e") != "kline":
+        return None
+    k = data["k"]
+    row = [
+        int(k["t"]), float(k["o"]), float(k["h"]), float(k["l"]), float(k["c"]),
+        float(k["v"]), int(k["T"]), float(k["q"]), int(k["n"])
+    ]
+    return data["s"], row, bool(k["x"])
+
+class KlineStream:
+    """Websocket kline stream, gọi on_candle(symbol, row) cho mỗi nến vừa đóng
+
+    Mất kết nối thì kết nối lại với backoff lũy thừa (tối đa max_backoff giây);
+    on_connect() được gọi sau mỗi lần (re)connect để backfill nến bị lỡ.
+    """
+
+    def __init__(self, url, on_candle, on_connect=None, max_backoff=60):
+        self.url = url
+        self.on_candle = on_candle
+        self.on_connect = on_connect
+        self.max_backoff = max_backoff
+        self.connections = 0
+        self._backoff = 1
+        self._ws = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _on_open(self, ws):
+        self.connections += 1
+        self._backoff = 1
+        logger.info(f"🔌 Đã kết nối kline stream (lần {self.connections})")
+        if self.on_connect:
+            try:
+                self.on_connect()
+            except Exception as e:
+                logger.error(f"❌ Lỗi backfill sau khi kết nối stream: {e}")
+
+    def _on_message(self, ws, message):
+        try:
+            parsed = parse_stream_kline(message)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"⚠️ Message stream không hợp lệ: {e}")
+            return
+        if not parsed or not parsed[2]:
+            return
+        symbol, row, _ = parsed
+        try:
+            self.on_candle(symbol, row)
+        except Exception as e:
+            logger.error(f"❌ Lỗi xử lý nến {symbol} từ stream: {e}")
+
+    def _on_error(self, ws, error):
+        logger.warning(f"⚠️ Lỗi kline stream: {error}")
+
+    def run_forever(self):
+        """Chạy stream (blocking) cho tới khi stop()"""
+        if websocket is None:
+            raise RuntimeError("INGESTION_MODE=stream cần websocket-client (pip install websocket-client)")
+        while not self._stop.is_set():
+            self._ws = websocket.WebSocketApp(
+                self.url, on_open=self._on_open, on_message=self._on_message, on_error=self._on_error
+            )
+            self._ws.run_forever(ping_interval=60, ping_timeout=20)
+            if self._stop.is_set():
+                break
+            logger.warning(f"⚠️ Mất kết nối kline stream, kết nối lại sau {self._backoff}s")
+            self._stop.wait(self._backoff)
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run_forever, name="kline-stream", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._ws is not None:
+            self._ws.close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+# =============================================================================
+# REPLAY SERVER (test)
+# =============================================================================
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+def replay_messages(rows_by_symbol, interval):
+    """Nến đã lưu -> message combined stream của nến đã đóng, xen kẽ các symbol theo open_time"""
+    events = sorted((row[0], symbol, row) for symbol, rows in rows_by_symbol.items() for row in rows)
+    return [json.dumps({
+        "stream": f"{symbol.lower()}@kline_{interval}",
+        "data": {
+            "e": "kline", "E": row[6] + 1, "s": symbol,
+            "k": {
+                "t": row[0], "T": row[6], "s": symbol, "i": interval,
+                "o": str(row[1]), "h": str(row[2]), "l": str(row[3]), "c": str(row[4]),
+                "v": str(row[5]), "q": str(row[7]), "n": row[8], "x": True
+            }
+        }
+    }) for _, symbol, row in events]
+
+def _frame(payload, opcode=0x1):
+    """Server -> client websocket frame (không mask)"""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+def _recv_exact(conn, size):
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("client closed")
+        data += chunk
+    return data
+
+class KlineReplayServer:
+    """Websocket server tối giản phát lại `messages` cho client (chỉ dùng để test)
+
+    Các kết nối dùng chung một con trỏ nên reconnect sẽ phát tiếp từ chỗ dừng.
+    drop_after=N đóng kết nối sau mỗi N message và bỏ mất message kế tiếp,
+    giả lập mất kết nối làm hụt một nến.
+    """
+
+    def __init__(self, messages, host="127.0.0.1", port=0, delay=0.0, drop_after=None):
+        self.messages = list(messages)
+        self.delay = delay
+        self.drop_after = drop_after
+        self.position = 0
+        self.connections = 0
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self.host, self.port = self._sock.getsockname()
+        self._stop = threading.Event()
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}"
+
+    def start(self):
+        self._sock.listen(4)
+        threading.Thread(target=self._accept_loop, name="replay-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._sock.close()
+
+    def _accept_loop(self):
+        while not self._stop.is_set():
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _handshake(self, conn):
+        request = b""
+        while b"\r\n\r\n" not in request:
+            chunk = conn.recv(4096)
+            if not chunk:
+                return False
+            request += chunk
+        match = re.search(rb"Sec-WebSocket-Key:\s*(\S+)", request, re.IGNORECASE)
+        if not match:
+            return False
+        accept = base64.b64encode(hashlib.sha1(match.group(1) + WEBSOCKET_GUID.encode()).digest())
+        conn.sendall(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                     b"Connection: Upgrade\r\nSec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        return True
+
+    def _read_client(self, conn, send_lock, closed):
+        """Đọc frame từ client: trả lời ping, dừng khi client close"""
+        try:
+            while not closed.is_set():
+                first, second = _recv_exact(conn, 2)
+                length = second & 0x7F
+                if length == 126:
+                    length = struct.unpack("!H", _recv_exact(conn, 2))[0]
+                elif length == 127:
+                    length = struct.unpack("!Q", _recv_exact(conn, 8))[0]
+                mask = _recv_exact(conn, 4) if second & 0x80 else b"\0\0\0\0"
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(_recv_exact(conn, length)))
+                opcode = first & 0x0F
+                if opcode == 0x9:
+                    with send_lock:
+                        conn.sendall(_frame(payload, opcode=0xA))
+                elif opcode == 0x8:
+                    break
+        except OSError:
+            pass
+        closed.set()
+
+    def _serve(self, conn):
+        self.connections += 1
+        send_lock, closed = threading.Lock(), threading.Event()
+        try:
+            if not self._handshake(conn):
+                return
+            threading.Thread(target=self._read_client, args=(conn, send_lock, closed), daemon=True).start()
+            sent = 0
+            while not closed.is_set() and not self._stop.is_set() and self.position < len(self.messages):
+                if self.drop_after and sent >= self.drop_after:
+                    self.position += 1  # message bị mất trong lúc rớt kết nối
+                    break
+                message = self.messages[self.position]
+                self.position += 1
+                with send_lock:
+                    conn.sendall(_frame(message.encode()))
+                sent += 1
+                if self.delay:
+                    time.sleep(self.delay)
+            if not closed.is_set() and self.position >= len(self.messages):
+                closed.wait()  # hết dữ liệu: giữ kết nối như sàn thật
+        except OSError:
+            pass
+        finally:
+            closed.set()
+            try:
+                # shutdown trước close: gửi FIN ngay cả khi thread đọc đang chặn ở recv()
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Phát lại nến trong cache qua websocket (định dạng Binance)")
+    parser.add_argument("--cache-dir", default="klines_cache")
+    parser.add_argument("--interval", default=os.getenv("INTERVAL", "15m"))
+    parser.add_argument("--symbols", nargs="+", default=None, help="mặc định: mọi symbol trong cache")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.2, help="giây giữa hai message")
+    parser.add_argument("--drop-after", type=int, default=None, help="rớt kết nối sau mỗi N message")
+    args = parser.parse_args()
+
+    # Import muộn: engine kéo theo pandas/ta, chỉ cần khi chạy server phát lại
+    from engine import BASE_LIMIT, KlineCache
+
+    suffix = f"_{args.interval}.json"
+    symbols = args.symbols or sorted(f[:-len(suffix)] for f in os.listdir(args.cache_dir) if f.endswith(suffix))
+    # Snapshot + journal của cache, như scanner đọc
+    cache = KlineCache(args.cache_dir, BASE_LIMIT)
+    rows_by_symbol = {symbol: cache.get(symbol, args.interval).rows() for symbol in symbols}
+
+    server = KlineReplayServer(replay_messages(rows_by_symbol, args.interval), args.host, args.port,
+                               args.delay, args.drop_after).start()
+    print(f"▶️ Phát lại {len(server.messages)} nến của {len(symbols)} symbol tại {server.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
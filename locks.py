@@ -0,0 +1,86 @@
+# trading-signals-website/locks.py
+
+"""Khóa dùng chung giữa các process (nhiều worker gunicorn trên cùng một máy)
+
+InterProcessLock bảo vệ các lần đọc-sửa-ghi file JSON; LeaderLock chọn đúng một
+process chạy scheduler. Cả hai dùng flock nên chỉ có tác dụng giữa các process
+thấy cùng một filesystem.
+"""
+
+import os
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: không có flock, chỉ khóa được trong một process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+class InterProcessLock:
+    """RLock trong process + flock độc quyền trên file `path` giữa các process
+
+    File lock được mở lại mỗi lần acquire (không giữ fd qua fork()), nên các worker
+    fork từ cùng một master không vô tình dùng chung một khóa.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except BaseException:
+                self._lock.release()
+                raise
+            self._fd = fd
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
+
+class LeaderLock:
+    """Khóa không chặn, giữ tới khi process thoát: process nào giữ được là leader
+
+    Process leader chết thì kernel nhả khóa và process khác gọi try_acquire() sẽ lên thay.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    @property
+    def is_leader(self):
+        return self._fd is not None
+
+    def try_acquire(self):
+        """True nếu process này là (hoặc vừa trở thành) leader"""
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            logger.warning("⚠️ Không có fcntl: coi process này là leader duy nhất")
+            self._fd = -1
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
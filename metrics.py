@@ -0,0 +1,180 @@
+# trading-signals-website/metrics.py
+
+"""Metrics trong bộ nhớ cho pipeline scan, xuất theo định dạng text của Prometheus
+
+Scanner ghi số đo (thời gian fetch/indicators/combo/persist, retry HTTP, độ trễ
+scheduler) vào `metrics`, dump ra METRICS_FILE sau mỗi job; web app đọc file đó và
+phục vụ ở /metrics. Mỗi histogram vừa có bucket cộng dồn (chuẩn Prometheus) vừa có
+cửa sổ ROLLING_WINDOW mẫu gần nhất để xem p50/p95/p99 hiện tại.
+"""
+
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Bucket (giây) cho mọi histogram thời gian
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Số mẫu gần nhất giữ lại cho quantile "recent"
+ROLLING_WINDOW = 500
+RECENT_QUANTILES = (0.5, 0.95, 0.99)
+
+class Histogram:
+    """Bucket cộng dồn + cửa sổ trượt các mẫu gần nhất"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=ROLLING_WINDOW):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def quantiles(self):
+        """Quantile của cửa sổ trượt, {} khi chưa có mẫu"""
+        values = sorted(self.recent)
+        if not values:
+            return {}
+        return {q: values[min(int(q * len(values)), len(values) - 1)] for q in RECENT_QUANTILES}
+
+    def snapshot(self):
+        return {
+            "buckets": list(self.buckets), "counts": list(self.counts), "sum": self.sum, "count": self.count,
+            "recent": [[q, v] for q, v in self.quantiles().items()], "recent_count": len(self.recent)
+        }
+
+class MetricsRegistry:
+    """Counter, gauge và histogram có label; thread-safe (fetch chạy trong thread pool)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._pending = None  # list các lần ghi chờ gửi về process chính (xem start_recording)
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def _record(self, method, name, value, labels):
+        if self._pending is not None:
+            self._pending.append((method, name, value, labels))
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            self._record("inc", name, amount, labels)
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+            self._record("set", name, value, labels)
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._record("observe", name, value, labels)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Đo thời gian của khối lệnh vào histogram `name` (kể cả khi có exception)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def start_recording(self):
+        """Giữ lại mọi lần ghi để drain() gửi về process chính (dùng trong process worker của scan)"""
+        with self._lock:
+            self._pending = []
+
+    def drain(self):
+        """Các lần ghi kể từ lần drain trước, dạng (method, name, value, labels)"""
+        with self._lock:
+            pending = self._pending or []
+            if self._pending is not None:
+                self._pending = []
+            return pending
+
+    def replay(self, records):
+        """Áp các lần ghi do drain() của process khác trả về vào registry này"""
+        for method, name, value, labels in records:
+            getattr(self, method)(name, value, **labels)
+
+    def snapshot(self):
+        """Toàn bộ metrics dạng JSON được (để dump ra file cho web app)"""
+        with self._lock:
+            return {
+                "generated_at": time.time(),
+                "counters": [[name, dict(labels), value] for (name, labels), value in self._counters.items()],
+                "gauges": [[name, dict(labels), value] for (name, labels), value in self._gauges.items()],
+                "histograms": [[name, dict(labels), h.snapshot()] for (name, labels), h in self._histograms.items()],
+            }
+
+# Registry của process hiện tại
+metrics = MetricsRegistry()
+
+# =============================================================================
+# PROMETHEUS TEXT FORMAT
+# =============================================================================
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render_prometheus(snapshot):
+    """Snapshot của MetricsRegistry -> text exposition format của Prometheus"""
+    lines = []
+    typed = set()
+
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for name, labels, value in sorted(snapshot.get("counters", []), key=lambda m: m[0]):
+        declare(name, "counter")
+        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+    for name, labels, value in sorted(snapshot.get("gauges", []), key=lambda m: m[0]):
+        declare(name, "gauge")
+        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+    for name, labels, h in sorted(snapshot.get("histograms", []), key=lambda m: m[0]):
+        declare(name, "histogram")
+        for bound, count in zip(h["buckets"], h["counts"]):
+            lines.append(f"{name}_bucket{_labels(labels, le=_number(float(bound)))} {count}")
+        lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {h['count']}")
+        lines.append(f"{name}_sum{_labels(labels)} {_number(float(h['sum']))}")
+        lines.append(f"{name}_count{_labels(labels)} {h['count']}")
+    # Cửa sổ trượt: tách thành summary riêng vì Prometheus không cho trùng tên với histogram
+    for name, labels, h in sorted(snapshot.get("histograms", []), key=lambda m: m[0]):
+        if not h.get("recent"):
+            continue
+        declare(f"{name}_recent", "summary")
+        for quantile, value in h["recent"]:
+            lines.append(f"{name}_recent{_labels(labels, quantile=_number(float(quantile)))} {_number(float(value))}")
+        lines.append(f"{name}_recent_count{_labels(labels)} {h['recent_count']}")
+    return "\n".join(lines) + "\n"
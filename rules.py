@@ -0,0 +1,437 @@
+# trading-signals-website/rules.py
+
+"""Combo khai báo trong RULES_FILE (JSON, hoặc YAML nếu có PyYAML), biên dịch thành biểu thức NumPy
+
+    {
+      "params": {"vol_spike": 1.8},
+      "rules": [
+        {
+          "name": "Volume Breakout",
+          "direction": "LONG",
+          "when": ["close > bb_upper", "volume > volume_ma20 * vol_spike", "rsi14 < 70"],
+          "entry": "close",
+          "sl": "rolling_min(low, 5) - 0.5 * atr",
+          "tp": "close + rr * atr",
+          "params": {"rr": 2.0},
+          "variants": [{"name": "Volume Breakout 2.5x", "params": {"vol_spike": 2.5}}]
+        }
+      ]
+    }
+
+Biểu thức là cú pháp Python nhưng chỉ được parse bằng ast (không eval): tên cột nến/indicator,
+param, số, + - * /, so sánh, and/or/not và các hàm trong FUNCTIONS. Param được thay vào lúc
+biên dịch; mọi biểu thức con giống nhau (giữa các điều kiện, các rule, các variant) là một
+node duy nhất, tính một lần mỗi frame trong cache Features dùng chung với 18 combo. Vì vậy
+thêm một variant chỉ tốn phần biểu thức thật sự khác đi.
+
+Scanner (cả worker của scan_pool) và backtest đọc lại file khi mtime đổi, không cần restart
+hay deploy; file lỗi thì giữ bộ rule đang chạy và log lỗi. Signal của rule mang combo_name là
+tên rule, nên web app hiển thị, thống kê và lấy success_rate (backtest) như combo viết tay.
+"""
+
+import os
+import ast
+import json
+import logging
+import threading
+
+import numpy as np
+
+from config import RULES_FILE
+from engine import (
+    KLINE_DTYPES, INDICATOR_DTYPES, ComboSeries, features,
+    _shift, _shift_mask, _rolling, _recent, _expanding_max, _expanding_mean, _ratio
+)
+from metrics import metrics
+
+try:
+    import yaml
+except ImportError:  # PyYAML chỉ cần khi RULES_FILE là .yaml/.yml
+    yaml = None
+
+logger = logging.getLogger(__name__)
+
+DIRECTIONS = ("LONG", "SHORT")
+# Cột dùng được trong biểu thức và kiểu của chúng (fvg_* là điều kiện, còn lại là số)
+COLUMNS = {name: "bool" if dtype is np.bool_ else "number" for name, dtype in dict(KLINE_DTYPES, **INDICATOR_DTYPES).items()}
+CONSTANTS = {"nan": np.nan}
+
+# =============================================================================
+# FUNCTIONS
+# =============================================================================
+
+def _divide(a, b):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.divide(a, b)
+
+def _shift_any(values, periods):
+    return _shift_mask(values, periods) if values.dtype == np.bool_ else _shift(values, periods)
+
+def _where(mask, a, b):
+    return np.where(mask, a, b)
+
+# tên -> (hàm, kiểu các đối số biểu thức, các đối số nguyên (tên, mặc định) phía sau, kiểu kết quả)
+# Kiểu "any" giữ nguyên kiểu của đối số đầu (shift được cả giá lẫn điều kiện)
+FUNCTIONS = {
+    "abs": (np.abs, ("number",), (), "number"),
+    "min": (np.minimum, ("number", "number"), (), "number"),
+    "max": (np.maximum, ("number", "number"), (), "number"),
+    "ratio": (_ratio, ("number", "number"), (), "number"),
+    "where": (_where, ("bool", "number", "number"), (), "number"),
+    "shift": (_shift_any, ("any",), (("periods", 1),), "any"),
+    "recent": (_recent, ("bool",), (("window", None),), "bool"),
+    "rolling_min": (lambda values, window, lag: _rolling(values, window, lag, "min"),
+                    ("number",), (("window", None), ("lag", 0)), "number"),
+    "rolling_max": (lambda values, window, lag: _rolling(values, window, lag, "max"),
+                    ("number",), (("window", None), ("lag", 0)), "number"),
+    "expanding_mean": (_expanding_mean, ("number",), (), "number"),
+    "expanding_max": (_expanding_max, ("number",), (), "number"),
+}
+
+_BINOPS = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: _divide}
+_COMPARES = {
+    ast.Lt: np.less, ast.LtE: np.less_equal, ast.Gt: np.greater, ast.GtE: np.greater_equal,
+    ast.Eq: np.equal, ast.NotEq: np.not_equal
+}
+
+# =============================================================================
+# COMPILER
+# =============================================================================
+
+class Node:
+    """Một biểu thức con đã biên dịch; node giống nhau trong một RuleSet là cùng một object"""
+
+    __slots__ = ("id", "fn", "args", "kind")
+
+    def __init__(self, id, fn, args, kind):
+        self.id = id
+        self.fn = fn      # None: cột `args[0]` của frame
+        self.args = args  # Node hoặc hằng số
+        self.kind = kind
+
+    def evaluate(self, frame):
+        if self.fn is None:
+            return frame[self.args[0]]
+        # Key là chính node: mỗi node tính một lần mỗi frame, dù bao nhiêu rule dùng tới
+        return frame.cached(self, lambda: self.fn(*[_value(arg, frame) for arg in self.args]))
+
+def _value(value, frame):
+    return value.evaluate(frame) if isinstance(value, Node) else value
+
+def _kind(value):
+    if isinstance(value, Node):
+        return value.kind
+    return "bool" if isinstance(value, bool) else "number"
+
+class _Compiler:
+    """Biên dịch biểu thức thành Node, gộp các node có cùng phép toán và đối số (hash-consing)"""
+
+    def __init__(self):
+        self.nodes = {}
+
+    def node(self, name, fn, args, kind, params=()):
+        if fn is not None and not any(isinstance(arg, Node) for arg in args):
+            # Toàn hằng số (vd. chỉ có param): tính luôn lúc biên dịch
+            value = fn(*args, *params)
+            return value.item() if isinstance(value, np.generic) else value
+        key = (name, params) + tuple(arg.id if isinstance(arg, Node) else (type(arg).__name__, arg) for arg in args)
+        node = self.nodes.get(key)
+        if node is None:
+            call = (lambda *values: fn(*values, *params)) if params else fn
+            node = self.nodes[key] = Node(len(self.nodes), call, tuple(args), kind)
+        return node
+
+    def compile(self, source, params, kind):
+        """Biểu thức (chuỗi hoặc số) -> Node/hằng số có kiểu `kind`"""
+        if isinstance(source, bool) or not isinstance(source, (str, int, float)):
+            raise ValueError(f"biểu thức phải là chuỗi hoặc số: {source!r}")
+        try:
+            tree = ast.parse(str(source).strip(), mode="eval")
+        except SyntaxError as e:
+            raise ValueError(f"sai cú pháp '{source}': {e.msg}")
+        value = self.visit(tree.body, params)
+        if _kind(value) != kind:
+            raise ValueError(f"'{source}' phải là {'điều kiện' if kind == 'bool' else 'số'}")
+        return value
+
+    def expect(self, value, kind, what):
+        if kind != "any" and _kind(value) != kind:
+            raise ValueError(f"{what} cần {'điều kiện' if kind == 'bool' else 'số'}")
+        return value
+
+    def visit(self, node, params):
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, bool):
+                return node.value
+            if isinstance(node.value, (int, float)):
+                return float(node.value)
+            raise ValueError(f"không hỗ trợ hằng {node.value!r}")
+
+        if isinstance(node, ast.Name):
+            if node.id in params:
+                return params[node.id]
+            if node.id in CONSTANTS:
+                return CONSTANTS[node.id]
+            if node.id in COLUMNS:
+                return self.node(("col", node.id), None, (node.id,), COLUMNS[node.id])
+            raise ValueError(f"không có cột hay param '{node.id}'")
+
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINOPS:
+            left = self.expect(self.visit(node.left, params), "number", "phép toán")
+            right = self.expect(self.visit(node.right, params), "number", "phép toán")
+            return self.node(type(node.op).__name__, _BINOPS[type(node.op)], (left, right), "number")
+
+        if isinstance(node, ast.UnaryOp):
+            operand = self.visit(node.operand, params)
+            if isinstance(node.op, ast.Not):
+                return self.node("not", np.logical_not, (self.expect(operand, "bool", "not"),), "bool")
+            if isinstance(node.op, ast.USub):
+                return self.node("neg", np.negative, (self.expect(operand, "number", "dấu -"),), "number")
+            if isinstance(node.op, ast.UAdd):
+                return self.expect(operand, "number", "dấu +")
+
+        if isinstance(node, ast.BoolOp):
+            name, fn = ("and", np.logical_and) if isinstance(node.op, ast.And) else ("or", np.logical_or)
+            values = [self.expect(self.visit(v, params), "bool", name) for v in node.values]
+            result = values[0]
+            for value in values[1:]:
+                result = self.node(name, fn, (result, value), "bool")
+            return result
+
+        if isinstance(node, ast.Compare):
+            # a < b < c -> (a < b) and (b < c)
+            left = self.expect(self.visit(node.left, params), "number", "so sánh")
+            result = None
+            for op, comparator in zip(node.ops, node.comparators):
+                if type(op) not in _COMPARES:
+                    raise ValueError(f"không hỗ trợ phép so sánh {type(op).__name__}")
+                right = self.expect(self.visit(comparator, params), "number", "so sánh")
+                term = self.node(type(op).__name__, _COMPARES[type(op)], (left, right), "bool")
+                result = term if result is None else self.node("and", np.logical_and, (result, term), "bool")
+                left = right
+            return result
+
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS:
+            return self.call(node, params)
+
+        raise ValueError(f"không hỗ trợ '{ast.unparse(node)}'")
+
+    def call(self, node, params):
+        name = node.func.id
+        fn, arg_kinds, int_args, kind = FUNCTIONS[name]
+        if len(node.args) < len(arg_kinds) or len(node.args) > len(arg_kinds) + len(int_args):
+            raise ValueError(f"{name}() cần {len(arg_kinds)} biểu thức và tối đa {len(int_args)} số nguyên")
+        args = [self.expect(self.visit(arg, params), arg_kind, f"{name}()")
+                for arg, arg_kind in zip(node.args, arg_kinds)]
+        if kind == "any":
+            kind = _kind(args[0])
+
+        # Cửa sổ/độ trễ là số nguyên cố định lúc biên dịch (số hoặc param), là một phần của node
+        given = dict(zip([n for n, _ in int_args], node.args[len(arg_kinds):]))
+        for keyword in node.keywords:
+            if keyword.arg not in dict(int_args) or keyword.arg in given:
+                raise ValueError(f"{name}() không nhận đối số '{keyword.arg}'")
+            given[keyword.arg] = keyword.value
+        ints = []
+        for arg_name, default in int_args:
+            value = self.visit(given[arg_name], params) if arg_name in given else default
+            if value is None:
+                raise ValueError(f"{name}() thiếu đối số '{arg_name}'")
+            if isinstance(value, Node) or isinstance(value, bool) or value != int(value) or value < 0:
+                raise ValueError(f"{name}(): '{arg_name}' phải là số nguyên không âm")
+            ints.append(int(value))
+        if not any(isinstance(arg, Node) for arg in args):
+            raise ValueError(f"{name}() cần ít nhất một cột")
+        return self.node(name, fn, args, kind, tuple(ints))
+
+# =============================================================================
+# RULES
+# =============================================================================
+
+class Rule:
+    """Một rule (hoặc variant) đã biên dịch"""
+
+    def __init__(self, name, direction, when, entry, sl, tp, intervals=None, description="", source=None):
+        self.name = name
+        self.direction = direction
+        self.when = when
+        self.entry = entry
+        self.sl = sl
+        self.tp = tp
+        self.intervals = intervals
+        self.description = description
+        self.source = source or {}
+
+    def series(self, frame):
+        """ComboSeries của rule trên toàn bộ frame"""
+        mask = np.broadcast_to(np.asarray(_value(self.when, frame), dtype=bool), (len(frame),))
+        signal = mask.astype(np.int8) if self.direction == "LONG" else -mask.astype(np.int8)
+        return ComboSeries(
+            signal,
+            np.where(mask, _value(self.entry, frame), np.nan),
+            np.where(mask, _value(self.sl, frame), np.nan),
+            np.where(mask, _value(self.tp, frame), np.nan),
+            self.name, self.name
+        )
+
+    def last(self, frame):
+        """(direction, entry, sl, tp, name) ở nến cuối, None nếu không có tín hiệu"""
+        mask = _value(self.when, frame)
+        if not (mask[-1] if isinstance(mask, np.ndarray) else mask):
+            return None
+        entry, sl, tp = (_value(value, frame) for value in (self.entry, self.sl, self.tp))
+        return (self.direction, *(float(v[-1] if isinstance(v, np.ndarray) else v) for v in (entry, sl, tp)), self.name)
+
+class RuleSet:
+    """Các rule biên dịch cùng nhau: biểu thức con chung giữa mọi rule là một node"""
+
+    def __init__(self, rules=(), nodes=0):
+        self.rules = list(rules)
+        self.nodes = nodes
+
+    def __len__(self):
+        return len(self.rules)
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def _run(self, method, df, interval):
+        # Rule lỗi khi chạy (vd. cột thiếu trong frame) chỉ bị bỏ qua, các rule khác vẫn chạy
+        frame = features(df)
+        results = []
+        for rule in self.rules:
+            if interval is not None and rule.intervals and interval not in rule.intervals:
+                continue
+            try:
+                results.append(getattr(rule, method)(frame))
+            except Exception as e:
+                logger.error(f"❌ Rule {rule.name} lỗi: {e}")
+        return results
+
+    def evaluate(self, df, interval=None):
+        """ComboSeries của mọi rule áp dụng cho `interval` (backtest)"""
+        return self._run("series", df, interval)
+
+    def signals(self, df, interval=None):
+        """(direction, entry, sl, tp, name) ở nến cuối của các rule có tín hiệu (scan live, như COMBOS)"""
+        return [result for result in self._run("last", df, interval) if result]
+
+def _rule_variants(spec, defaults):
+    """Rule gốc và các variant của nó: variant kế thừa mọi trường, ghi đè name/params/..."""
+    params = dict(defaults, **spec.get("params", {}))
+    yield dict(spec, params=params)
+    for i, variant in enumerate(spec.get("variants", [])):
+        if not isinstance(variant, dict):
+            raise ValueError(f"variant #{i + 1} của rule '{spec['name']}' phải là object")
+        rule = dict(spec, **variant)
+        rule["params"] = dict(params, **variant.get("params", {}))
+        rule["name"] = variant.get("name") or "{} ({})".format(
+            spec["name"], ", ".join(f"{k}={v}" for k, v in variant.get("params", {}).items()) or i + 1)
+        yield rule
+
+def compile_rules(config):
+    """{"params": {...}, "rules": [...]} -> RuleSet; ValueError nêu rule và trường bị sai"""
+    if not isinstance(config, dict) or not isinstance(config.get("rules", []), list):
+        raise ValueError("file rule phải là object có danh sách 'rules'")
+    compiler = _Compiler()
+    rules, names = [], set()
+    defaults = config.get("params", {})
+    for index, spec in enumerate(config.get("rules", [])):
+        if not isinstance(spec, dict) or not spec.get("name"):
+            raise ValueError(f"rule #{index + 1} thiếu 'name'")
+        if not spec.get("enabled", True):
+            continue
+        for rule in _rule_variants(spec, defaults):
+            name = rule["name"]
+            if name in names:
+                raise ValueError(f"trùng tên rule '{name}'")
+            names.add(name)
+            try:
+                params = {}
+                for key, value in rule["params"].items():
+                    if isinstance(value, bool) or not isinstance(value, (int, float)):
+                        raise ValueError(f"param '{key}' phải là số")
+                    params[key] = float(value)
+                direction = str(rule.get("direction", "LONG")).upper()
+                if direction not in DIRECTIONS:
+                    raise ValueError(f"direction phải là {' hoặc '.join(DIRECTIONS)}")
+                for field in ("when", "sl", "tp"):
+                    if field not in rule:
+                        raise ValueError(f"thiếu '{field}'")
+                conditions = rule["when"] if isinstance(rule["when"], list) else [rule["when"]]
+                terms = [compiler.compile(condition, params, "bool") for condition in conditions]
+                if not terms:
+                    raise ValueError("'when' rỗng")
+                # Điều kiện đã có từ rule trước (id nhỏ) đứng đầu chuỗi and: các variant chỉ khác
+                # param thì chung luôn phần đầu, chỉ phần cuối là node riêng
+                terms.sort(key=lambda term: term.id if isinstance(term, Node) else -1)
+                when = terms[0]
+                for term in terms[1:]:
+                    when = compiler.node("and", np.logical_and, (when, term), "bool")
+                rules.append(Rule(
+                    name, direction, when,
+                    compiler.compile(rule.get("entry", "close"), params, "number"),
+                    compiler.compile(rule["sl"], params, "number"),
+                    compiler.compile(rule["tp"], params, "number"),
+                    intervals=rule.get("intervals"), description=rule.get("description", ""),
+                    source={field: rule[field] for field in ("when", "entry", "sl", "tp", "params") if field in rule}
+                ))
+            except ValueError as e:
+                raise ValueError(f"rule '{name}': {e}")
+    return RuleSet(rules, len(compiler.nodes))
+
+def load_rules_file(path):
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise ValueError(f"{path} là YAML nhưng chưa cài PyYAML (pip install pyyaml)")
+            try:
+                return yaml.safe_load(f) or {}
+            except yaml.YAMLError as e:
+                raise ValueError(str(e))
+        return json.load(f)
+
+# =============================================================================
+# HOT RELOAD
+# =============================================================================
+
+class RuleBook:
+    """RuleSet của một file rule, biên dịch lại khi mtime đổi; file lỗi thì giữ bộ đang chạy"""
+
+    def __init__(self, path):
+        self.path = path
+        self.rules = RuleSet()
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        """RuleSet hiện tại (một os.stat mỗi lần gọi, chỉ biên dịch lại khi file đổi)"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    self._reload(mtime)
+        return self.rules
+
+    def _reload(self, mtime):
+        if mtime is None:
+            if self.rules:
+                logger.info(f"🗑️ {self.path} đã bị xóa, bỏ {len(self.rules)} rule")
+            self.rules = RuleSet()
+        else:
+            try:
+                self.rules = compile_rules(load_rules_file(self.path))
+                metrics.inc("rules_reloads_total", status="ok")
+                logger.info(f"📜 Nạp {len(self.rules)} rule từ {self.path} ({self.rules.nodes} biểu thức con)")
+            except (OSError, ValueError) as e:
+                # Ghi nhận mtime để không báo lỗi lại mỗi lần scan cho tới khi file được sửa
+                metrics.inc("rules_reloads_total", status="error")
+                logger.error(f"❌ Không nạp được {self.path}, giữ {len(self.rules)} rule đang chạy: {e}")
+        self._mtime = mtime
+        metrics.set("rules_loaded", len(self.rules))
+
+# Rule của RULES_FILE trong process hiện tại
+rule_book = RuleBook(RULES_FILE)
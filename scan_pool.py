@@ -0,0 +1,160 @@
+# trading-signals-website/scan_pool.py
+
+"""Chạy indicators + combos của nhiều symbol song song trên process pool
+
+Nến base của mọi symbol được chép một lần vào một khối SharedMemory (mỗi field một
+mảng liền, symbol là một đoạn [start, stop)), worker gắn vào khối đó và đọc qua
+CandleView nên không phải pickle nến. Mỗi worker là một process riêng và luôn nhận
+cùng nhóm symbol (theo vị trí trong danh sách COINS), nên IndicatorState và last_scanned
+của engine trong worker vẫn được dùng lại giữa các lần scan như khi chạy tuần tự.
+
+Kết quả được gộp theo đúng thứ tự symbol đầu vào; lỗi của một symbol (hay cả một
+worker chết) chỉ làm mất tín hiệu của các symbol đó trong lần scan này.
+"""
+
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from candles import CandleView
+from engine import KLINE_DTYPES, scan_symbol
+from metrics import metrics
+from rules import rule_book
+
+logger = logging.getLogger(__name__)
+
+# Căn lề đầu mỗi cột trong khối shared memory
+_ALIGN = 64
+
+def _context():
+    # forkserver: worker không fork từ process scanner đang có thread (scheduler, fetch)
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
+
+# =============================================================================
+# SHARED MEMORY
+# =============================================================================
+
+def pack_candles(frames):
+    """Chép nến của nhiều symbol vào một khối SharedMemory
+
+    Returns (shm, layout, total, spans): layout là {field: (offset, dtype)}, spans là
+    [(symbol, start, stop)] theo thứ tự của `frames`. Người gọi phải close() + unlink() shm.
+    """
+    spans, total = [], 0
+    for symbol, candles in frames.items():
+        spans.append((symbol, total, total + len(candles)))
+        total += len(candles)
+
+    layout, size = {}, 0
+    for field, dtype in KLINE_DTYPES.items():
+        layout[field] = (size, np.dtype(dtype).str)
+        size += -(-total * np.dtype(dtype).itemsize // _ALIGN) * _ALIGN
+
+    shm = SharedMemory(create=True, size=max(size, 1))
+    columns = _columns(shm, layout, total)
+    for (symbol, start, stop), candles in zip(spans, frames.values()):
+        for field, values in columns.items():
+            values[start:stop] = candles[field]
+    return shm, layout, total, spans
+
+def _columns(shm, layout, total):
+    return {field: np.ndarray(total, dtype=dtype, buffer=shm.buf, offset=offset)
+            for field, (offset, dtype) in layout.items()}
+
+# =============================================================================
+# WORKER
+# =============================================================================
+
+def _init_worker(initializer):
+    if initializer is not None:
+        initializer()
+    metrics.start_recording()
+
+def _scan_batch(shm_name, layout, total, spans):
+    """Trong worker: scan_symbol cho từng đoạn của khối shared memory
+
+    Returns ([(symbol, signals, error)], metrics đã ghi). Chỉ số (không phải mảng) được giữ
+    lại sau khi trả về, nên khối có thể close ngay.
+    """
+    shm = SharedMemory(name=shm_name)
+    # Mỗi worker tự nạp lại RULES_FILE khi file đổi
+    rules = rule_book.current()
+    results = []
+    try:
+        columns = _columns(shm, layout, total)
+        candles = None
+        for symbol, start, stop in spans:
+            candles = CandleView({field: values[start:stop] for field, values in columns.items()})
+            try:
+                results.append((symbol, scan_symbol(symbol, candles, rules), None))
+            except Exception as e:
+                results.append((symbol, [], str(e)))
+        # Bỏ mọi view vào khối trước khi close (còn view thì close báo BufferError)
+        columns = candles = None
+    finally:
+        shm.close()
+    return results, metrics.drain()
+
+# =============================================================================
+# POOL
+# =============================================================================
+
+class ScanPool:
+    """`workers` process (mỗi process một executor riêng để symbol luôn về cùng một worker)"""
+
+    def __init__(self, workers, initializer=None):
+        self.workers = workers
+        self.initializer = initializer
+        self._context = _context()
+        self._shards = [None] * workers
+
+    def _shard(self, index):
+        if self._shards[index] is None:
+            self._shards[index] = ProcessPoolExecutor(
+                max_workers=1, mp_context=self._context,
+                initializer=_init_worker, initargs=(self.initializer,)
+            )
+        return self._shards[index]
+
+    def _restart(self, index, wait=False):
+        shard, self._shards[index] = self._shards[index], None
+        if shard is not None:
+            shard.shutdown(wait=wait, cancel_futures=True)
+
+    def scan(self, frames):
+        """{symbol: CandleView hoặc None} -> danh sách signal mới, theo thứ tự symbol của `frames`"""
+        # Worker chọn theo vị trí trong `frames` (kể cả symbol không có nến) để không đổi giữa các lần scan
+        shard_of = {symbol: i % self.workers for i, symbol in enumerate(frames)}
+        frames = {symbol: candles for symbol, candles in frames.items() if candles}
+        if not frames:
+            return []
+        shm, layout, total, spans = pack_candles(frames)
+        try:
+            batches = [[span for span in spans if shard_of[span[0]] == i] for i in range(self.workers)]
+            futures = {i: self._shard(i).submit(_scan_batch, shm.name, layout, total, batch)
+                       for i, batch in enumerate(batches) if batch}
+            by_symbol = {}
+            for i, future in futures.items():
+                try:
+                    results, records = future.result()
+                except Exception as e:
+                    logger.error(f"❌ Worker scan {i} lỗi, bỏ qua {len(batches[i])} symbol lần này: {e}")
+                    self._restart(i)
+                    continue
+                metrics.replay(records)
+                for symbol, signals, error in results:
+                    if error:
+                        logger.error(f"❌ Lỗi scan {symbol}: {error}")
+                    by_symbol[symbol] = signals
+        finally:
+            shm.close()
+            shm.unlink()
+        return [signal for symbol in frames for signal in by_symbol.get(symbol, [])]
+
+    def close(self):
+        for index in range(self.workers):
+            self._restart(index, wait=True)
@@ -0,0 +1,287 @@
+# trading-signals-website/scanner.py
+
+"""Scanner: tải nến, chạy combos và ghi signals vào store dùng chung với web app
+
+Chạy thành process riêng, tách khỏi gunicorn; web app (app.py) chỉ đọc store nên khởi
+động nhanh và hai bên restart/scale độc lập:
+
+    scanner            # console script (pip install .), hoặc: python scanner.py
+    scanner --once     # một lần scan + resolve rồi thoát
+"""
+
+import os
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_MISSED
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from config import (
+    COINS, INTERVALS, INGESTION_MODE, BINANCE_STREAM_URL, SCHEDULER_LOCK_FILE,
+    STORAGE_BACKEND, DATABASE_FILE, DATA_FILE, KEYS_FILE, USERS_FILE, METRICS_FILE, SCAN_WORKERS,
+    COOLDOWN_MINUTES, SIGNAL_DEDUP_TOLERANCE
+)
+from engine import (
+    BASE_INTERVAL, fetch_all_klines, get_klines, kline_cache, resolve_signal, scan_symbol
+)
+from kline_stream import KlineStream, stream_url
+from locks import LeaderLock
+from metrics import metrics
+from rules import rule_book
+from scan_pool import ScanPool
+from storage import CooldownIndex, create_store, save_json_file
+
+logger = logging.getLogger(__name__)
+
+store = create_store(STORAGE_BACKEND, DATABASE_FILE, DATA_FILE, KEYS_FILE, USERS_FILE)
+# Chặn signal lặp trước khi ghi (dựng lại từ store nên vẫn đúng sau restart)
+cooldowns = CooldownIndex(store, timedelta(minutes=COOLDOWN_MINUTES), SIGNAL_DEDUP_TOLERANCE)
+
+def setup_logging():
+    """Log ra scanner.log + stderr (cả process chính lẫn worker của scan_pool)"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('scanner.log'),
+            logging.StreamHandler()
+        ]
+    )
+
+# Indicators + combos chạy trên process pool khi SCAN_WORKERS > 1 (tạo lười ở lần scan đầu)
+scan_pool = None
+
+# =============================================================================
+# SCAN & RESOLVE
+# =============================================================================
+
+def save_new_signals(new_signals):
+    """Ghi signals mới (trừ bản trùng/còn cooldown) vào store; web app thấy version đổi và đẩy chúng tới dashboard"""
+    with metrics.timer("signals_persist_seconds"):
+        saved, suppressed = cooldowns.add_signals(new_signals)
+    for signal, reason in suppressed:
+        metrics.inc("signals_suppressed_total", reason=reason)
+        logger.info(f"🔁 Bỏ {signal['coin']} {signal.get('interval')} {signal['direction']} - "
+                    f"{signal['combo_name']} ({reason})")
+    metrics.inc("signals_new_total", len(saved))
+    return saved
+
+def scan():
+    """Main scanning function with enhanced logging"""
+    started = time.time()
+    logger.info(f"🔍 Bắt đầu scan {len(COINS)} coin ({', '.join(INTERVALS)}, base {BASE_INTERVAL})...")
+
+    frames = fetch_all_klines(COINS, BASE_INTERVAL)
+    fetched_at = time.time()
+
+    for symbol, base_candles in frames.items():
+        if base_candles is None:
+            logger.warning(f"⚠️ Bỏ qua {symbol}: không có dữ liệu nến")
+    new_signals = evaluate_symbols(frames)
+
+    if new_signals:
+        new_signals = save_new_signals(new_signals)
+
+    metrics.observe("signals_scan_seconds", time.time() - started)
+    metrics.set("signals_last_scan_timestamp_seconds", time.time())
+    logger.info(f"✅ Scan xong: fetch {fetched_at - started:.1f}s, tổng {time.time() - started:.1f}s, "
+                f"{len(new_signals)} tín hiệu mới")
+
+def evaluate_symbols(frames):
+    """scan_symbol cho mọi symbol có nến: trên scan_pool nếu SCAN_WORKERS > 1, nếu không thì tuần tự"""
+    global scan_pool
+    if SCAN_WORKERS > 1:
+        if scan_pool is None:
+            scan_pool = ScanPool(SCAN_WORKERS, initializer=setup_logging)
+        return scan_pool.scan(frames)
+
+    rules = rule_book.current()
+    new_signals = []
+    for symbol, base_candles in frames.items():
+        if base_candles is None:
+            continue
+        try:
+            new_signals.extend(scan_symbol(symbol, base_candles, rules))
+        except Exception as e:
+            logger.error(f"❌ Lỗi scan {symbol}: {e}")
+    return new_signals
+
+def on_closed_candle(symbol, row):
+    """Stream ingestion: gộp một nến vừa đóng vào cache và đánh giá ngay symbol đó
+
+    Nến không nối tiếp cache (mất kết nối, bỏ lỡ message) thì backfill bằng get_klines
+    trước, nên cache không bao giờ bị hụt nến.
+    """
+    cached = kline_cache.get(symbol, BASE_INTERVAL)
+    if cached and row[0] <= cached["open_time"][-1]:
+        return []
+    if not cached or row[0] > cached["close_time"][-1] + 1:
+        logger.warning(f"⚠️ {symbol}: cache không nối tiếp nến từ stream, backfill qua REST")
+        base_candles = get_klines(symbol, interval=BASE_INTERVAL)
+    else:
+        base_candles = kline_cache.merge(symbol, BASE_INTERVAL, [row])
+    if base_candles is None:
+        return []
+
+    new_signals = scan_symbol(symbol, base_candles, rule_book.current())
+    if new_signals:
+        new_signals = save_new_signals(new_signals)
+    return new_signals
+
+def resolve_signals(interval=BASE_INTERVAL):
+    """Đóng các signal active đã chạm TP/SL, dùng nến trong kline_cache (không gọi API)
+
+    Signals được gom theo coin để mỗi coin chỉ dựng mảng giá một lần,
+    rồi đóng cả lô trong một lần ghi store.
+    """
+    started = time.time()
+    now = datetime.now(timezone.utc)
+    by_coin = {}
+    for signal in store.list_signals(status='active'):
+        by_coin.setdefault(signal['coin'], []).append(signal)
+
+    closed = []
+    for coin, signals in by_coin.items():
+        candles = kline_cache.get(coin, interval)
+        high, low, close_time = candles["high"], candles["low"], candles["close_time"]
+        for signal in signals:
+            try:
+                result = resolve_signal(signal, high, low, close_time, now)
+            except Exception as e:
+                logger.error(f"❌ Lỗi resolve signal {signal.get('id')}: {e}")
+                continue
+            if result:
+                closed.append(result)
+
+    if closed:
+        count = len(store.close_signals(closed))
+        outcomes = [s['outcome'] for s in closed]
+        logger.info(f"🎯 Đóng {count} signal theo giá: {outcomes.count('win')} win, "
+                    f"{outcomes.count('loss')} loss, {outcomes.count('expired')} expired")
+    metrics.observe("signals_resolve_seconds", time.time() - started)
+
+# =============================================================================
+# METRICS
+# =============================================================================
+
+# Chu kỳ dump metrics ra METRICS_FILE cho web app (/metrics)
+METRICS_DUMP_SECONDS = 30
+
+def dump_metrics():
+    """Ghi snapshot metrics của scanner ra METRICS_FILE (web app đọc và phục vụ ở /metrics)"""
+    try:
+        save_json_file(METRICS_FILE, metrics.snapshot())
+    except Exception as e:
+        logger.error(f"❌ Lỗi ghi metrics: {e}")
+
+def record_scheduler_lag(event):
+    """Độ trễ giữa tick cron dự kiến và lúc job thực sự được submit"""
+    if event.code == EVENT_JOB_MISSED:
+        metrics.inc("signals_scheduler_missed_total", job=event.job_id)
+        return
+    lag = (datetime.now(timezone.utc) - event.scheduled_run_times[0]).total_seconds()
+    metrics.observe("signals_scheduler_lag_seconds", max(lag, 0.0), job=event.job_id)
+    metrics.set("signals_scheduler_last_lag_seconds", lag, job=event.job_id)
+
+# =============================================================================
+# SCHEDULER
+# =============================================================================
+
+def candle_cron(interval, delay_minutes):
+    """Cron fields firing `delay_minutes` after each candle of `interval` closes"""
+    unit, step = interval[-1], int(interval[:-1])
+    if unit == "m":
+        return {"minute": f"{delay_minutes}-59/{step}"}
+    if unit == "h":
+        return {"hour": f"*/{step}", "minute": delay_minutes}
+    return {"hour": 0, "minute": delay_minutes}
+
+def run_scheduler():
+    """Run background scheduler"""
+    logger.info("🚀 Starting Trading Signals Scheduler...")
+    
+    scheduler = BackgroundScheduler(timezone="UTC")
+    scheduler.add_listener(record_scheduler_lag, EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED)
+    
+    if INGESTION_MODE != "stream":
+        # Scan one minute after every base candle closes (15m -> 1,16,31,46)
+        scheduler.add_job(scan, 'cron', id="scan", **candle_cron(BASE_INTERVAL, 1))
+
+    # Resolve active signals against the candles the scan just cached
+    scheduler.add_job(resolve_signals, 'cron', id="resolve_signals", **candle_cron(BASE_INTERVAL, 2))
+    
+    # Cleanup expired keys daily
+    scheduler.add_job(cleanup_expired_keys, 'cron', id="cleanup_expired_keys", hour=0, minute=0)
+
+    # Metrics cho web app (/metrics)
+    scheduler.add_job(dump_metrics, 'interval', id="dump_metrics", seconds=METRICS_DUMP_SECONDS)
+    
+    # Run initial scan
+    try:
+        logger.info("🔍 Running initial scan...")
+        scan()
+        resolve_signals()
+    except Exception as e:
+        logger.error(f"❌ Initial scan error: {e}")
+    dump_metrics()
+    
+    scheduler.start()
+    logger.info("✅ Scheduler started successfully")
+
+    if INGESTION_MODE == "stream":
+        # Đánh giá ngay khi nến đóng; mỗi lần (re)connect chạy scan() để backfill qua REST
+        KlineStream(stream_url(BINANCE_STREAM_URL, COINS, BASE_INTERVAL),
+                    on_candle=on_closed_candle, on_connect=scan).start()
+        logger.info(f"📡 Kline stream: {len(COINS)} coin ({BASE_INTERVAL})")
+    
+    # Keep the process alive
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        scheduler.shutdown()
+        if scan_pool is not None:
+            scan_pool.close()
+
+leader_lock = LeaderLock(SCHEDULER_LOCK_FILE)
+LEADER_RETRY_SECONDS = 30
+
+def run_scheduler_when_leader():
+    """Chờ tới khi process này là leader rồi chạy scheduler (leader chết thì scanner khác lên thay)"""
+    while not leader_lock.try_acquire():
+        time.sleep(LEADER_RETRY_SECONDS)
+    logger.info(f"👑 Scanner {os.getpid()} là leader, chạy scheduler")
+    run_scheduler()
+
+def cleanup_expired_keys():
+    """Clean up expired keys"""
+    expired_count = store.delete_expired_keys(datetime.now(timezone.utc))
+    
+    if expired_count > 0:
+        logger.info(f"🧹 Cleaned up {expired_count} expired keys")
+
+# =============================================================================
+# ENTRY POINT
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Scanner tín hiệu: ghi signals vào store dùng chung với web app")
+    parser.add_argument("--once", action="store_true", help="chạy một lần scan + resolve rồi thoát")
+    args = parser.parse_args()
+
+    setup_logging()
+    store.init()
+
+    if args.once:
+        scan()
+        resolve_signals()
+        dump_metrics()
+        if scan_pool is not None:
+            scan_pool.close()
+        return
+    run_scheduler_when_leader()
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,9 @@ setup(
     name="trading-signals-website",
     version="1.0.0",
     packages=find_packages(),
+    py_modules=[
+        "app", "backtest", "benchmark", "candles", "config", "engine", "events", "kline_stream", "locks", "metrics", "rules", "scan_pool", "scanner", "storage", "sweep"
+    ],
     install_requires=[
         "flask==2.3.3",
         "pandas==1.5.3", 
@@ -12,6 +15,12 @@ setup(
         "apscheduler==3.10.1",
         "ta==0.10.2",
         "gunicorn==21.2.0",
-        "cryptography==41.0.7"
+        "cryptography==41.0.7",
+        "websocket-client==1.6.4"
     ],
+    entry_points={
+        "console_scripts": [
+            "scanner=scanner:main",
+        ],
+    },
 )
@@ -4,19 +4,85 @@ document.addEventListener('DOMContentLoaded', function() {
     initializeApp();
 });
 
+// Dữ liệu hiện tại trên dashboard, cập nhật bởi REST hoặc sự kiện SSE
+let currentSignals = [];
+let eventSource = null;
+let pollTimers = [];
+
 function initializeApp() {
     // Load initial data
     loadSignals();
     loadStats();
     
-    // Set up auto-refresh
-    setInterval(loadSignals, 30000); // 30 seconds
-    setInterval(loadStats, 60000); // 1 minute
+    // Realtime qua SSE; polling chỉ chạy khi không có kết nối stream
+    connectEventStream();
     
     // Initialize event listeners
     initializeEventListeners();
 }
 
+function startPolling() {
+    if (pollTimers.length) return;
+    pollTimers = [
+        setInterval(loadSignals, 30000), // 30 seconds
+        setInterval(loadStats, 60000) // 1 minute
+    ];
+}
+
+function stopPolling() {
+    pollTimers.forEach(timer => clearInterval(timer));
+    pollTimers = [];
+}
+
+function isStreamConnected() {
+    return eventSource !== null && eventSource.readyState === EventSource.OPEN;
+}
+
+function connectEventStream() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+    
+    eventSource = new EventSource('/api/stream');
+    
+    eventSource.onopen = () => {
+        if (pollTimers.length) {
+            // Vừa kết nối lại: tải lại một lần để bù các sự kiện bị lỡ
+            stopPolling();
+            loadSignals();
+        }
+    };
+    
+    eventSource.onerror = () => {
+        startPolling();
+        if (eventSource.readyState === EventSource.CLOSED) {
+            // Server từ chối (vd. quá nhiều kết nối): thử lại sau 1 phút
+            setTimeout(connectEventStream, 60000);
+        }
+    };
+    
+    // Signal mới, vừa được vote hoặc vừa đóng (từ bất kỳ worker nào của server)
+    eventSource.addEventListener('signals', event => {
+        applySignalUpdates(JSON.parse(event.data));
+    });
+    
+    eventSource.addEventListener('stats', event => renderStats(JSON.parse(event.data)));
+}
+
+function applySignalUpdates(updates) {
+    // Cập nhật signal đang hiển thị, thêm signal chưa có lên đầu; server lọc khi tải qua
+    // REST còn signal đẩy qua SSE được lọc tại đây (signal đóng chỉ hiện khi xem "Tất cả")
+    const byId = new Map(updates.map(update => [update.id, update]));
+    const updated = currentSignals.map(signal => {
+        const update = byId.get(signal.id);
+        byId.delete(signal.id);
+        return update ? {...signal, ...update} : signal;
+    });
+    currentSignals = [...byId.values()].concat(updated).filter(matchesFilters);
+    renderSignals(currentSignals);
+}
+
 function initializeEventListeners() {
     // Filter changes
     document.getElementById('timeframeFilter').addEventListener('change', filterSignals);
@@ -24,18 +90,58 @@ function initializeEventListeners() {
     document.getElementById('statusFilter').addEventListener('change', filterSignals);
     
     // Search functionality
-    document.getElementById('searchInput').addEventListener('input', filterSignals);
+    const searchInput = document.getElementById('searchInput');
+    if (searchInput) searchInput.addEventListener('input', filterSignals);
+}
+
+// Bộ lọc hiện tại, gửi lên server dưới dạng query string của /api/signals
+function currentFilters() {
+    const searchInput = document.getElementById('searchInput');
+    return {
+        timeframe: document.getElementById('timeframeFilter').value,
+        direction: document.getElementById('directionFilter').value,
+        status: document.getElementById('statusFilter').value,
+        coin: searchInput ? searchInput.value.trim().toUpperCase() : ''
+    };
+}
+
+function signalsQuery() {
+    const filters = currentFilters();
+    const params = new URLSearchParams();
+    if (filters.timeframe !== 'all') params.set('timeframe', filters.timeframe);
+    if (filters.direction !== 'all') params.set('direction', filters.direction);
+    if (filters.status !== 'active') params.set('status', filters.status);
+    if (filters.coin) params.set('coin', filters.coin.endsWith('USDT') ? filters.coin : `${filters.coin}USDT`);
+    const query = params.toString();
+    return query ? `?${query}` : '';
+}
+
+function matchesFilters(signal) {
+    const filters = currentFilters();
+    return (filters.timeframe === 'all' || signal.timeframe === filters.timeframe) &&
+        (filters.direction === 'all' || signal.direction === filters.direction) &&
+        (filters.status === 'all' || (signal.status || 'active') === filters.status) &&
+        (!filters.coin || signal.coin.startsWith(filters.coin));
+}
+
+let filterTimer = null;
+
+function filterSignals() {
+    // Debounce: gõ tìm kiếm không gửi một request cho mỗi phím
+    clearTimeout(filterTimer);
+    filterTimer = setTimeout(loadSignals, 300);
 }
 
 async function loadSignals() {
     try {
-        showLoading('signalsBody');
+        if (currentSignals.length === 0) showLoading('signalsBody');
         
-        const response = await fetch('/api/signals');
+        // Trình duyệt gửi If-None-Match; 304 được trả về như 200 với body đã cache
+        const response = await fetch(`/api/signals${signalsQuery()}`, {cache: 'no-cache'});
         if (!response.ok) throw new Error('Network error');
         
-        const signals = await response.json();
-        renderSignals(signals);
+        currentSignals = await response.json();
+        renderSignals(currentSignals);
         
     } catch (error) {
         console.error('Error loading signals:', error);
@@ -43,6 +149,46 @@ async function loadSignals() {
     }
 }
 
+async function loadStats() {
+    try {
+        const response = await fetch('/api/stats');
+        if (!response.ok) throw new Error('Network error');
+        
+        renderStats(await response.json());
+        
+    } catch (error) {
+        console.error('Error loading stats:', error);
+    }
+}
+
+function renderStats(stats) {
+    const section = document.getElementById('stats-section');
+    const period = (label, data) => `
+        <div class="col-md-4 mb-3">
+            <div class="card h-100">
+                <div class="card-body">
+                    <h6 class="text-muted">${label}</h6>
+                    <div class="fs-4 fw-bold">${data.win_rate}%</div>
+                    <small class="text-muted">${data.wins} win / ${data.losses} loss / ${data.expired} expired</small>
+                </div>
+            </div>
+        </div>
+    `;
+    
+    section.innerHTML = `
+        <h4 class="mb-3">Thống kê</h4>
+        <p class="text-muted">
+            Tổng ${stats.total_signals} tín hiệu · ${stats.active_signals} đang hoạt động ·
+            ${stats.closed_signals} đã đóng (${stats.expired_signals} expired) · Win rate ${stats.win_rate}%
+        </p>
+        <div class="row">
+            ${period('Hôm nay', stats.today_stats)}
+            ${period('Tuần này', stats.week_stats)}
+            ${period('Tháng này', stats.month_stats)}
+        </div>
+    `;
+}
+
 function renderSignals(signals) {
     const tbody = document.getElementById('signalsBody');
     
@@ -65,6 +211,7 @@ function renderSignals(signals) {
             </td>
             <td>
                 <span class="fw-bold">${signal.coin.replace('USDT', '')}</span>
+                ${signal.interval ? `<small class="text-muted ms-1">${signal.interval}</small>` : ''}
             </td>
             <td>
                 <span class="direction-${signal.direction.toLowerCase()}">
@@ -146,8 +293,13 @@ async function voteSignal(signalId, voteType) {
         if (response.ok) {
             showToast('success', result.message);
             addVotedSignal(signalId);
-            loadSignals(); // Reload signals
-            loadStats(); // Reload stats
+            if (!isStreamConnected()) {
+                // Không có SSE: tự tải lại (khi có SSE, sự kiện vote/stats sẽ tới)
+                loadSignals();
+                loadStats();
+            } else {
+                renderSignals(currentSignals); // hiện trạng thái "Đã vote"
+            }
         } else {
             showToast('error', result.error || 'Lỗi khi vote');
         }
@@ -188,6 +340,24 @@ function formatPrice(price) {
     return parseFloat(price).toFixed(4);
 }
 
+function showLoading(elementId) {
+    document.getElementById(elementId).innerHTML = `
+        <tr>
+            <td colspan="9" class="text-center py-4">
+                <div class="spinner-border text-primary" role="status"></div>
+            </td>
+        </tr>
+    `;
+}
+
+function showError(elementId, message) {
+    document.getElementById(elementId).innerHTML = `
+        <tr>
+            <td colspan="9" class="text-center py-4 text-danger">${message}</td>
+        </tr>
+    `;
+}
+
 function showToast(type, message) {
     // Implementation for toast notifications
     const toast = document.createElement('div');
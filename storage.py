@@ -0,0 +1,1355 @@
+# trading-signals-website/storage.py
+
+import os
+import copy
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+
+from locks import InterProcessLock
+
+logger = logging.getLogger(__name__)
+
+# Các cột cố định của bảng signals, phần còn lại của tín hiệu nằm trong cột extra (JSON)
+SIGNAL_COLUMNS = [
+    "id", "coin", "direction", "combo_name", "entry", "sl", "tp", "rr",
+    "timestamp", "status", "closed_at", "votes_win", "votes_lose", "outcome", "closed_by",
+    "interval", "timeframe", "updated_at"
+]
+# Các field được ghi khi đóng signal theo giá (close_signals)
+CLOSE_FIELDS = ["status", "closed_at", "outcome", "closed_by"]
+KEY_COLUMNS = [
+    "key", "type", "duration_hours", "created_at", "expires_at", "is_active", "used_by", "used_at"
+]
+USER_COLUMNS = ["key_id", "created_at", "last_login", "is_admin"]
+
+# =============================================================================
+# JSON HELPERS
+# =============================================================================
+
+def load_json_file(filename):
+    """Load JSON file với xử lý lỗi"""
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        logger.warning(f"⚠️ File {filename} không tồn tại hoặc lỗi, tạo mới")
+        return {}
+
+def save_json_file(filename, data):
+    """Save JSON file với xử lý lỗi
+
+    Ghi ra file tạm, fsync rồi os.replace: sau crash hay khi process khác đọc cùng lúc
+    file luôn là bản cũ hoặc bản mới đầy đủ, không bao giờ là bản ghi dở.
+    """
+    tmp_file = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False, default=str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, filename)
+        return True
+    except Exception as e:
+        logger.error(f"❌ Lỗi lưu file {filename}: {e}")
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+        return False
+
+def _is_expired(key_data, now):
+    return datetime.fromisoformat(key_data["expires_at"]) < now
+
+def _signal_order(signal):
+    return signal['timestamp'], signal['id']
+
+def _matches(signal, status, filters, since, cursor):
+    if status is not None and signal.get('status', 'active') != status:
+        return False
+    if any(value is not None and signal.get(field) != value for field, value in filters.items()):
+        return False
+    if since is not None and (signal.get('updated_at') or signal['timestamp']) <= since:
+        return False
+    return cursor is None or _signal_order(signal) < tuple(cursor)
+
+# =============================================================================
+# JSON BACKEND (snapshot 3 file JSON như bản cũ + journal append-only)
+# =============================================================================
+
+# Compaction gộp journal vào snapshot khi có từ này event trở lên
+JOURNAL_COMPACT_EVENTS = 1000
+# Journal được fsync theo lô mỗi ngần này giây (0: fsync ngay sau mỗi event)
+JOURNAL_FSYNC_INTERVAL = 1.0
+
+def _read_snapshot(filename, default):
+    """Đọc một file snapshot; file hỏng thì báo lỗi thay vì coi như rỗng (sẽ xóa mất lịch sử)"""
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except json.JSONDecodeError as e:
+        raise RuntimeError(f"Snapshot {filename} bị hỏng, không load để tránh ghi đè lịch sử: {e}")
+
+class JsonStore:
+    """Backend JSON: 3 file snapshot (định dạng cũ) + journal JSON Lines các event ghi
+
+    Mỗi lần ghi chỉ append một event vào `<data_file>.journal` (O(event) thay vì ghi lại
+    toàn bộ file); trạng thái nằm trong bộ nhớ, dựng lại từ snapshot + journal. Thread
+    nền fsync journal theo lô và compaction: ghi snapshot mới (file tạm + os.replace) rồi
+    thay journal bằng file rỗng. Event replay idempotent nên crash giữa compaction không
+    mất hay nhân đôi event; dòng cuối ghi dở bị bỏ qua. Các process dùng chung một file
+    lock và đọc tiếp phần journal do process khác append.
+    """
+
+    def __init__(self, data_file, keys_file, users_file):
+        self.data_file = data_file
+        self.keys_file = keys_file
+        self.users_file = users_file
+        self.journal_file = f"{data_file}.journal"
+        self._lock = InterProcessLock(f"{data_file}.lock")
+        self._written = threading.local()
+        self._reader = None     # fd của journal đang đọc (giữ inode, tránh bị tái sử dụng)
+        self._journal_id = None
+        self._offset = 0        # byte đã replay
+        self._events = 0        # số event trong journal hiện tại
+        self._counts = {"signals": 0, "keys": 0}
+        self._dirty = threading.Event()
+        self._background = None
+        self._signals = {}
+        self._voters = {}       # signal_id -> set voted_ips, dựng lười (xem _voters_of)
+        self._stats = {}
+        self._keys = {}
+        self._users = {}
+
+    def init(self):
+        """Tạo journal nếu chưa có, replay và chạy thread nền fsync/compaction"""
+        with self._lock:
+            if not os.path.exists(self.journal_file):
+                self._new_journal()
+                logger.info(f"✅ Đã tạo journal: {self.journal_file}")
+            self._catch_up()
+        if self._background is None:
+            self._background = threading.Thread(target=self._run_background, name="journal", daemon=True)
+            self._background.start()
+
+    # --- Journal -------------------------------------------------------------
+
+    def _load_snapshot(self):
+        data = _read_snapshot(self.data_file, {})
+        self._signals = {signal['id']: signal for signal in data.get("signals", [])}
+        self._voters = {}
+        self._stats = data.get("stats", {})
+        self._keys = _read_snapshot(self.keys_file, {}).get("keys", {})
+        self._users = _read_snapshot(self.users_file, {}).get("users", {})
+
+    def _new_journal(self):
+        """Thay journal bằng file mới chỉ có dòng header (id mới)"""
+        tmp_file = f"{self.journal_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"op": "journal", "id": uuid.uuid4().hex}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.journal_file)
+
+    def _catch_up(self):
+        """Replay phần journal chưa đọc (kể cả do process khác append); gọi trong self._lock
+
+        Journal bị thay (compaction ở process khác) thì load lại snapshot rồi đọc từ đầu.
+        """
+        try:
+            stat = os.stat(self.journal_file)
+        except FileNotFoundError:
+            stat = None
+        if self._reader is None or stat is None or os.fstat(self._reader).st_ino != stat.st_ino:
+            if self._reader is not None:
+                os.close(self._reader)
+                self._reader = None
+            self._load_snapshot()
+            self._offset = self._events = 0
+            self._counts = {"signals": 0, "keys": 0}
+            if stat is None:
+                return
+            self._reader = os.open(self.journal_file, os.O_RDONLY)
+        if stat.st_size <= self._offset:
+            return
+        # pread: không dùng chung offset của fd với các process fork từ cùng master
+        chunk = os.pread(self._reader, stat.st_size - self._offset, self._offset)
+        end = chunk.rfind(b"\n") + 1  # chỉ các dòng hoàn chỉnh
+        for line in chunk[:end].splitlines():
+            try:
+                event = json.loads(line)
+            except ValueError:
+                logger.warning(f"⚠️ Bỏ qua dòng journal hỏng trong {self.journal_file}")
+                continue
+            self._apply(event)
+        self._offset += end
+
+    def _append(self, event, kind=None):
+        """Ghi một event (trong self._lock) rồi replay nó; kind ('signals'/'keys') là version bị đổi"""
+        self._catch_up()
+        before = self._version(kind) if kind else None
+        fd = os.open(self.journal_file, os.O_WRONLY | os.O_APPEND)
+        try:
+            if os.fstat(fd).st_size > self._offset:
+                # Dòng cuối ghi dở của lần crash trước: cắt bỏ trước khi append
+                os.ftruncate(fd, self._offset)
+            os.write(fd, (json.dumps(event, ensure_ascii=False, default=str) + "\n").encode('utf-8'))
+            if JOURNAL_FSYNC_INTERVAL <= 0:
+                os.fsync(fd)
+            else:
+                self._dirty.set()
+        finally:
+            os.close(fd)
+        self._catch_up()
+        if kind:
+            setattr(self._written, kind, (before, self._version(kind)))
+
+    def _apply(self, event):
+        """Áp một event vào trạng thái trong bộ nhớ; áp lại lần nữa không đổi kết quả"""
+        op = event.get("op")
+        self._events += 1
+        if op == "journal":
+            self._journal_id = event["id"]
+        elif op == "add_signals":
+            for signal in event["signals"]:
+                self._signals.setdefault(signal['id'], signal)
+        elif op == "vote":
+            # Journal cũ: mỗi vote một event
+            self._apply_vote(event, event["close_after"])
+        elif op == "votes":
+            for vote in event["votes"]:
+                self._apply_vote(vote, event["close_after"])
+        elif op == "close":
+            for update in event["signals"]:
+                signal = self._signals.get(update['id'])
+                if signal is not None and signal.get('status', 'active') == 'active':
+                    signal.update({field: update.get(field) for field in CLOSE_FIELDS})
+                    signal['updated_at'] = event["at"]
+        elif op == "save_key":
+            self._keys[event["id"]] = event["key"]
+        elif op == "claim_key":
+            key_data = self._keys.get(event["id"])
+            if key_data is not None and key_data.get("used_by") is None:
+                key_data["used_by"] = event["nickname"]
+                key_data["used_at"] = event["at"]
+                self._users[event["nickname"]] = {
+                    "key_id": event["id"],
+                    "created_at": event["at"],
+                    "last_login": event["at"],
+                    "is_admin": False
+                }
+        elif op == "delete_keys":
+            for key_id in event["ids"]:
+                self._keys.pop(key_id, None)
+        elif op == "touch_user":
+            user = self._users.get(event["nickname"])
+            if user is not None:
+                user["last_login"] = event["at"]
+        if op in ("add_signals", "vote", "votes", "close"):
+            self._counts["signals"] += 1
+        elif op in ("save_key", "claim_key", "delete_keys"):
+            self._counts["keys"] += 1
+
+    def _voters_of(self, signal):
+        """Set các voter của signal (kiểm tra O(1) thay vì quét list voted_ips)"""
+        voters = self._voters.get(signal['id'])
+        if voters is None:
+            voters = self._voters[signal['id']] = set(signal.get('voted_ips', []))
+        return voters
+
+    def _apply_vote(self, vote, close_after):
+        signal = self._signals.get(vote["id"])
+        if signal is None:
+            return
+        voters = self._voters_of(signal)
+        if vote["voter"] in voters:
+            return
+        voters.add(vote["voter"])
+        signal.setdefault('voted_ips', []).append(vote["voter"])
+        field = 'votes_win' if vote["vote"] == 'win' else 'votes_lose'
+        signal[field] = signal.get(field, 0) + 1
+        signal['updated_at'] = vote["at"]
+        if (signal.get('status') != 'closed' and
+                signal.get('votes_win', 0) + signal.get('votes_lose', 0) >= close_after):
+            signal['status'] = 'closed'
+            signal['closed_at'] = vote["at"]
+            signal['closed_by'] = 'votes'
+
+    def _version(self, kind):
+        return f"{self._journal_id}.{self._counts[kind]}"
+
+    def last_write(self, name):
+        """(version trước, version sau) lần ghi gần nhất của thread này ('signals' hoặc 'keys')"""
+        return getattr(self._written, name, (None, None))
+
+    def compact(self):
+        """Ghi trạng thái hiện tại thành snapshot rồi bắt đầu journal mới"""
+        with self._lock:
+            self._catch_up()
+            saved = (
+                save_json_file(self.data_file, {"signals": list(self._signals.values()), "stats": self._stats}) and
+                save_json_file(self.keys_file, {"keys": self._keys}) and
+                save_json_file(self.users_file, {"users": self._users})
+            )
+            if not saved:
+                return False
+            events = self._events
+            self._new_journal()
+            self._catch_up()
+        logger.info(f"🗜️ Compaction journal: gộp {events} event vào snapshot")
+        return True
+
+    def _run_background(self):
+        interval = JOURNAL_FSYNC_INTERVAL if JOURNAL_FSYNC_INTERVAL > 0 else 1.0
+        while True:
+            time.sleep(interval)
+            try:
+                if self._dirty.is_set():
+                    self._dirty.clear()
+                    fd = os.open(self.journal_file, os.O_RDONLY)
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+                if self._events >= JOURNAL_COMPACT_EVENTS:
+                    with self._lock:
+                        self._catch_up()
+                        due = self._events >= JOURNAL_COMPACT_EVENTS
+                    if due:
+                        self.compact()
+            except Exception as e:
+                logger.error(f"❌ Lỗi fsync/compaction journal: {e}")
+
+    def export(self):
+        """(signals, keys, users) hiện tại, dùng khi migrate sang SQLite"""
+        with self._lock:
+            self._catch_up()
+            return (copy.deepcopy(list(self._signals.values())), copy.deepcopy(self._keys),
+                    copy.deepcopy(self._users))
+
+    # --- Signals -------------------------------------------------------------
+
+    def signals_version(self):
+        """Phiên bản của tập signals: id journal + số event signal trong journal"""
+        with self._lock:
+            self._catch_up()
+            return self._version("signals")
+
+    def add_signals(self, signals):
+        with self._lock:
+            self._append({"op": "add_signals", "signals": signals}, "signals")
+        return True
+
+    def get_signal(self, signal_id):
+        with self._lock:
+            self._catch_up()
+            signal = self._signals.get(signal_id)
+            return copy.deepcopy(signal) if signal else None
+
+    def list_signals(self, status=None, coin=None, direction=None, combo_name=None, timeframe=None,
+                     since=None, cursor=None, limit=None):
+        """Signals mới nhất trước (timestamp, id), lọc theo các field nếu có
+
+        since: chỉ signal tạo/cập nhật sau mốc này; cursor: (timestamp, id) của signal
+        cuối trang trước; limit: số signal tối đa.
+        """
+        filters = {"coin": coin, "direction": direction, "combo_name": combo_name, "timeframe": timeframe}
+        with self._lock:
+            self._catch_up()
+            signals = [dict(s) for s in self._signals.values() if _matches(s, status, filters, since, cursor)]
+        signals.sort(key=_signal_order, reverse=True)
+        return signals[:limit] if limit is not None else signals
+
+    def list_voters(self, signal_id):
+        with self._lock:
+            self._catch_up()
+            signal = self._signals.get(signal_id)
+            return list(self._voters_of(signal)) if signal else []
+
+    def record_vote(self, signal_id, voter, vote_type, close_after, now):
+        """Ghi một vote; trả về (signal, lỗi) với lỗi là None, 'not_found' hoặc 'already_voted'"""
+        return self.record_votes([(signal_id, voter, vote_type, now)], close_after)[0]
+
+    def record_votes(self, votes, close_after):
+        """Ghi một lô vote (signal_id, voter, vote_type, now) bằng một event journal
+
+        Trả về [(signal, lỗi)] theo thứ tự `votes`, signal là trạng thái sau cả lô.
+        """
+        with self._lock:
+            self._catch_up()
+            accepted, errors, seen = [], [], set()
+            for signal_id, voter, vote_type, now in votes:
+                signal = self._signals.get(signal_id)
+                if not signal:
+                    errors.append("not_found")
+                elif voter in self._voters_of(signal) or (signal_id, voter) in seen:
+                    errors.append("already_voted")
+                else:
+                    seen.add((signal_id, voter))
+                    accepted.append({"id": signal_id, "voter": voter, "vote": vote_type, "at": now.isoformat()})
+                    errors.append(None)
+            if accepted:
+                self._append({"op": "votes", "votes": accepted, "close_after": close_after}, "signals")
+            return [(dict(self._signals[vote[0]]) if error != "not_found" else None, error)
+                    for vote, error in zip(votes, errors)]
+
+    def close_signals(self, closed):
+        """Đóng một lô signal đang active (ghi CLOSE_FIELDS); trả về id các signal đã đóng"""
+        with self._lock:
+            self._catch_up()
+            updates = [
+                dict({field: signal.get(field) for field in CLOSE_FIELDS}, id=signal['id'])
+                for signal in closed
+                if self._signals.get(signal['id'], {"status": "closed"}).get('status', 'active') == 'active'
+            ]
+            if updates:
+                self._append({
+                    "op": "close", "signals": updates, "at": datetime.now(timezone.utc).isoformat()
+                }, "signals")
+            return [update['id'] for update in updates]
+
+    # --- Keys & users --------------------------------------------------------
+
+    def keys_version(self):
+        """Phiên bản của tập key: id journal + số event key trong journal"""
+        with self._lock:
+            self._catch_up()
+            return self._version("keys")
+
+    def list_keys(self):
+        with self._lock:
+            self._catch_up()
+            return copy.deepcopy(self._keys)
+
+    def find_key(self, access_key):
+        """Tìm key theo chuỗi key; trả về (key_id, key_data) hoặc (None, None)"""
+        for key_id, key_data in self.list_keys().items():
+            if key_data.get("key") == access_key:
+                return key_id, key_data
+        return None, None
+
+    def save_key(self, key_id, key_data):
+        with self._lock:
+            self._append({"op": "save_key", "id": key_id, "key": key_data}, "keys")
+        return True
+
+    def claim_key(self, key_id, nickname, now):
+        """Gán key chưa dùng cho nickname và tạo user; False nếu key đã bị người khác nhận"""
+        with self._lock:
+            self._catch_up()
+            key_data = self._keys.get(key_id)
+            if key_data is None or key_data.get("used_by") is not None:
+                return False
+            self._append({"op": "claim_key", "id": key_id, "nickname": nickname, "at": now.isoformat()}, "keys")
+            return True
+
+    def delete_expired_keys(self, now):
+        with self._lock:
+            self._catch_up()
+            expired = [key_id for key_id, key_data in self._keys.items() if _is_expired(key_data, now)]
+            if expired:
+                self._append({"op": "delete_keys", "ids": expired}, "keys")
+            return len(expired)
+
+    def get_user(self, nickname):
+        with self._lock:
+            self._catch_up()
+            user = self._users.get(nickname)
+            return dict(user) if user else None
+
+    def touch_user(self, nickname, now):
+        """Cập nhật last_login của user"""
+        with self._lock:
+            self._catch_up()
+            if nickname not in self._users:
+                return False
+            self._append({"op": "touch_user", "nickname": nickname, "at": now.isoformat()})
+            return True
+
+# =============================================================================
+# SQLITE BACKEND (mặc định)
+# =============================================================================
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS signals (
+    id TEXT PRIMARY KEY,
+    coin TEXT NOT NULL,
+    direction TEXT NOT NULL,
+    combo_name TEXT,
+    entry REAL,
+    sl REAL,
+    tp REAL,
+    rr REAL,
+    timestamp TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'active',
+    closed_at TEXT,
+    votes_win INTEGER NOT NULL DEFAULT 0,
+    votes_lose INTEGER NOT NULL DEFAULT 0,
+    outcome TEXT,
+    closed_by TEXT,
+    interval TEXT,
+    timeframe TEXT,
+    updated_at TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_signals_status_timestamp ON signals(status, timestamp);
+CREATE INDEX IF NOT EXISTS idx_signals_timestamp ON signals(timestamp);
+CREATE INDEX IF NOT EXISTS idx_signals_closed_at ON signals(closed_at);
+CREATE INDEX IF NOT EXISTS idx_signals_coin ON signals(coin);
+
+CREATE TABLE IF NOT EXISTS votes (
+    signal_id TEXT NOT NULL REFERENCES signals(id) ON DELETE CASCADE,
+    voter TEXT NOT NULL,
+    vote TEXT,
+    created_at TEXT,
+    PRIMARY KEY (signal_id, voter)
+);
+
+CREATE TABLE IF NOT EXISTS keys (
+    id TEXT PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    type TEXT,
+    duration_hours INTEGER,
+    created_at TEXT,
+    expires_at TEXT NOT NULL,
+    is_active INTEGER NOT NULL DEFAULT 1,
+    used_by TEXT,
+    used_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    nickname TEXT PRIMARY KEY,
+    key_id TEXT,
+    created_at TEXT,
+    last_login TEXT,
+    is_admin INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Cột thêm vào sau phiên bản đầu của schema: (bảng, cột, kiểu)
+SQLITE_ADDED_COLUMNS = [
+    ("signals", "outcome", "TEXT"),
+    ("signals", "closed_by", "TEXT"),
+    ("signals", "interval", "TEXT"),
+    ("signals", "timeframe", "TEXT"),
+    ("signals", "updated_at", "TEXT"),
+]
+# Index trên các cột thêm sau (tạo sau khi migrate cột); (updated_at, timestamp) phục vụ cả
+# hai nhánh của điều kiện `since` (signal chưa cập nhật có updated_at NULL)
+SQLITE_ADDED_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_signals_updated_timestamp ON signals(updated_at, timestamp);
+DROP INDEX IF EXISTS idx_signals_updated_at;
+"""
+
+class SqliteStore:
+    """SQLite ở chế độ WAL: đọc không chặn ghi, truy vấn theo index thay vì quét cả lịch sử"""
+
+    def __init__(self, db_path, data_file=None, keys_file=None, users_file=None):
+        self.db_path = db_path
+        self.json_files = (data_file, keys_file, users_file)
+        self._local = threading.local()
+        self._written = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def init(self):
+        """Tạo bảng/index và migrate một lần từ các file JSON cũ"""
+        conn = self._conn()
+        conn.executescript(SQLITE_SCHEMA)
+        # Kiểm tra lại trong transaction: các worker gunicorn cùng init một lúc
+        with self._transaction() as tx:
+            for table, column, kind in SQLITE_ADDED_COLUMNS:
+                columns = {row["name"] for row in tx.execute(f"PRAGMA table_info({table})")}
+                if column not in columns:
+                    tx.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+                    if table == "signals":
+                        self._promote_extra_field(tx, column)
+        conn.executescript(SQLITE_ADDED_INDEXES)
+        if self._get_meta("json_migrated") is None:
+            self.migrate_from_json(*self.json_files)
+
+    @staticmethod
+    def _promote_extra_field(conn, column):
+        """Chuyển field đang nằm trong cột extra (JSON) sang cột mới cùng tên"""
+        rows = conn.execute("SELECT id, extra FROM signals WHERE extra LIKE ?", (f'%"{column}"%',)).fetchall()
+        for row in rows:
+            extra = json.loads(row["extra"])
+            if column in extra:
+                value = extra.pop(column)
+                conn.execute(f"UPDATE signals SET {column} = ?, extra = ? WHERE id = ?",
+                             (value, json.dumps(extra, ensure_ascii=False, default=str), row["id"]))
+
+    def _get_meta(self, name):
+        row = self._conn().execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row["value"] if row else None
+
+    def _bump_version(self, conn, name):
+        """Tăng version `name` trong transaction hiện tại, nhớ giá trị trước/sau cho thread này"""
+        before = self._get_meta(name)
+        conn.execute(
+            "INSERT INTO meta (name, value) VALUES (?, '1') "
+            "ON CONFLICT(name) DO UPDATE SET value = CAST(value AS INTEGER) + 1",
+            (name,)
+        )
+        setattr(self._written, name, (before, self._get_meta(name)))
+
+    def last_write(self, name):
+        """(version trước, version sau) lần ghi gần nhất của thread này ('signals' hoặc 'keys')"""
+        return getattr(self._written, f"{name}_version", (None, None))
+
+    def migrate_from_json(self, data_file, keys_file, users_file):
+        """Import signals/votes/keys/users từ 3 file JSON của JsonStore (chỉ chạy một lần)"""
+        # Snapshot + journal chưa compaction của JsonStore
+        signals, keys, users = JsonStore(data_file, keys_file, users_file).export() if data_file else ([], {}, {})
+
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE name = 'json_migrated'").fetchone():
+                return
+            for signal in signals:
+                self._insert_signal(conn, signal)
+                conn.executemany(
+                    "INSERT OR IGNORE INTO votes (signal_id, voter) VALUES (?, ?)",
+                    [(signal["id"], voter) for voter in signal.get("voted_ips", [])]
+                )
+            self._bump_version(conn, "signals_version")
+            for key_id, key_data in keys.items():
+                self._upsert_key(conn, key_id, key_data)
+            self._bump_version(conn, "keys_version")
+            for nickname, user in users.items():
+                self._upsert_user(conn, nickname, user)
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES ('json_migrated', ?)",
+                (datetime.now(timezone.utc).isoformat(),)
+            )
+
+        if signals or keys or users:
+            logger.info(f"✅ Đã migrate {len(signals)} signals, {len(keys)} keys, "
+                        f"{len(users)} users từ JSON sang {self.db_path}")
+
+    # --- Signals -------------------------------------------------------------
+
+    @staticmethod
+    def _insert_signal(conn, signal):
+        extra = {k: v for k, v in signal.items() if k not in SIGNAL_COLUMNS and k != "voted_ips"}
+        values = [signal.get(column) for column in SIGNAL_COLUMNS]
+        values[SIGNAL_COLUMNS.index("status")] = signal.get("status", "active")
+        values[SIGNAL_COLUMNS.index("votes_win")] = signal.get("votes_win", 0)
+        values[SIGNAL_COLUMNS.index("votes_lose")] = signal.get("votes_lose", 0)
+        conn.execute(
+            f"INSERT OR IGNORE INTO signals ({', '.join(SIGNAL_COLUMNS)}, extra) "
+            f"VALUES ({', '.join('?' * len(SIGNAL_COLUMNS))}, ?)",
+            values + [json.dumps(extra, ensure_ascii=False, default=str)]
+        )
+
+    @staticmethod
+    def _row_to_signal(row):
+        signal = {column: row[column] for column in SIGNAL_COLUMNS}
+        if row["extra"]:
+            signal.update(json.loads(row["extra"]))
+        return signal
+
+    def signals_version(self):
+        """Phiên bản của tập signals: tăng trong cùng transaction với mọi lần ghi signal"""
+        return self._get_meta("signals_version")
+
+    def add_signals(self, signals):
+        with self._transaction() as conn:
+            for signal in signals:
+                self._insert_signal(conn, signal)
+            self._bump_version(conn, "signals_version")
+        return True
+
+    def get_signal(self, signal_id):
+        row = self._conn().execute("SELECT * FROM signals WHERE id = ?", (signal_id,)).fetchone()
+        return self._row_to_signal(row) if row else None
+
+    def list_signals(self, status=None, coin=None, direction=None, combo_name=None, timeframe=None,
+                     since=None, cursor=None, limit=None):
+        """Signals mới nhất trước (timestamp, id), lọc theo các field nếu có
+
+        since: chỉ signal tạo/cập nhật sau mốc này; cursor: (timestamp, id) của signal
+        cuối trang trước; limit: số signal tối đa.
+        """
+        clauses, params = [], []
+        for column, value in (("status", status), ("coin", coin), ("direction", direction),
+                              ("combo_name", combo_name), ("timeframe", timeframe)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            # = COALESCE(updated_at, timestamp) > since, nhưng mỗi nhánh OR tìm được theo index
+            clauses.append("(updated_at > ? OR (updated_at IS NULL AND timestamp > ?))")
+            params.extend([since, since])
+        if cursor is not None:
+            clauses.append("(timestamp < ? OR (timestamp = ? AND id < ?))")
+            params.extend([cursor[0], cursor[0], cursor[1]])
+
+        sql = "SELECT * FROM signals"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        # Có since thì lọc theo index rồi mới sắp xếp (ít dòng), thay vì quét cả index timestamp
+        sql += " ORDER BY +timestamp DESC, +id DESC" if since is not None else " ORDER BY timestamp DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [self._row_to_signal(row) for row in self._conn().execute(sql, params)]
+
+    def list_voters(self, signal_id):
+        rows = self._conn().execute("SELECT voter FROM votes WHERE signal_id = ?", (signal_id,))
+        return [row["voter"] for row in rows]
+
+    def record_vote(self, signal_id, voter, vote_type, close_after, now):
+        """Ghi một vote; trả về (signal, lỗi) với lỗi là None, 'not_found' hoặc 'already_voted'"""
+        return self.record_votes([(signal_id, voter, vote_type, now)], close_after)[0]
+
+    def record_votes(self, votes, close_after):
+        """Ghi một lô vote (signal_id, voter, vote_type, now) trong một transaction
+
+        Trả về [(signal, lỗi)] theo thứ tự `votes`, signal là trạng thái sau cả lô.
+        """
+        errors = []
+        with self._transaction() as conn:
+            for signal_id, voter, vote_type, now in votes:
+                if conn.execute("SELECT 1 FROM signals WHERE id = ?", (signal_id,)).fetchone() is None:
+                    errors.append("not_found")
+                    continue
+                try:
+                    conn.execute(
+                        "INSERT INTO votes (signal_id, voter, vote, created_at) VALUES (?, ?, ?, ?)",
+                        (signal_id, voter, vote_type, now.isoformat())
+                    )
+                except sqlite3.IntegrityError:
+                    errors.append("already_voted")
+                    continue
+                column = "votes_win" if vote_type == "win" else "votes_lose"
+                conn.execute(f"UPDATE signals SET {column} = {column} + 1, updated_at = ? WHERE id = ?",
+                             (now.isoformat(), signal_id))
+                conn.execute(
+                    "UPDATE signals SET status = 'closed', closed_at = ?, closed_by = 'votes' "
+                    "WHERE id = ? AND status != 'closed' AND votes_win + votes_lose >= ?",
+                    (now.isoformat(), signal_id, close_after)
+                )
+                errors.append(None)
+            if None in errors:
+                self._bump_version(conn, "signals_version")
+            signals = {}
+            for signal_id in {vote[0] for vote, error in zip(votes, errors) if error != "not_found"}:
+                row = conn.execute("SELECT * FROM signals WHERE id = ?", (signal_id,)).fetchone()
+                signals[signal_id] = self._row_to_signal(row)
+        return [(signals.get(vote[0]), error) for vote, error in zip(votes, errors)]
+
+    def close_signals(self, closed):
+        """Đóng một lô signal đang active (ghi CLOSE_FIELDS); trả về id các signal đã đóng"""
+        applied = []
+        updated_at = datetime.now(timezone.utc).isoformat()
+        with self._transaction() as conn:
+            for signal in closed:
+                if conn.execute(
+                    "UPDATE signals SET status = ?, closed_at = ?, outcome = ?, closed_by = ?, updated_at = ? "
+                    "WHERE id = ? AND status = 'active'",
+                    [signal.get(field) for field in CLOSE_FIELDS] + [updated_at, signal["id"]]
+                ).rowcount:
+                    applied.append(signal["id"])
+            if applied:
+                self._bump_version(conn, "signals_version")
+        return applied
+
+    # --- Keys & users --------------------------------------------------------
+
+    @staticmethod
+    def _row_to_key(row):
+        key_data = {column: row[column] for column in KEY_COLUMNS}
+        key_data["is_active"] = bool(key_data["is_active"])
+        return key_data
+
+    @staticmethod
+    def _upsert_key(conn, key_id, key_data):
+        values = [key_data.get(column) for column in KEY_COLUMNS]
+        values[KEY_COLUMNS.index("is_active")] = int(key_data.get("is_active", True))
+        conn.execute(
+            f"INSERT OR REPLACE INTO keys (id, {', '.join(KEY_COLUMNS)}) "
+            f"VALUES (?, {', '.join('?' * len(KEY_COLUMNS))})",
+            [key_id] + values
+        )
+
+    @staticmethod
+    def _upsert_user(conn, nickname, user):
+        conn.execute(
+            "INSERT OR REPLACE INTO users (nickname, key_id, created_at, last_login, is_admin) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (nickname, user.get("key_id"), user.get("created_at"), user.get("last_login"),
+             int(user.get("is_admin", False)))
+        )
+
+    def keys_version(self):
+        """Phiên bản của tập key: tăng trong cùng transaction với mọi lần ghi key"""
+        return self._get_meta("keys_version")
+
+    def list_keys(self):
+        rows = self._conn().execute("SELECT * FROM keys ORDER BY created_at")
+        return {row["id"]: self._row_to_key(row) for row in rows}
+
+    def find_key(self, access_key):
+        """Tìm key theo chuỗi key; trả về (key_id, key_data) hoặc (None, None)"""
+        row = self._conn().execute("SELECT * FROM keys WHERE key = ?", (access_key,)).fetchone()
+        return (row["id"], self._row_to_key(row)) if row else (None, None)
+
+    def save_key(self, key_id, key_data):
+        with self._transaction() as conn:
+            self._upsert_key(conn, key_id, key_data)
+            self._bump_version(conn, "keys_version")
+        return True
+
+    def claim_key(self, key_id, nickname, now):
+        """Gán key chưa dùng cho nickname và tạo user; False nếu key đã bị người khác nhận"""
+        with self._transaction() as conn:
+            claimed = conn.execute(
+                "UPDATE keys SET used_by = ?, used_at = ? WHERE id = ? AND used_by IS NULL",
+                (nickname, now.isoformat(), key_id)
+            ).rowcount
+            if not claimed:
+                return False
+            self._bump_version(conn, "keys_version")
+            self._upsert_user(conn, nickname, {
+                "key_id": key_id,
+                "created_at": now.isoformat(),
+                "last_login": now.isoformat(),
+                "is_admin": False
+            })
+            return True
+
+    def delete_expired_keys(self, now):
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT id, expires_at FROM keys").fetchall()
+            expired = [(row["id"],) for row in rows if _is_expired(row, now)]
+            if expired:
+                conn.executemany("DELETE FROM keys WHERE id = ?", expired)
+                self._bump_version(conn, "keys_version")
+        return len(expired)
+
+    def get_user(self, nickname):
+        row = self._conn().execute("SELECT * FROM users WHERE nickname = ?", (nickname,)).fetchone()
+        if row is None:
+            return None
+        user = {column: row[column] for column in USER_COLUMNS}
+        user["is_admin"] = bool(user["is_admin"])
+        return user
+
+    def touch_user(self, nickname, now):
+        """Cập nhật last_login của user"""
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE users SET last_login = ? WHERE nickname = ?", (now.isoformat(), nickname)
+            ).rowcount > 0
+
+# =============================================================================
+# KEY INDEX
+# =============================================================================
+
+class KeyIndex:
+    """Index trong bộ nhớ từ chuỗi key -> key_id, rebuild lười khi version của store đổi
+
+    Các lần ghi đi qua index (add/claim/remove_expired) được áp thẳng vào index,
+    nên chỉ thay đổi từ process khác mới làm index phải load lại toàn bộ key.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._version = object()
+        self._keys = {}
+        self._by_key = {}
+
+    def _after_write(self):
+        # Ghi của chính index đã áp vào bộ nhớ; nếu process khác ghi xen giữa thì để lần sau load lại
+        before, after = self.store.last_write("keys")
+        if before == self._version:
+            self._version = after
+
+    def _refresh(self):
+        version = self.store.keys_version()
+        if version != self._version:
+            self._keys = self.store.list_keys()
+            self._by_key = {key_data.get("key"): key_id for key_id, key_data in self._keys.items()}
+            self._version = version
+
+    def find(self, access_key):
+        """Tìm key theo chuỗi key; trả về (key_id, key_data) hoặc (None, None)"""
+        with self._lock:
+            self._refresh()
+            key_id = self._by_key.get(access_key)
+            if key_id is None:
+                return None, None
+            return key_id, dict(self._keys[key_id])
+
+    def all(self):
+        with self._lock:
+            self._refresh()
+            return {key_id: dict(key_data) for key_id, key_data in self._keys.items()}
+
+    def add(self, key_id, key_data):
+        with self._lock:
+            self._refresh()
+            if not self.store.save_key(key_id, key_data):
+                return False
+            self._keys[key_id] = dict(key_data)
+            self._by_key[key_data["key"]] = key_id
+            self._after_write()
+            return True
+
+    def claim(self, key_id, nickname, now):
+        """Gán key chưa dùng cho nickname (xem store.claim_key)"""
+        with self._lock:
+            self._refresh()
+            if not self.store.claim_key(key_id, nickname, now):
+                return False
+            self._keys[key_id].update(used_by=nickname, used_at=now.isoformat())
+            self._after_write()
+            return True
+
+    def remove_expired(self, now):
+        """Xóa key hết hạn khỏi store và index; trả về số key đã xóa"""
+        with self._lock:
+            self._refresh()
+            count = self.store.delete_expired_keys(now)
+            for key_id in [k for k, key_data in self._keys.items() if _is_expired(key_data, now)]:
+                self._by_key.pop(self._keys.pop(key_id).get("key"), None)
+            if count:
+                self._after_write()
+            return count
+
+# =============================================================================
+# COOLDOWN INDEX
+# =============================================================================
+
+def _near(a, b, tolerance):
+    return abs(a - b) <= tolerance
+
+class CooldownIndex:
+    """Lần phát signal gần nhất theo (coin, combo_name, direction), để scanner bỏ signal lặp
+
+    Trước khi ghi, add_signals bỏ (1) signal trùng gần như y hệt (entry/SL/TP lệch không quá
+    `tolerance` × entry) với signal của combo khác cùng coin, interval, direction trong cùng
+    lô - một lô scan chỉ có một nến cuối cho mỗi (coin, interval) nên đó là cùng một nến; và
+    (2) signal có cùng key đã phát trong `cooldown` gần nhất. Mỗi lần kiểm tra là O(1).
+
+    Store chính là bản lưu bền: index dựng lại từ các signal trong cửa sổ cooldown khi mới
+    chạy (nên restart không làm phát lại) và khi process khác ghi signals, như KeyIndex.
+    """
+
+    def __init__(self, store, cooldown, tolerance=0.0):
+        self.store = store
+        self.cooldown = cooldown
+        self.tolerance = tolerance
+        self._lock = threading.Lock()
+        self._version = object()
+        self._last = {}  # (coin, combo_name, direction) -> datetime phát gần nhất
+
+    @staticmethod
+    def _key(signal):
+        return signal["coin"], signal["combo_name"], signal["direction"]
+
+    def _record(self, signal):
+        key, emitted = self._key(signal), datetime.fromisoformat(signal["timestamp"])
+        if key not in self._last or emitted > self._last[key]:
+            self._last[key] = emitted
+
+    def _refresh(self, now):
+        version = self.store.signals_version()
+        if version != self._version:
+            self._last = {}
+            # Chỉ signal tạo (hoặc cập nhật) trong cửa sổ cooldown mới có thể chặn signal mới
+            for signal in self.store.list_signals(since=(now - self.cooldown).isoformat()):
+                self._record(signal)
+            self._version = version
+
+    def _after_write(self):
+        # Như KeyIndex._after_write
+        before, after = self.store.last_write("signals")
+        if before == self._version:
+            self._version = after
+
+    def _duplicate(self, signal, same_bar):
+        tolerance = self.tolerance * abs(signal["entry"])
+        return any(all(_near(other[field], signal[field], tolerance) for field in ("entry", "sl", "tp"))
+                   for other in same_bar)
+
+    def add_signals(self, signals, now=None):
+        """Lưu các signal không bị trùng/cooldown; trả về (đã lưu, [(signal bị bỏ, "duplicate"|"cooldown")])"""
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            self._refresh(now)
+            kept, suppressed, bars = [], [], {}
+            for signal in signals:
+                # So với mọi signal trước trên cùng nến, kể cả signal bị cooldown: bản trùng của nó
+                # cũng là signal đã phát (vd. scanner restart đánh giá lại nến cuối)
+                same_bar = bars.setdefault((signal["coin"], signal.get("interval"), signal["direction"]), [])
+                duplicate = self._duplicate(signal, same_bar)
+                same_bar.append(signal)
+                if duplicate:
+                    suppressed.append((signal, "duplicate"))
+                    continue
+                last = self._last.get(self._key(signal))
+                if last is not None and datetime.fromisoformat(signal["timestamp"]) - last < self.cooldown:
+                    suppressed.append((signal, "cooldown"))
+                    continue
+                kept.append(signal)
+                # Ghi nhận ngay để signal cùng key phía sau trong lô (interval khác) cũng bị chặn
+                self._record(signal)
+            if kept:
+                if not self.store.add_signals(kept):
+                    self._version = object()
+                    return [], suppressed
+                self._after_write()
+            return kept, suppressed
+
+# =============================================================================
+# STATS AGGREGATOR
+# =============================================================================
+
+# Kết quả của signal đã đóng; thứ tự = vị trí trong bucket ngày [wins, losses, expired].
+# Như backtest.summarize, expired không tính vào win rate
+RESULTS = ("win", "loss", "expired")
+
+def signal_result(signal):
+    """Kết quả theo outcome từ giá nếu có, nếu không thì "win" khi vote win nhiều hơn vote lose"""
+    if signal.get("outcome"):
+        return signal["outcome"] if signal["outcome"] in RESULTS else "loss"
+    return "win" if signal.get("votes_win", 0) > signal.get("votes_lose", 0) else "loss"
+
+def _win_rate(wins, total):
+    return round((wins / total) * 100, 1) if total else 0
+
+def _stamp(signal):
+    return signal.get("updated_at") or signal["timestamp"]
+
+# Khi process khác ghi, đọc lại signals tạo/cập nhật từ (mốc mới nhất đã thấy - cửa sổ này):
+# bù lô signal ghi chậm hơn timestamp của nó và lệch đồng hồ giữa các process (như RELAY_LOOKBACK)
+STATS_LOOKBACK = timedelta(minutes=10)
+
+class StatsAggregator:
+    """Bộ đếm thống kê signals cập nhật theo sự kiện tạo/đóng signal
+
+    Signal đã đóng được gom theo ngày (UTC) của closed_at; thống kê tuần/tháng
+    là tổng tối đa 31 bucket ngày nên /api/stats không phải quét lại lịch sử.
+    Win rate chỉ tính trên signal thắng/thua; signal expired được đếm riêng.
+    Giống KeyIndex: ghi đi qua aggregator được áp thẳng vào bộ đếm. Ghi từ process khác
+    (version của store đổi) chỉ đọc các signal tạo/cập nhật kể từ lần trước
+    (list_signals(since=...)) và điều chỉnh bộ đếm theo trạng thái mới của từng signal.
+    Ghi mang mốc cũ hơn STATS_LOOKBACK (vd. nạp lịch sử) cần rebuild().
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._version = object()
+        self._reset()
+
+    def _reset(self):
+        self._total = 0
+        self._results = [0, 0, 0]  # wins, losses, expired
+        self._active = set()  # id các signal đang active
+        self._closed = {}     # signal_id -> (ngày đóng, vị trí kết quả trong RESULTS)
+        self._days = {}       # ngày đóng -> [wins, losses, expired]
+        self._seen = set()    # id các signal đã đếm
+        self._latest = None   # updated_at/timestamp mới nhất đã thấy
+
+    def _add_closed(self, signal):
+        closed_at = datetime.fromisoformat(signal.get("closed_at") or signal["timestamp"])
+        day = closed_at.astimezone(timezone.utc).date()
+        result = RESULTS.index(signal_result(signal))
+        self._closed[signal["id"]] = (day, result)
+        self._days.setdefault(day, [0, 0, 0])[result] += 1
+        self._results[result] += 1
+
+    def _remove_closed(self, signal_id):
+        day, result = self._closed.pop(signal_id)
+        self._days[day][result] -= 1
+        self._results[result] -= 1
+
+    def _apply(self, signal):
+        """Đưa bộ đếm về trạng thái hiện tại của `signal` (mới hoặc đã đếm); áp lại không đổi kết quả"""
+        signal_id = signal["id"]
+        if signal_id in self._closed:
+            self._remove_closed(signal_id)
+        elif signal_id not in self._seen:
+            self._seen.add(signal_id)
+            self._total += 1
+        self._active.discard(signal_id)
+        status = signal.get("status", "active")
+        if status == "active":
+            self._active.add(signal_id)
+        elif status == "closed":
+            self._add_closed(signal)
+        stamp = _stamp(signal)
+        if self._latest is None or stamp > self._latest:
+            self._latest = stamp
+
+    def _catch_up(self):
+        """Áp các signal tạo/cập nhật từ (mốc mới nhất đã thấy - STATS_LOOKBACK); lần đầu là toàn bộ
+
+        Áp lại cả signal có mốc không đổi: vote mang thời điểm của vote nên hai lần ghi có thể
+        cùng updated_at; _apply áp lại không đổi kết quả.
+        """
+        since = None
+        if self._latest is not None:
+            since = (datetime.fromisoformat(self._latest) - STATS_LOOKBACK).isoformat()
+        for signal in self.store.list_signals(since=since):
+            self._apply(signal)
+
+    def _refresh(self):
+        # Đọc version trước khi đọc signals: ghi xen giữa chỉ làm lần sau đọc lại thêm một lần
+        version = self.store.signals_version()
+        if version != self._version:
+            self._catch_up()
+            self._version = version
+
+    def _after_write(self):
+        # Như KeyIndex._after_write
+        before, after = self.store.last_write("signals")
+        if before == self._version:
+            self._version = after
+
+    def rebuild(self):
+        """Tính lại toàn bộ bộ đếm từ lịch sử signals trong store"""
+        with self._lock:
+            version = self.store.signals_version()
+            self._reset()
+            self._catch_up()
+            self._version = version
+            return self._total
+
+    def add_signals(self, signals):
+        """Lưu signals mới vào store và cộng vào bộ đếm"""
+        with self._lock:
+            self._refresh()
+            if not self.store.add_signals(signals):
+                return False
+            for signal in signals:
+                if signal["id"] not in self._seen:
+                    self._apply(signal)
+            self._after_write()
+            return True
+
+    def record_vote(self, signal_id, voter, vote_type, close_after, now):
+        """Ghi vote qua store.record_vote và cập nhật bucket nếu signal đã/vừa đóng"""
+        return self.record_votes([(signal_id, voter, vote_type, now)], close_after)[0]
+
+    def record_votes(self, votes, close_after):
+        """Ghi một lô vote qua store.record_votes; trả về [(signal, lỗi)] như store"""
+        with self._lock:
+            self._refresh()
+            results = self.store.record_votes(votes, close_after)
+            # Trạng thái sau cả lô của mỗi signal có vote được ghi (vote vào signal đã đóng
+            # có thể đổi thắng/thua)
+            voted = {signal["id"]: signal for signal, error in results if error is None}
+            for signal in voted.values():
+                self._apply(signal)
+            if voted:
+                self._after_write()
+            return results
+
+    def close_signals(self, closed):
+        """Đóng một lô signal qua store.close_signals và cộng vào bucket ngày đóng"""
+        with self._lock:
+            self._refresh()
+            applied = set(self.store.close_signals(closed))
+            for signal in closed:
+                if signal["id"] in applied and signal["id"] not in self._closed:
+                    # `closed` có thể chỉ gồm các trường được cập nhật: đọc lại bản ghi
+                    # đầy đủ (cũng lấy đúng updated_at store vừa ghi)
+                    self._apply(self.store.get_signal(signal["id"]))
+            if applied:
+                self._after_write()
+            return len(applied)
+
+    def _period(self, start, today):
+        wins = losses = expired = 0
+        day = start
+        while day <= today:
+            bucket = self._days.get(day)
+            if bucket:
+                wins += bucket[0]
+                losses += bucket[1]
+                expired += bucket[2]
+            day += timedelta(days=1)
+        return {
+            "total": wins + losses + expired,
+            "wins": wins,
+            "losses": losses,
+            "expired": expired,
+            "win_rate": _win_rate(wins, wins + losses)
+        }
+
+    def snapshot(self, now=None):
+        """Thống kê cho /api/stats: tổng số, win rate và các kỳ hôm nay/tuần/tháng (UTC)"""
+        today = (now or datetime.now(timezone.utc)).astimezone(timezone.utc).date()
+        with self._lock:
+            self._refresh()
+            wins, losses, expired = self._results
+            return {
+                "total_signals": self._total,
+                "active_signals": len(self._active),
+                "closed_signals": len(self._closed),
+                "expired_signals": expired,
+                "win_rate": _win_rate(wins, wins + losses),
+                "today_stats": self._period(today, today),
+                "week_stats": self._period(today - timedelta(days=today.weekday()), today),
+                "month_stats": self._period(today.replace(day=1), today)
+            }
+
+# =============================================================================
+# VOTE BUFFER
+# =============================================================================
+
+# Vote tới trong cửa sổ này (tính từ vote đầu tiên đang chờ) được ghi chung một lô
+VOTE_FLUSH_INTERVAL = 0.2
+
+class VoteBuffer:
+    """Group commit cho vote: các vote tới cùng lúc được ghi chung một transaction
+
+    vote() xếp vote vào hàng đợi rồi chờ lô chứa nó được ghi: thread nền gom mọi vote tới
+    trong `interval` giây và ghi bằng một lần stats.record_votes (một transaction SQLite /
+    một event journal). Kết quả trả về là của store, nên vote đã trả lời là đã nằm trong
+    store, vote trùng giữa các worker và ngưỡng đóng signal được quyết định trong lúc ghi.
+
+    Map signal_id -> set voter (voter trong store + vote đã nhận ở process này) chỉ để trả
+    'already_voted' ngay mà không phải chờ lô. Như KeyIndex, ghi của process khác (version
+    đổi) làm map load lại từ store.
+    """
+
+    def __init__(self, stats, close_after, interval=VOTE_FLUSH_INTERVAL):
+        self.stats = stats
+        self.store = stats.store
+        self.close_after = close_after
+        self.interval = interval
+        self._lock = threading.Lock()         # map + hàng đợi
+        self._flush_lock = threading.Lock()   # mỗi lúc chỉ một lô được ghi
+        self._version = object()
+        self._voters = {}
+        self._pending = []   # ((signal_id, voter, vote_type, now), Future) chưa ghi
+        self._wake = threading.Event()
+        self._thread = None
+
+    def _refresh(self):
+        version = self.store.signals_version()
+        if version != self._version:
+            self._voters = {}
+            self._version = version
+
+    def _after_write(self):
+        # Như KeyIndex._after_write
+        before, after = self.store.last_write("signals")
+        if before == self._version:
+            self._version = after
+
+    def _voters_of(self, signal_id):
+        """Set voter của signal (load từ store lần đầu); None nếu signal không tồn tại"""
+        voters = self._voters.get(signal_id)
+        if voters is None and self.store.get_signal(signal_id) is not None:
+            voters = self._voters[signal_id] = set(self.store.list_voters(signal_id))
+        return voters
+
+    def vote(self, signal_id, voter, vote_type, now):
+        """Ghi một vote trong lô kế tiếp; trả về (signal, lỗi) của store như store.record_vote"""
+        with self._lock:
+            self._refresh()
+            voters = self._voters_of(signal_id)
+            if voters is None:
+                return None, "not_found"
+            if voter in voters:
+                return self.store.get_signal(signal_id), "already_voted"
+            voters.add(voter)
+            result = Future()
+            self._pending.append(((signal_id, voter, vote_type, now), result))
+            self._start()
+        self._wake.set()
+        return result.result()
+
+    def flush(self):
+        """Ghi ngay mọi vote đang chờ; trả về số vote đã gửi xuống store"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                results = self.stats.record_votes([vote for vote, _ in batch], self.close_after)
+            except Exception as e:
+                logger.error(f"❌ Lỗi ghi lô {len(batch)} vote: {e}")
+                with self._lock:
+                    for (signal_id, *_), _ in batch:
+                        self._voters.pop(signal_id, None)
+                for _, result in batch:
+                    result.set_exception(e)
+                return 0
+            with self._lock:
+                for ((signal_id, *_), _), (signal, error) in zip(batch, results):
+                    if error == "not_found":
+                        self._voters.pop(signal_id, None)
+                if any(error is None for _, error in results):
+                    self._after_write()
+            for (_, result), outcome in zip(batch, results):
+                result.set_result(outcome)
+            return len(batch)
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="votes", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            # Gom các vote tới trong cửa sổ này vào cùng một lô
+            time.sleep(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"❌ Lỗi flush vote: {e}")
+
+# =============================================================================
+# FACTORY
+# =============================================================================
+
+def create_store(backend, db_path, data_file, keys_file, users_file):
+    """Tạo storage backend theo cấu hình STORAGE_BACKEND ('sqlite' hoặc 'json')"""
+    if backend == "json":
+        return JsonStore(data_file, keys_file, users_file)
+    if backend == "sqlite":
+        return SqliteStore(db_path, data_file, keys_file, users_file)
+    raise ValueError(f"Unknown storage backend: {backend}")
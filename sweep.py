@@ -0,0 +1,416 @@
+# trading-signals-website/sweep.py
+
+"""Quét lưới tham số của các rule (rules.py) và 18 combo có sẵn (engine.py) trên nến lịch sử,
+xếp hạng theo expectancy và win rate
+
+    python sweep.py sweep.json --start 2023-01-01 --end 2024-01-01 --interval 15m 1h --workers 4
+
+File sweep có dạng file rule, thêm "grid" cho từng rule cần quét (rule không có grid chạy
+đúng một điểm với params của nó). Combo có sẵn nằm trong "combos", tham số là các tham số
+keyword của hàm *_series tương ứng (SQUEEZE_THRESHOLD là "squeeze", hệ số ATR của SL/TP là
+"sl_atr"/"tp_atr", ...); tham số không có trong grid/params giữ giá trị live:
+
+    {
+      "params": {"rr": 2.0},
+      "rules": [
+        {
+          "name": "Squeeze Breakout",
+          "when": ["bb_width < squeeze", "close > bb_upper", "volume > volume_ma20 * vol_spike"],
+          "sl": "bb_middle", "tp": "close + rr * atr",
+          "grid": {"squeeze": [0.01, 0.015, 0.02], "vol_spike": [1.2, 1.5, 1.8], "rr": [1.5, 2, 3]}
+        }
+      ],
+      "combos": [
+        {
+          "combo": "combo1_fvg_squeeze_pro",
+          "grid": {"squeeze": [0.015, 0.02, 0.025], "tp_atr": [2.5, 3.0, 3.5], "cooldown_minutes": [0, 30, 60]}
+        }
+      ]
+    }
+
+"cooldown_minutes" quét được cho cả rule lẫn combo: bỏ tín hiệu cùng hướng trong N phút sau
+tín hiệu đã giữ, như COOLDOWN_MINUTES của scanner (mặc định 0: không cooldown, giống backtest).
+SIGNAL_DEDUP_TOLERANCE không quét: nó bỏ tín hiệu trùng giữa các combo khác nhau trên cùng nến,
+còn sweep chạy từng rule/combo riêng nên không có gì để bỏ.
+
+Indicators của mỗi (symbol, interval) chỉ tính một lần mỗi worker rồi dùng chung cho mọi
+điểm lưới (tham số của rule không đổi indicators). Mỗi task là một nhóm CHUNK_SIZE điểm:
+các điểm trong nhóm biên dịch thành một RuleSet nên phần biểu thức không phụ thuộc tham số
+quét chỉ tính một lần; điểm của combo dùng chung một Features (cache của engine). Kết quả từng task được nối vào file checkpoint (JSON lines), chạy
+lại cùng lệnh thì bỏ qua các điểm đã xong.
+"""
+
+import os
+import sys
+import json
+import time
+import inspect
+import hashlib
+import logging
+import argparse
+import itertools
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+import numpy as np
+
+from config import COINS, INTERVAL, HISTORY_DIR
+from engine import COMBO_SERIES, features
+from backtest import DEFAULT_HORIZON, _to_ms, download_histories, load_frame, simulate_trades
+from rules import compile_rules, load_rules_file
+
+logger = logging.getLogger("sweep")
+
+# Số điểm lưới mỗi task: lớn thì chia sẻ biểu thức nhiều hơn nhưng tốn RAM (mỗi node là một mảng cả lịch sử)
+CHUNK_SIZE = 100
+# Số frame indicators giữ lại trong mỗi worker
+FRAME_CACHE_SIZE = 4
+# Số lệnh tối thiểu để một điểm được xếp hạng
+DEFAULT_MIN_TRADES = 30
+DEFAULT_OUTPUT = "sweep_results.json"
+# Các trường cộng dồn được giữa symbol/interval (đủ để tính win rate, expectancy, R:R)
+TALLY_FIELDS = ("trades", "wins", "losses", "total_r", "sum_rr")
+# Combo có sẵn theo tên hàm bỏ hậu tố "_series" (vd. "combo1_fvg_squeeze_pro")
+COMBO_FUNCTIONS = {fn.__name__[:-len("_series")]: fn for fn in COMBO_SERIES}
+# Tham số sweep áp lên tín hiệu của mọi rule/combo, không truyền vào rule/combo
+COOLDOWN_PARAM = "cooldown_minutes"
+
+# =============================================================================
+# GRID
+# =============================================================================
+
+def grid_points(spec, defaults):
+    """Mọi tổ hợp của spec["grid"] -> [(key, params)], key là params dạng JSON (ổn định khi resume)"""
+    base = dict(defaults, **spec.get("params", {}))
+    grid = spec.get("grid", {})
+    names = sorted(grid)
+    points = []
+    for values in itertools.product(*(grid[name] if isinstance(grid[name], list) else [grid[name]] for name in names)):
+        params = dict(base, **dict(zip(names, values)))
+        points.append((json.dumps(dict(zip(names, values)), sort_keys=True), params))
+    return points
+
+def combo_defaults(combo):
+    """Tham số keyword của một combo có sẵn kèm giá trị live; ValueError nếu không có combo này"""
+    fn = COMBO_FUNCTIONS.get(combo)
+    if fn is None:
+        raise ValueError(f"Không có combo '{combo}' (có: {', '.join(COMBO_FUNCTIONS)})")
+    return {name: param.default for name, param in list(inspect.signature(fn).parameters.items())[1:]}
+
+def combo_spec(spec):
+    """Chuẩn hóa một mục của "combos": kiểm tra tên combo/tham số, name mặc định là tên combo"""
+    if "combo" not in spec:
+        raise ValueError(f"Mục combos thiếu 'combo': {spec}")
+    known = set(combo_defaults(spec["combo"])) | {COOLDOWN_PARAM}
+    unknown = (set(spec.get("params", {})) | set(spec.get("grid", {}))) - known
+    if unknown:
+        raise ValueError(f"{spec['combo']}: không có tham số {', '.join(sorted(unknown))}")
+    return dict(spec, name=spec.get("name", spec["combo"]))
+
+def spec_defaults(spec, defaults):
+    """Giá trị mặc định của tham số: params chung của file cho rule, giá trị live cho combo"""
+    return combo_defaults(spec["combo"]) if "combo" in spec else defaults
+
+def _without_cooldown(params):
+    return {name: value for name, value in params.items() if name != COOLDOWN_PARAM}
+
+def rule_hash(spec, defaults):
+    """Đổi khi điều kiện/SL/TP của rule đổi, để checkpoint cũ không bị dùng nhầm"""
+    body = {key: value for key, value in spec.items() if key not in ("grid", "variants", "description")}
+    payload = json.dumps([body, defaults], sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+# =============================================================================
+# WORKER
+# =============================================================================
+
+# (symbol, interval, start_ms, end_ms, history_dir) -> (df, close_times, high, low, close, start) của worker này
+_frames = OrderedDict()
+
+def _frame(symbol, interval, start_ms, end_ms, history_dir):
+    key = (symbol, interval, start_ms, end_ms, history_dir)
+    if key in _frames:
+        _frames.move_to_end(key)
+        return _frames[key]
+    loaded = load_frame(symbol, interval, start_ms, end_ms, history_dir)
+    if loaded is not None:
+        df, close_times, start = loaded
+        high, low, close = (df[column].to_numpy(dtype=float) for column in ("high", "low", "close"))
+        loaded = (df, close_times, high, low, close, start)
+    _frames[key] = loaded
+    if len(_frames) > FRAME_CACHE_SIZE:
+        _frames.popitem(last=False)
+    return loaded
+
+def _tally(trades):
+    outcome = trades["outcome"]
+    return {
+        "trades": int(len(outcome)),
+        "wins": int((outcome == 1).sum()),
+        "losses": int((outcome == -1).sum()),
+        "total_r": float(np.sum(trades["r"])),
+        "sum_rr": float(np.sum(trades["rr"]))
+    }
+
+def _cooldown(series, close_times, minutes):
+    """Bỏ tín hiệu cùng hướng trong `minutes` phút sau tín hiệu đã giữ gần nhất (như CooldownIndex)"""
+    if not minutes:
+        return series
+    signal, window, last = series.signal.copy(), minutes * 60_000, {}
+    for index in np.flatnonzero(signal):
+        direction = signal[index]
+        if direction in last and close_times[index] - last[direction] < window:
+            signal[index] = 0
+        else:
+            last[direction] = close_times[index]
+    return series._replace(signal=signal)
+
+def sweep_task(spec, defaults, points, symbol, interval, start_ms, end_ms, horizon, history_dir):
+    """Chạy một nhóm điểm lưới của một rule/combo trên một (symbol, interval); trả về {key: tally}
+
+    None khi không đủ lịch sử (load_frame trả None): task không được ghi vào checkpoint để
+    lần chạy sau (vd. sau khi tải thêm lịch sử) thử lại.
+    """
+    loaded = _frame(symbol, interval, start_ms, end_ms, history_dir)
+    if loaded is None:
+        return None
+    df, close_times, high, low, close, start = loaded
+    empty = {field: 0 for field in TALLY_FIELDS}
+    results = {key: dict(empty) for key, _ in points}
+
+    if "combo" in spec:
+        fn, frame = COMBO_FUNCTIONS[spec["combo"]], features(df)
+        evaluated = [(key, params, fn(frame, **_without_cooldown(params))) for key, params in points]
+    else:
+        # Mỗi điểm là một rule tên = key: biên dịch chung để các điểm dùng chung biểu thức con
+        rule_set = compile_rules({"rules": [
+            dict(spec, name=key, params=_without_cooldown(params), variants=[], enabled=True)
+            for key, params in points
+        ]})
+        by_key = dict(points)
+        evaluated = [(series.long_name, by_key[series.long_name], series)
+                     for series in rule_set.evaluate(df, interval)]
+    for key, params, series in evaluated:
+        series = _cooldown(series, close_times, params.get(COOLDOWN_PARAM))
+        results[key] = _tally(simulate_trades(series, high, low, close, horizon, start))
+    return results
+
+# =============================================================================
+# CHECKPOINT
+# =============================================================================
+
+def read_checkpoint(path, run):
+    """{(rule_hash, symbol, interval, key): tally} đã xong; ValueError nếu file của lần sweep khác"""
+    done = {}
+    if not path or not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Dòng cuối ghi dở khi bị dừng giữa chừng
+                logger.warning(f"⚠️ Bỏ dòng {number + 1} hỏng trong {path}")
+                continue
+            if number == 0:
+                if record.get("run") != run:
+                    raise ValueError(f"{path} là checkpoint của lần sweep khác ({record.get('run')}), "
+                                     f"xóa file hoặc dùng --checkpoint khác")
+                continue
+            for key, tally in record["results"].items():
+                done[(record["rule"], record["symbol"], record["interval"], key)] = tally
+    return done
+
+class Checkpoint:
+    """Nối kết quả từng task vào file JSON lines (dòng đầu là thông số của lần sweep)"""
+
+    def __init__(self, path, run):
+        self.path = path
+        self._file = None
+        if path:
+            new = not os.path.exists(path) or os.path.getsize(path) == 0
+            if not new:
+                # Bỏ dòng cuối ghi dở (bị dừng giữa lúc ghi) để dòng mới không dính vào nó
+                with open(path, "rb+") as f:
+                    f.truncate(f.read().rfind(b"\n") + 1)
+            self._file = open(path, "a", encoding="utf-8")
+            if new:
+                self._write({"run": run})
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def add(self, rule, symbol, interval, results):
+        if self._file is not None:
+            self._write({"rule": rule, "symbol": symbol, "interval": interval, "results": results})
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+# =============================================================================
+# RUNNER
+# =============================================================================
+
+def rank(points, tallies, min_trades):
+    """Tổng hợp tally mọi symbol/interval của từng điểm, xếp theo expectancy rồi win rate"""
+    ranked = []
+    for key, params in points:
+        total = {field: sum(t[field] for t in tallies[key]) for field in TALLY_FIELDS}
+        decided = total["wins"] + total["losses"]
+        ranked.append({
+            "params": json.loads(key),
+            "trades": total["trades"],
+            "win_rate": round(total["wins"] / decided * 100, 1) if decided else 0,
+            "expectancy_r": round(total["total_r"] / total["trades"], 3) if total["trades"] else 0,
+            "total_r": round(total["total_r"], 2),
+            "avg_rr": round(total["sum_rr"] / total["trades"], 2) if total["trades"] else 0,
+            "ranked": total["trades"] >= min_trades
+        })
+    ranked.sort(key=lambda r: (r["ranked"], r["expectancy_r"], r["win_rate"]), reverse=True)
+    return ranked
+
+def run_sweep(config, symbols, intervals, start, end, horizon=DEFAULT_HORIZON, workers=None,
+              history_dir=HISTORY_DIR, checkpoint=None, output=DEFAULT_OUTPUT, chunk_size=CHUNK_SIZE,
+              min_trades=DEFAULT_MIN_TRADES, download=True):
+    """Quét lưới mọi rule/combo của `config` trên symbols × intervals, ghi bảng xếp hạng ra `output`"""
+    started = time.time()
+    start_ms, end_ms = _to_ms(start), _to_ms(end)
+    defaults = config.get("params", {})
+    specs = [spec for spec in config.get("rules", []) if spec.get("enabled", True)]
+    # Biên dịch thử điểm đầu của mỗi rule: lỗi cú pháp báo ngay, không phải sau khi tải lịch sử
+    for spec in specs:
+        params = _without_cooldown(grid_points(spec, defaults)[0][1])
+        compile_rules({"rules": [dict(spec, params=params, variants=[])]})
+    specs += [combo_spec(spec) for spec in config.get("combos", []) if spec.get("enabled", True)]
+
+    run = {"start": start, "end": end, "horizon": horizon, "history_dir": history_dir}
+    done = read_checkpoint(checkpoint, run)
+    skipped = set()  # (symbol, interval) tải lịch sử lỗi: bỏ khỏi sweep thay vì chạy trên lịch sử thiếu
+    if download:
+        for interval in intervals:
+            complete = set(download_histories(symbols, interval, start_ms, end_ms, history_dir))
+            skipped.update((symbol, interval) for symbol in symbols if symbol not in complete)
+        if len(skipped) == len(symbols) * len(intervals):
+            raise RuntimeError("Không tải được lịch sử của symbol nào")
+    downloaded = time.time()
+
+    # Task theo thứ tự (rule, symbol, interval) để các nhóm liền nhau của cùng một frame
+    # thường rơi vào worker đã có sẵn indicators của frame đó
+    tasks, tallies, grids = [], {}, {}
+    for spec in specs:
+        spec_params = spec_defaults(spec, defaults)
+        name, digest = spec["name"], rule_hash(spec, spec_params)
+        points = grids[name] = grid_points(spec, spec_params)
+        tallies[name] = {key: [] for key, _ in points}
+        for symbol in symbols:
+            for interval in intervals:
+                if (symbol, interval) in skipped:
+                    continue
+                todo = []
+                for key, params in points:
+                    tally = done.get((digest, symbol, interval, key))
+                    if tally is None:
+                        todo.append((key, params))
+                    else:
+                        tallies[name][key].append(tally)
+                for chunk in _chunks(todo, chunk_size):
+                    tasks.append((name, digest, spec, spec_params, chunk, symbol, interval))
+    frames = len(symbols) * len(intervals) - len(skipped)
+    total_points = sum(len(points) for points in grids.values()) * frames
+    logger.info(f"🧮 Sweep {len(specs)} rule/combo, {total_points} điểm × symbol × interval: "
+                f"{len(done)} đã có trong checkpoint, {len(tasks)} task")
+
+    journal = Checkpoint(checkpoint, run)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(sweep_task, spec, spec_params, chunk, symbol, interval,
+                                start_ms, end_ms, horizon, history_dir): (name, digest, symbol, interval)
+                for name, digest, spec, spec_params, chunk, symbol, interval in tasks
+            }
+            for finished, future in enumerate(as_completed(futures), 1):
+                name, digest, symbol, interval = futures[future]
+                results = future.result()
+                if results is None:
+                    if (symbol, interval) not in skipped:
+                        skipped.add((symbol, interval))
+                        logger.warning(f"⚠️ {symbol} {interval}: không đủ lịch sử, bỏ khỏi sweep")
+                else:
+                    journal.add(digest, symbol, interval, results)
+                    for key, tally in results.items():
+                        tallies[name][key].append(tally)
+                if finished % max(1, len(futures) // 20) == 0 or finished == len(futures):
+                    logger.info(f"⏳ {finished}/{len(futures)} task ({time.time() - downloaded:.1f}s)")
+    finally:
+        journal.close()
+
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "intervals": list(intervals),
+        "start": start,
+        "end": end,
+        "horizon": horizon,
+        "symbols": list(symbols),
+        "skipped": sorted([symbol, interval] for symbol, interval in skipped),
+        "min_trades": min_trades,
+        "rules": {name: rank(points, tallies[name], min_trades) for name, points in grids.items()}
+    }
+    if output:
+        with open(f"{output}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        os.replace(f"{output}.tmp", output)
+
+    logger.info(f"✅ Sweep xong: tải lịch sử {downloaded - started:.1f}s, tổng {time.time() - started:.1f}s")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Quét lưới tham số rule DSL (rules.py) và combo có sẵn (engine.py) trên nến lịch sử Binance",
+        epilog="Combo có sẵn khai báo trong 'combos' của file spec, tham số là tham số keyword của "
+               "hàm *_series trong engine.py (squeeze, vol_spike, sl_atr, tp_atr, ...). "
+               "'cooldown_minutes' quét được cho mọi rule/combo (COOLDOWN_MINUTES của scanner); "
+               "SIGNAL_DEDUP_TOLERANCE chỉ bỏ trùng giữa các combo khác nhau nên không quét."
+    )
+    parser.add_argument("spec", help="file rule DSL (JSON/YAML) có 'grid' cho các rule/combo cần quét")
+    parser.add_argument("--symbols", nargs="+", default=COINS)
+    parser.add_argument("--interval", nargs="+", default=[INTERVAL])
+    parser.add_argument("--start", required=True, help="YYYY-MM-DD (UTC)")
+    parser.add_argument("--end", default=datetime.now(timezone.utc).strftime("%Y-%m-%d"))
+    parser.add_argument("--horizon", type=int, default=DEFAULT_HORIZON, help="số nến tối đa giữ lệnh")
+    parser.add_argument("--workers", type=int, default=None, help="số process")
+    parser.add_argument("--chunk", type=int, default=CHUNK_SIZE, help="số điểm lưới mỗi task")
+    parser.add_argument("--min-trades", type=int, default=DEFAULT_MIN_TRADES, help="số lệnh tối thiểu để xếp hạng")
+    parser.add_argument("--top", type=int, default=10, help="số điểm in ra cho mỗi rule")
+    parser.add_argument("--history-dir", default=HISTORY_DIR)
+    parser.add_argument("--checkpoint", help="file JSON lines để resume (mặc định <spec>.checkpoint)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--no-download", action="store_true", help="chỉ dùng lịch sử đã có trên đĩa")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    try:
+        config = load_rules_file(args.spec)
+        report = run_sweep(config, args.symbols, args.interval, args.start, args.end, args.horizon, args.workers,
+                           args.history_dir, args.checkpoint or f"{args.spec}.checkpoint", args.output,
+                           args.chunk, args.min_trades, download=not args.no_download)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+    for name, ranked in report["rules"].items():
+        print(f"\n{name} ({sum(r['ranked'] for r in ranked)}/{len(ranked)} điểm đủ {args.min_trades} lệnh)")
+        for r in ranked[:args.top]:
+            params = ", ".join(f"{k}={v}" for k, v in r["params"].items()) or "-"
+            print(f"  {params:40s} {r['trades']:6d} lệnh  win {r['win_rate']:5.1f}%  "
+                  f"E {r['expectancy_r']:+.3f}R  RR {r['avg_rr']:.2f}")
+
+if __name__ == "__main__":
+    main()
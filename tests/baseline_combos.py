@@ -0,0 +1,562 @@
+"""18 combo bản gốc (trước khi vector hóa): đánh giá từng nến bằng df.iloc[-1], chỉ dùng làm mốc so sánh
+
+Chép nguyên văn từ app.py trước khi combo chuyển sang engine.py dạng *_series; test_combos.py
+so từng nến với COMBO_SERIES.
+"""
+
+import logging
+
+from engine import SQUEEZE_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+def combo1_fvg_squeeze_pro(df):
+    """FVG Squeeze Pro"""
+    try:
+        last = df.iloc[-1]
+        prev = df.iloc[-2]
+        
+        squeeze = (last.bb_width < SQUEEZE_THRESHOLD and 
+                  last.bb_upper < last.kc_upper and 
+                  last.bb_lower > last.kc_lower)
+        breakout_up = last.close > last.bb_upper and prev.close <= prev.bb_upper
+        vol_spike = last.volume > last.volume_ma20 * 1.3
+        trend_up = last.close > last.ema200
+        rsi_ok = last.rsi14 < 68
+        
+        if squeeze and breakout_up and vol_spike and trend_up and rsi_ok:
+            entry = last.close
+            sl = entry - 1.5 * last.atr
+            tp = entry + 3.0 * last.atr
+            return "LONG", entry, sl, tp, "FVG Squeeze Pro"
+        
+        breakout_down = last.close < last.bb_lower and prev.close >= prev.bb_lower
+        if squeeze and breakout_down and vol_spike and last.close < last.ema200:
+            entry = last.close
+            sl = entry + 1.5 * last.atr
+            tp = entry - 3.0 * last.atr
+            return "SHORT", entry, sl, tp, "FVG Squeeze Pro"
+            
+    except Exception as e:
+        logger.error(f"Combo1 error: {e}")
+    
+    return None
+
+def combo2_macd_ob_retest(df):
+    """MACD Order Block Retest"""
+    try:
+        last = df.iloc[-1]
+        prev = df.iloc[-2]
+        
+        macd_cross_up = last.macd > last.macd_signal and prev.macd <= prev.macd_signal
+        price_above_ema200 = last.close > last.ema200
+        
+        ob_zone = None
+        if all(df["close"].iloc[-3:] > df["open"].iloc[-3:]):
+            ob_zone = df["low"].iloc[-5:-2].min()
+        
+        retest = ob_zone is not None and last.low <= ob_zone + last.atr * 0.5
+        vol_confirm = last.volume > df["volume"].mean() * 1.1
+        
+        if macd_cross_up and price_above_ema200 and retest and vol_confirm:
+            entry = last.close
+            sl = ob_zone - last.atr
+            tp = entry + 2.5 * last.atr
+            return "LONG", entry, sl, tp, "MACD Order Block Retest"
+            
+    except Exception as e:
+        logger.error(f"Combo2 error: {e}")
+    
+    return None
+
+def combo3_stop_hunt_squeeze(df):
+    """Stop Hunt Squeeze"""
+    try:
+        last = df.iloc[-1]
+        
+        squeeze = last.bb_width < SQUEEZE_THRESHOLD
+        stop_hunt = False
+        
+        if last.body > 0:
+            if last.close > last.open:
+                stop_hunt = (last.lower_wick / last.body > 2)
+            else:
+                stop_hunt = (last.upper_wick / last.body > 2)
+        
+        breakout_up = last.close > last.bb_upper
+        
+        if squeeze and stop_hunt and breakout_up:
+            entry = last.close
+            sl = last.low - last.atr
+            tp = entry + 2.8 * last.atr
+            return "LONG", entry, sl, tp, "Stop Hunt Squeeze"
+            
+    except Exception as e:
+        logger.error(f"Combo3 error: {e}")
+    
+    return None
+
+def combo4_fvg_ema_pullback(df):
+    """FVG EMA Pullback"""
+    try:
+        last = df.iloc[-1]
+        
+        fvg_bull_zones = df[df["fvg_bull"]]
+        fvg_pullback = False
+        
+        if not fvg_bull_zones.empty and df["fvg_bull"].iloc[-5:].any():
+            fvg_pullback = last.low <= fvg_bull_zones["high"].max()
+        
+        cross_up = last.ema8 > last.ema21 and df["ema8"].iloc[-2] <= df["ema21"].iloc[-2]
+        
+        if fvg_pullback and cross_up:
+            entry = last.close
+            sl = last.low - last.atr * 0.8
+            tp = entry + 2.0 * last.atr
+            return "LONG", entry, sl, tp, "FVG EMA Pullback"
+            
+    except Exception as e:
+        logger.error(f"Combo4 error: {e}")
+    
+    return None
+
+def combo5_fvg_macd_divergence(df):
+    """FVG + MACD Divergence"""
+    try:
+        last = df.iloc[-1]
+        
+        hist = df["macd_hist"]
+        low = df["low"]
+        
+        divergence = hist.iloc[-1] > hist.iloc[-3] and low.iloc[-1] < low.iloc[-3]
+        fvg = df["fvg_bull"].iloc[-8:].any()
+        rsi_ok = last.rsi14 < 30
+        
+        if divergence and fvg and rsi_ok:
+            entry = last.close
+            sl = low.iloc[-5:].min() - last.atr
+            tp = entry + 2.5 * last.atr
+            return "LONG", entry, sl, tp, "FVG + MACD Divergence"
+            
+    except Exception as e:
+        logger.error(f"Combo5 error: {e}")
+    
+    return None
+
+def combo6_ob_liquidity_grab(df):
+    """Order Block + Liquidity Grab"""
+    try:
+        last = df.iloc[-1]
+        
+        ob = df["low"].iloc[-6:-3].min()
+        liquidity_grab = (last.lower_wick / last.body > 2.5) if last.body > 0 else False
+        retest_ob = last.close > ob
+        macd_pos = last.macd_hist > 0
+        
+        if liquidity_grab and retest_ob and macd_pos:
+            entry = last.close
+            sl = last.low - last.atr
+            tp = entry + 1.8 * last.atr
+            return "LONG", entry, sl, tp, "Order Block + Liquidity Grab"
+            
+    except Exception as e:
+        logger.error(f"Combo6 error: {e}")
+    
+    return None
+
+def combo7_stop_hunt_fvg_retest(df):
+    """Stop Hunt + FVG Retest"""
+    try:
+        last = df.iloc[-1]
+        
+        stop_hunt = (last.lower_wick / last.body > 2) if last.body > 0 else False
+        fvg_after = df["fvg_bull"].iloc[-3:]
+        retest = (last.low <= df["high"].shift(1).max()) if fvg_after.any() else False
+        
+        if stop_hunt and fvg_after.any() and retest:
+            entry = last.close
+            sl = last.low - 0.5 * last.atr
+            tp = entry + 1.5 * last.atr
+            return "LONG", entry, sl, tp, "Stop Hunt + FVG Retest"
+            
+    except Exception as e:
+        logger.error(f"Combo7 error: {e}")
+    
+    return None
+
+def combo8_fvg_macd_hist_spike(df):
+    """FVG + MACD Hist Spike"""
+    try:
+        last = df.iloc[-1]
+        
+        if len(df) >= 5:
+            current_hist = df["macd_hist"].iloc[-3:].values
+            prev_hist = df["macd_hist"].iloc[-4:-1].values
+            if len(current_hist) == 3 and len(prev_hist) == 3:
+                hist_spike = (current_hist > prev_hist).all()
+            else:
+                hist_spike = False
+        else:
+            hist_spike = False
+            
+        fvg = df["fvg_bull"].iloc[-5:].any()
+        price_above_vwap = last.close > last.vwap
+        
+        if hist_spike and fvg and price_above_vwap:
+            entry = last.close
+            sl = last.low - last.atr
+            tp = entry + 2.5 * last.atr
+            return "LONG", entry, sl, tp, "FVG + MACD Hist Spike"
+            
+    except Exception as e:
+        logger.error(f"Combo8 error: {e}")
+    
+    return None
+
+def combo9_ob_fvg_confluence(df):
+    """OB + FVG Confluence"""
+    try:
+        last = df.iloc[-1]
+        
+        ob = df["low"].iloc[-10:-5].min()
+        fvg_bull_zones = df[df["fvg_bull"]]
+        fvg_zone = 0
+        
+        if not fvg_bull_zones.empty and df["fvg_bull"].iloc[-10:].any():
+            fvg_zone = fvg_bull_zones["high"].max()
+        
+        confluence = (abs(ob - fvg_zone) < last.atr * 0.5) if fvg_zone > 0 else False
+        engulfing = last.close > last.open and last.open < df["close"].iloc[-2]
+        volume_delta = last.volume > df["volume"].mean() * 1.5
+        
+        if confluence and engulfing and volume_delta:
+            entry = last.close
+            sl = min(ob, fvg_zone) - last.atr if fvg_zone > 0 else ob - last.atr
+            tp = entry + 2.0 * last.atr
+            return "LONG", entry, sl, tp, "OB + FVG Confluence"
+            
+    except Exception as e:
+        logger.error(f"Combo9 error: {e}")
+    
+    return None
+
+def combo10_smc_ultimate(df):
+    """SMC Ultimate"""
+    try:
+        last = df.iloc[-1]
+        
+        squeeze = last.bb_width < SQUEEZE_THRESHOLD
+        fvg = df["fvg_bull"].iloc[-5:].any()
+        macd_up = last.macd_hist > 0 and last.macd_hist > df["macd_hist"].iloc[-2]
+        liquidity = (last.lower_wick / last.body > 2) if last.body > 0 else False
+        ob_retest = last.low <= df["low"].iloc[-5:-2].min()
+        
+        if squeeze and fvg and macd_up and liquidity and ob_retest:
+            entry = last.close
+            sl = last.low - last.atr
+            tp = entry + 3.5 * last.atr
+            return "LONG", entry, sl, tp, "SMC Ultimate"
+            
+    except Exception as e:
+        logger.error(f"Combo10 error: {e}")
+    
+    return None
+
+def combo11_fvg_ob_liquidity_break(df):
+    """FVG + Order Block + Liquidity Break"""
+    try:
+        last = df.iloc[-1]
+        
+        # FVG bullish
+        fvg = last.fvg_bull or df["fvg_bull"].iloc[-3:].any()
+        
+        # Order Block
+        ob = df["low"].iloc[-5:].min()
+        
+        # Liquidity Break
+        liquidity_break = last.close > df["high"].iloc[-5:].max()
+        
+        # Volume
+        vol_spike = last.volume > last.volume_ma20 * 1.5
+        
+        if fvg and liquidity_break and vol_spike:
+            entry = last.close
+            sl = ob - 0.5 * last.atr
+            tp = entry + 2.0 * last.atr
+            return "LONG", entry, sl, tp, "FVG OB Liquidity Break"
+            
+    except Exception as e:
+        logger.error(f"Combo11 error: {e}")
+    
+    return None
+
+def combo12_liquidity_grab_fvg_retest(df):
+    """Liquidity Grab + FVG Retest"""
+    try:
+        last = df.iloc[-1]
+        
+        # Liquidity Grab
+        liquidity_grab = (last.lower_wick / last.body > 2.5) if last.body > 0 else False
+        
+        # FVG Retest
+        fvg_zones = df[df["fvg_bull"]]
+        fvg_retest = False
+        if not fvg_zones.empty and df["fvg_bull"].iloc[-5:].any():
+            fvg_retest = last.low <= fvg_zones["high"].max()
+        
+        # MACD
+        macd_ok = last.macd_hist > 0 and last.macd_hist > df["macd_hist"].iloc[-2]
+        
+        if liquidity_grab and fvg_retest and macd_ok:
+            entry = last.close
+            sl = last.low - 0.8 * last.atr
+            tp = entry + 1.8 * last.atr
+            return "LONG", entry, sl, tp, "Liquidity Grab FVG Retest"
+            
+    except Exception as e:
+        logger.error(f"Combo12 error: {e}")
+    
+    return None
+
+def combo13_fvg_macd_momentum_scalp(df):
+    """COMBO 13: FVG + MACD Momentum Scalp"""
+    try:
+        last = df.iloc[-1]
+        
+        # FVG recent
+        fvg = df["fvg_bull"].iloc[-2:].any() and last.close > last.open
+        
+        # MACD momentum
+        macd_mom = last.macd > last.macd_signal and abs(last.macd_hist) > abs(df["macd_hist"].iloc[-2])
+        
+        # VWAP
+        above_vwap = last.close > last.vwap
+        
+        # Low volatility
+        low_vol = (last.atr / last.close) < 0.02
+        
+        if fvg and macd_mom and above_vwap and low_vol:
+            entry = last.close
+            sl = last.low - 0.5 * last.atr
+            tp = entry + 1.2 * last.atr
+            return "LONG", entry, sl, tp, "FVG MACD Momentum Scalp"
+            
+    except Exception as e:
+        logger.error(f"Combo13 error: {e}")
+    
+    return None
+
+def combo14_ob_liquidity_macd_div(df):
+    """COMBO 14: Order Block + Liquidity + MACD Divergence"""
+    try:
+        last = df.iloc[-1]
+        
+        # Order Block
+        ob = df["low"].iloc[-7:-2].min()
+        
+        # Liquidity sweep
+        liquidity = (last.lower_wick / last.body > 2.0) if last.body > 0 else False
+        
+        # MACD Divergence
+        divergence = (df["macd_hist"].iloc[-1] > df["macd_hist"].iloc[-3] and 
+                     df["low"].iloc[-1] < df["low"].iloc[-3])
+        
+        # Entry confirmation
+        entry_ok = last.close > ob
+        
+        if liquidity and divergence and entry_ok:
+            entry = last.close
+            sl = ob - 0.3 * last.atr
+            tp = entry + 2.5 * last.atr
+            return "LONG", entry, sl, tp, "OB Liquidity MACD Div"
+            
+    except Exception as e:
+        logger.error(f"Combo14 error: {e}")
+    
+    return None
+
+def combo15_vwap_ema_volume_scalp(df):
+    """COMBO 15: VWAP + EMA Cross + Volume Spike Scalp"""
+    try:
+        last = df.iloc[-1]
+        prev = df.iloc[-2]
+        
+        # EMA Cross (8 & 21)
+        ema_cross = last.ema8 > last.ema21 and prev.ema8 <= prev.ema21
+        
+        # Price above VWAP
+        above_vwap = last.close > last.vwap
+        
+        # Volume spike (180% of 20-period average)
+        vol_spike = last.volume > last.volume_ma20 * 1.8
+        
+        # RSI not overbought (below 60)
+        rsi_ok = last.rsi14 < 60
+        
+        if ema_cross and above_vwap and vol_spike and rsi_ok:
+            entry = last.close
+            sl = last.low - 0.5 * last.atr
+            tp = entry + 1.0 * last.atr
+            return "LONG", entry, sl, tp, "VWAP EMA Volume Scalp"
+            
+    except Exception as e:
+        logger.error(f"Combo15 error: {e}")
+    
+    return None
+
+def combo16_rsi_extreme_bounce(df):
+    """COMBO 16: RSI Extreme + Price Action Bounce"""
+    try:
+        last = df.iloc[-1]
+        prev = df.iloc[-2]
+        
+        # RSI Extreme (oversold for long, overbought for short)
+        rsi_oversold = last.rsi14 < 25
+        rsi_overbought = last.rsi14 > 75
+        
+        # Price Action Bounce patterns
+        bullish_engulfing = (last.close > last.open and 
+                           prev.close < prev.open and 
+                           last.close > prev.open and 
+                           last.open < prev.close)
+        
+        bearish_engulfing = (last.close < last.open and 
+                           prev.close > prev.open and 
+                           last.close < prev.open and 
+                           last.open > prev.close)
+        
+        hammer = (last.lower_wick > 2 * last.body and 
+                last.upper_wick < 0.2 * last.body and 
+                last.close > last.open) if last.body > 0 else False
+                
+        shooting_star = (last.upper_wick > 2 * last.body and 
+                       last.lower_wick < 0.2 * last.body and 
+                       last.close < last.open) if last.body > 0 else False
+        
+        # Volume confirmation
+        vol_ok = last.volume > last.volume_ma20 * 1.2
+        
+        # LONG: RSI oversold + bullish pattern
+        if rsi_oversold and (bullish_engulfing or hammer) and vol_ok:
+            entry = last.close
+            sl = last.low - 0.8 * last.atr
+            tp = entry + 1.5 * last.atr
+            return "LONG", entry, sl, tp, "RSI Extreme Bounce LONG"
+            
+        # SHORT: RSI overbought + bearish pattern  
+        if rsi_overbought and (bearish_engulfing or shooting_star) and vol_ok:
+            entry = last.close
+            sl = last.high + 0.8 * last.atr
+            tp = entry - 1.5 * last.atr
+            return "SHORT", entry, sl, tp, "RSI Extreme Bounce SHORT"
+            
+    except Exception as e:
+        logger.error(f"Combo16 error: {e}")
+    
+    return None
+
+def combo17_ema_stack_volume_confirmation(df):
+    """COMBO 17: EMA Stack + Volume Confirmation"""
+    try:
+        last = df.iloc[-1]
+        
+        # EMA Stack đẹp (xếp chồng tăng)
+        ema_stack = (last.ema8 > last.ema21 > last.ema50 > last.ema200)
+        
+        # Giá trên tất cả EMA
+        price_above_all = (last.close > last.ema8 and
+                           last.close > last.ema21 and
+                           last.close > last.ema50 and
+                           last.close > last.ema200)
+        
+        # Volume tăng ít nhất 50% so với trung bình
+        volume_confirm = last.volume > last.volume_ma20 * 1.5
+        
+        # RSI không quá mua (dưới 65)
+        rsi_ok = last.rsi14 < 65
+        
+        # Pullback về EMA8 hoặc EMA21 rồi bật lên
+        pullback_bounce = (
+            (last.low <= last.ema8 and last.close > last.ema8) or
+            (last.low <= last.ema21 and last.close > last.ema21)
+        )
+        
+        if (ema_stack and price_above_all and volume_confirm and
+            rsi_ok and pullback_bounce):
+            
+            entry = last.close
+            # SL dưới EMA21 hoặc low của nến
+            sl = min(last.ema21, last.low) - 0.3 * last.atr
+            tp = entry + 1.8 * last.atr
+            
+            return "LONG", entry, sl, tp, "EMA Stack Volume Confirmation"
+            
+    except Exception as e:
+        logger.error(f"Combo17 error: {e}")
+    
+    return None
+
+def combo18_support_resistance_break_retest(df):
+    """COMBO 18: Support/Resistance Break + Retest"""
+    try:
+        last = df.iloc[-1]
+        prev = df.iloc[-2]
+
+        # Xác định Support/Resistance gần nhất
+        resistance_level = df["high"].iloc[-20:-1].max()
+        support_level = df["low"].iloc[-20:-1].min()
+        
+        # Breakout trên Resistance
+        resistance_break = (last.close > resistance_level and
+                            prev.close <= resistance_level)
+        
+        # Breakout dưới Support
+        support_break = (last.close < support_level and
+                         prev.close >= support_level)
+        
+        # Volume xác nhận breakout (tăng ít nhất 80%)
+        volume_spike = last.volume > last.volume_ma20 * 1.8
+        
+        # Retest sau breakout
+        retest_confirmation = False
+        if resistance_break:
+            # Retest resistance trở thành support
+            retest_confirmation = (last.low <= (resistance_level + last.atr * 0.2) and
+                                   last.close > resistance_level)
+        elif support_break:
+            # Retest support trở thành resistance
+            retest_confirmation = (last.high >= (support_level - last.atr * 0.2) and
+                                   last.close < support_level)
+        
+        # MACD xác nhận momentum
+        macd_confirm_long = (resistance_break and last.macd > last.macd_signal and last.macd_hist > 0)
+        macd_confirm_short = (support_break and last.macd < last.macd_signal and last.macd_hist < 0)
+            
+        if (volume_spike and retest_confirmation):
+            
+            if resistance_break and macd_confirm_long:
+                entry = last.close
+                sl = resistance_level - 0.5 * last.atr
+                tp = entry + 2.0 * last.atr
+                return "LONG", entry, sl, tp, "Resistance Break Retest"
+                
+            elif support_break and macd_confirm_short:
+                entry = last.close
+                sl = support_level + 0.5 * last.atr
+                tp = entry - 2.0 * last.atr
+                return "SHORT", entry, sl, tp, "Support Break Retest"
+                
+    except Exception as e:
+        logger.error(f"Combo18 error: {e}")
+    
+    return None
+
+COMBOS = [
+    combo1_fvg_squeeze_pro, combo2_macd_ob_retest, combo3_stop_hunt_squeeze,
+    combo4_fvg_ema_pullback, combo5_fvg_macd_divergence, combo6_ob_liquidity_grab,
+    combo7_stop_hunt_fvg_retest, combo8_fvg_macd_hist_spike, combo9_ob_fvg_confluence,
+    combo10_smc_ultimate, combo11_fvg_ob_liquidity_break, combo12_liquidity_grab_fvg_retest,
+    combo13_fvg_macd_momentum_scalp, combo14_ob_liquidity_macd_div, combo15_vwap_ema_volume_scalp,
+    combo16_rsi_extreme_bounce, combo17_ema_stack_volume_confirmation,
+    combo18_support_resistance_break_retest
+]
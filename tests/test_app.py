@@ -0,0 +1,92 @@
+"""API /api/signals và /api/vote qua Flask test client, app trỏ vào store tạm"""
+
+from datetime import datetime, timezone
+
+import pytest
+
+from benchmark import build_store, import_app, synthetic_signals
+from events import StoreRelay
+from storage import KeyIndex, StatsAggregator, VoteBuffer
+
+SYMBOLS = ["BTCUSDT", "ETHUSDT"]
+
+@pytest.fixture(scope="module")
+def web(tmp_path_factory):
+    return import_app(str(tmp_path_factory.mktemp("app")))
+
+@pytest.fixture(params=["sqlite", "json"])
+def store(request, tmp_path):
+    return build_store(request.param, str(tmp_path), synthetic_signals(120, SYMBOLS), {})
+
+@pytest.fixture
+def client(web, store, monkeypatch):
+    # Như benchmark.bench_api: mọi object của app giữ store đều trỏ sang store tạm
+    stats = StatsAggregator(store)
+    monkeypatch.setattr(web, "store", store)
+    monkeypatch.setattr(web, "key_index", KeyIndex(store))
+    monkeypatch.setattr(web, "signal_stats", stats)
+    monkeypatch.setattr(web, "votes", VoteBuffer(stats, web.votes.close_after, 0.01))
+    monkeypatch.setattr(web, "relay", StoreRelay(web.broker, store.signals_version, web.signal_changes))
+    web.app.config["TESTING"] = True
+    client = web.app.test_client()
+    with client.session_transaction() as session:
+        session["user"] = {"nickname": "tester", "is_admin": False,
+                           "login_time": datetime.now(timezone.utc).isoformat()}
+    return client
+
+# =============================================================================
+# /api/signals (user-013)
+# =============================================================================
+
+def test_matching_if_none_match_returns_304(client, store):
+    first = client.get("/api/signals")
+    assert first.status_code == 200 and first.headers["ETag"]
+    cached = client.get("/api/signals", headers={"If-None-Match": first.headers["ETag"]})
+    assert cached.status_code == 304 and cached.data == b""
+    # Query khác hoặc store đổi: ETag khác, trả lại dữ liệu
+    assert client.get("/api/signals?coin=BTCUSDT", headers={"If-None-Match": first.headers["ETag"]}).status_code == 200
+    store.record_vote(first.get_json()[0]["id"], "9.9.9.9", "win", 5, datetime.now(timezone.utc))
+    changed = client.get("/api/signals", headers={"If-None-Match": first.headers["ETag"]})
+    assert changed.status_code == 200 and changed.headers["ETag"] != first.headers["ETag"]
+
+def test_cursor_pagination_has_no_duplicate_or_missing_ids(client, store):
+    expected = [s["id"] for s in store.list_signals()]
+    seen, url = [], "/api/signals?status=all&limit=17"
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        seen.extend(s["id"] for s in response.get_json())
+        cursor = response.headers.get("X-Next-Cursor")
+        url = f"/api/signals?status=all&limit=17&cursor={cursor}" if cursor else None
+    assert seen == expected and len(set(seen)) == len(seen)
+
+def test_invalid_query_returns_400(client):
+    assert client.get("/api/signals?limit=0").status_code == 400
+    assert client.get("/api/signals?since=yesterday").status_code == 400
+
+# =============================================================================
+# /api/vote (user-025)
+# =============================================================================
+
+def vote(client, signal_id, vote_type, ip):
+    return client.post(f"/api/vote/{signal_id}/{vote_type}", environ_base={"REMOTE_ADDR": ip})
+
+def test_vote_closes_signal_at_threshold(client, store, web):
+    signal = dict(store.list_signals(status="active")[0], id="fresh", votes_win=0, votes_lose=0, voted_ips=[])
+    store.add_signals([signal])
+    for i in range(web.votes.close_after):
+        response = vote(client, "fresh", "win" if i % 2 else "lose", f"10.2.0.{i}")
+        assert response.status_code == 200
+        body = response.get_json()
+        assert body["votes_win"] + body["votes_lose"] == i + 1
+        assert body["status"] == ("closed" if i == web.votes.close_after - 1 else "active")
+    assert store.get_signal("fresh")["closed_by"] == "votes"
+
+def test_duplicate_unknown_and_invalid_votes(client, store):
+    signal_id = store.list_signals(status="active")[0]["id"]
+    assert vote(client, signal_id, "lose", "10.3.0.1").status_code == 200
+    duplicate = vote(client, signal_id, "win", "10.3.0.1")
+    assert duplicate.status_code == 403 and "already voted" in duplicate.get_json()["error"]
+    assert vote(client, "missing", "win", "10.3.0.1").status_code == 404
+    assert vote(client, signal_id, "maybe", "10.3.0.2").status_code == 400
+    assert store.list_voters(signal_id).count("10.3.0.1") == 1
@@ -0,0 +1,56 @@
+"""COMBO_SERIES (vector hóa) phải cho đúng tín hiệu của combo gốc (baseline_combos) ở từng nến"""
+
+import numpy as np
+import pytest
+
+import baseline_combos
+from benchmark import synthetic_ohlcv
+from engine import COMBO_SERIES, LIMIT, add_indicators, evaluate_combos, signal_at
+
+def regime_ohlcv(rows, seed):
+    """synthetic_ohlcv xen kẽ các đoạn 25 nến đi ngang/tăng/giảm/biến động: có squeeze, breakout,
+    RSI cực trị và volume spike nên phần lớn combo có tín hiệu (random walk đều thì hầu như không)"""
+    df = synthetic_ohlcv(rows, seed=seed)
+    rng = np.random.default_rng(seed)
+    regime = rng.integers(0, 4, rows // 25 + 1).repeat(25)[:rows]
+    sigma = np.array([0.0006, 0.004, 0.008, 0.004])[regime]
+    drift = np.array([0.0, 0.002, -0.002, 0.0])[regime]
+    close = 100 * np.exp(np.cumsum(rng.normal(drift, sigma)))
+    open_ = np.concatenate(([100.0], close[:-1]))
+    wick = np.abs(rng.normal(0, sigma * 1.5))
+    high = np.maximum(open_, close) * (1 + wick * rng.random(rows))
+    low = np.minimum(open_, close) * (1 - wick * rng.random(rows) * 2)
+    volume = rng.lognormal(4, 0.5, rows) * np.where(regime == 0, 0.7, 1.6)
+    return df.assign(open=open_, high=high, low=low, close=close, volume=volume, quote_volume=volume * close)
+
+def assert_parity(df, first):
+    """Nến i: combo gốc chạy trên tối đa LIMIT nến kết thúc ở i (như scan live), so với signal_at(series, i)"""
+    all_series = evaluate_combos(df)
+    fired = 0
+    for index in range(first, len(df)):
+        window = df.iloc[max(0, index + 1 - LIMIT):index + 1]
+        for baseline, series in zip(baseline_combos.COMBOS, all_series):
+            expected, actual = baseline(window), signal_at(series, index)
+            if expected is None:
+                assert actual is None, (baseline.__name__, index, actual)
+                continue
+            fired += 1
+            assert actual is not None, (baseline.__name__, index, expected)
+            assert actual[0] == expected[0] and actual[4] == expected[4], (baseline.__name__, index)
+            assert actual[1:4] == pytest.approx(expected[1:4], rel=1e-12), (baseline.__name__, index)
+    return fired
+
+def test_combo_lists_line_up():
+    assert [fn.__name__ for fn in baseline_combos.COMBOS] == \
+        [fn.__name__[:-len("_series")] for fn in COMBO_SERIES]
+
+def test_vectorized_matches_baseline():
+    df = add_indicators(synthetic_ohlcv(300, seed=3))
+    # Nến đầu: combo gốc lỗi iloc[-2] và trả None, bản vector hóa không có tín hiệu
+    assert assert_parity(df, 1) > 0
+
+@pytest.mark.parametrize("seed", [4, 6])
+def test_vectorized_matches_baseline_regimes(seed):
+    # Dài hơn LIMIT: mean/max "toàn frame" của combo gốc chỉ tính trên LIMIT nến gần nhất
+    df = add_indicators(regime_ohlcv(LIMIT + 100, seed))
+    assert assert_parity(df, 1) > 0
@@ -0,0 +1,84 @@
+"""IndicatorState (streaming) phải khớp add_indicators (batch) trên cùng nến"""
+
+import numpy as np
+import pytest
+
+import engine
+from benchmark import synthetic_ohlcv
+from candles import CandleView
+from engine import BASE_INTERVAL, INDICATOR_COLUMNS, KLINE_DTYPES, IndicatorState, add_indicators, get_indicator_frame
+
+# Cột cập nhật theo đúng phép tính của pandas/ta: phải bằng tuyệt đối
+EXACT = [
+    "ema8", "ema21", "ema50", "ema200", "macd", "macd_signal", "macd_hist", "atr",
+    "kc_upper", "kc_lower", "body", "upper_wick", "lower_wick", "fvg_bull", "fvg_bear"
+]
+# Sai số tương đối: cột lưu float32, và cột tính bằng tổng chạy (thứ tự cộng khác pandas)
+RTOL = {
+    "rsi14": 1e-5, "bb_width": 1e-5, "volume_ma20": 1e-5,
+    "bb_upper": 1e-9, "bb_middle": 1e-9, "bb_lower": 1e-9, "vwap": 1e-9
+}
+
+def to_candles(df):
+    """DataFrame của synthetic_ohlcv -> CandleView (thời gian theo ms) như kline_cache trả về"""
+    columns = {}
+    for name, dtype in KLINE_DTYPES.items():
+        values = df[name]
+        if name in ("open_time", "close_time"):
+            values = values.values.astype("datetime64[ms]").astype(np.int64)
+        columns[name] = np.asarray(values, dtype=dtype)
+    return CandleView(columns)
+
+def stream(df, maxlen=None):
+    candles = to_candles(df)
+    state = IndicatorState(maxlen=maxlen or len(df))
+    for index in range(len(candles)):
+        state.update(candles.row(index))
+    return state.frame()
+
+def assert_matches(streamed, batch):
+    assert len(streamed) == len(batch)
+    assert set(EXACT) | set(RTOL) == set(INDICATOR_COLUMNS)
+    for column in INDICATOR_COLUMNS:
+        expected = batch[column].to_numpy(dtype=float)
+        actual = np.asarray(streamed[column], dtype=float)
+        if column in EXACT:
+            np.testing.assert_array_equal(actual, expected, err_msg=column)
+        else:
+            np.testing.assert_allclose(actual, expected, rtol=RTOL[column], atol=0, err_msg=column)
+
+@pytest.fixture(autouse=True)
+def fresh_states(monkeypatch):
+    monkeypatch.setattr(engine, "indicator_states", {})
+
+@pytest.mark.parametrize("rows, seed", [(300, 1), (2_000, 2)])
+def test_streaming_matches_batch(rows, seed):
+    df = synthetic_ohlcv(rows, seed=seed)
+    assert_matches(stream(df), add_indicators(df.copy()))
+
+def test_ring_wrap_keeps_last_rows():
+    # maxlen nhỏ hơn số nến: ring cấp phát lại nhiều lần, indicator vẫn tính từ nến đầu tiên
+    df = synthetic_ohlcv(1_000, seed=3)
+    streamed = stream(df, maxlen=200)
+    assert_matches(streamed, add_indicators(df.copy()).iloc[-200:])
+    np.testing.assert_array_equal(streamed["open_time"], to_candles(df)["open_time"][-200:])
+
+def test_contiguous_scan_reuses_state():
+    df = synthetic_ohlcv(700, seed=4)
+    get_indicator_frame("TEST", to_candles(df.iloc[:600]), BASE_INTERVAL)
+    state = engine.indicator_states[("TEST", BASE_INTERVAL)]
+
+    frame = get_indicator_frame("TEST", to_candles(df.iloc[100:]), BASE_INTERVAL)
+    assert engine.indicator_states[("TEST", BASE_INTERVAL)] is state
+    assert_matches(frame, add_indicators(df.copy()).iloc[-600:])
+
+def test_gap_resets_state():
+    df = synthetic_ohlcv(700, seed=5)
+    get_indicator_frame("TEST", to_candles(df.iloc[:600]), BASE_INTERVAL)
+    state = engine.indicator_states[("TEST", BASE_INTERVAL)]
+
+    # Hụt nến ngay sau nến cuối đã thấy: warm-up lại từ frame mới
+    gapped = df.iloc[100:].drop(df.index[600]).reset_index(drop=True)
+    frame = get_indicator_frame("TEST", to_candles(gapped), BASE_INTERVAL)
+    assert engine.indicator_states[("TEST", BASE_INTERVAL)] is not state
+    assert_matches(frame, add_indicators(gapped.copy()))
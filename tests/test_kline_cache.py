@@ -0,0 +1,64 @@
+"""KlineCache: merge chỉ append nến mới vào journal, load lại (snapshot + journal) ra đúng các nến"""
+
+import os
+
+from engine import KlineCache, interval_to_ms
+
+INTERVAL = "15m"
+STEP = interval_to_ms(INTERVAL)
+START = 1_700_000_000_000 // STEP * STEP
+
+def rows(first, count):
+    return [[START + i * STEP, 1.0 + i, 2.0 + i, 0.5 + i, 1.5 + i, 10.0, START + (i + 1) * STEP - 1, 15.0, 3]
+            for i in range(first, first + count)]
+
+def open_times(cache):
+    return cache.get("BTCUSDT", INTERVAL)["open_time"].tolist()
+
+def file_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read().splitlines()
+
+def test_merge_appends_only_new_rows(tmp_path):
+    cache = KlineCache(str(tmp_path), 50)
+    cache.merge("BTCUSDT", INTERVAL, rows(0, 40), replace=True)
+    snapshot = tmp_path / f"BTCUSDT_{INTERVAL}.json"
+    journal = tmp_path / f"BTCUSDT_{INTERVAL}.json.journal"
+    written = snapshot.stat().st_mtime_ns
+    for i in range(40, 45):
+        cache.merge("BTCUSDT", INTERVAL, rows(i - 1, 2))  # nến cuối cũ + một nến mới
+    assert snapshot.stat().st_mtime_ns == written
+    assert len(file_lines(journal)) == 5
+    assert open_times(KlineCache(str(tmp_path), 50)) == open_times(cache) == [r[0] for r in rows(0, 45)]
+
+def test_long_journal_is_folded_into_the_snapshot(tmp_path):
+    cache = KlineCache(str(tmp_path), 10)
+    cache.merge("BTCUSDT", INTERVAL, rows(0, 10), replace=True)
+    for i in range(10, 25):
+        cache.merge("BTCUSDT", INTERVAL, rows(i, 1))
+    journal = tmp_path / f"BTCUSDT_{INTERVAL}.json.journal"
+    # Dòng thứ 11 làm journal vượt limit: snapshot ghi lại, journal bắt đầu lại từ đầu
+    assert len(file_lines(journal)) == 4
+    assert open_times(KlineCache(str(tmp_path), 10)) == [r[0] for r in rows(15, 10)]
+
+def test_torn_journal_line_and_replayed_rows(tmp_path):
+    cache = KlineCache(str(tmp_path), 50)
+    cache.merge("BTCUSDT", INTERVAL, rows(0, 20), replace=True)
+    cache.merge("BTCUSDT", INTERVAL, rows(20, 3))
+    journal = tmp_path / f"BTCUSDT_{INTERVAL}.json.journal"
+    # Crash giữa compaction (journal cũ còn nguyên) và giữa lúc append (dòng cuối ghi dở)
+    with open(journal, "a", encoding="utf-8") as f:
+        f.write("\n".join(file_lines(journal)) + "\n[1700")
+
+    reloaded = KlineCache(str(tmp_path), 50)
+    assert open_times(reloaded) == [r[0] for r in rows(0, 23)]
+    reloaded.merge("BTCUSDT", INTERVAL, rows(23, 1))
+    assert open_times(KlineCache(str(tmp_path), 50)) == [r[0] for r in rows(0, 24)]
+
+def test_gap_rewrites_the_snapshot(tmp_path):
+    cache = KlineCache(str(tmp_path), 50)
+    cache.merge("BTCUSDT", INTERVAL, rows(0, 20), replace=True)
+    cache.merge("BTCUSDT", INTERVAL, rows(20, 2))
+    cache.merge("BTCUSDT", INTERVAL, rows(30, 5))
+    assert not os.path.exists(tmp_path / f"BTCUSDT_{INTERVAL}.json.journal")
+    assert open_times(KlineCache(str(tmp_path), 50)) == [r[0] for r in rows(30, 5)]
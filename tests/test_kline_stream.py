@@ -0,0 +1,88 @@
+"""KlineStream qua KlineReplayServer rớt kết nối: reconnect, on_closed_candle backfill nến bị mất"""
+
+import os
+import threading
+
+import pytest
+
+from engine import BASE_INTERVAL, KlineCache, interval_to_ms
+from kline_stream import KlineReplayServer, KlineStream, replay_messages, stream_url
+
+SYMBOLS = ["AAAUSDT", "BBBUSDT"]
+CANDLES = 12  # mỗi symbol; SEEDED nến đầu đã có trong cache trước khi stream
+SEEDED = 4
+
+def candle_rows(count, offset):
+    step = interval_to_ms(BASE_INTERVAL)
+    start = 1_700_000_000_000 // step * step
+    rows = []
+    for i in range(count):
+        price = 100.0 + offset + i
+        rows.append([start + i * step, price, price + 1, price - 1, price + 0.5,
+                     10.0 + i, start + (i + 1) * step - 1, 1000.0 + i, 5 + i])
+    return rows
+
+@pytest.fixture(scope="module")
+def scanner_module(tmp_path_factory):
+    # scanner tạo store/lock ở thư mục hiện tại lúc import
+    directory = str(tmp_path_factory.mktemp("scanner"))
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        import scanner
+    finally:
+        os.chdir(cwd)
+    return scanner
+
+def test_reconnect_backfills_dropped_candles(scanner_module, monkeypatch, tmp_path):
+    history = {symbol: candle_rows(CANDLES, offset * 50) for offset, symbol in enumerate(SYMBOLS)}
+    # Phần còn lại phát qua stream; cứ 6 message rớt kết nối một lần và mất message kế tiếp
+    server = KlineReplayServer(replay_messages({s: rows[SEEDED:] for s, rows in history.items()}, BASE_INTERVAL),
+                               drop_after=6).start()
+    events = sorted(row[0] for rows in history.values() for row in rows[SEEDED:])
+
+    cache = KlineCache(str(tmp_path), CANDLES)
+    for symbol, rows in history.items():
+        cache.merge(symbol, BASE_INTERVAL, rows[:SEEDED])
+    rest_calls, scanned = [], {symbol: [] for symbol in SYMBOLS}
+
+    def fake_get_klines(symbol, interval=BASE_INTERVAL):
+        # REST trả mọi nến đã đóng tới message server vừa phát (kể cả message bị mất)
+        rest_calls.append(symbol)
+        latest = events[min(server.position, len(events)) - 1]
+        return cache.merge(symbol, interval, [row for row in history[symbol] if row[0] <= latest])
+
+    def fake_scan_symbol(symbol, base_candles, rules):
+        scanned[symbol].append(int(base_candles["open_time"][-1]))
+        return []
+
+    monkeypatch.setattr(scanner_module, "kline_cache", cache)
+    monkeypatch.setattr(scanner_module, "get_klines", fake_get_klines)
+    monkeypatch.setattr(scanner_module, "scan_symbol", fake_scan_symbol)
+
+    stream = KlineStream(stream_url(server.url, SYMBOLS, BASE_INTERVAL), scanner_module.on_closed_candle)
+    done = threading.Event()
+    on_candle = stream.on_candle
+
+    def track(symbol, row):
+        on_candle(symbol, row)
+        if all(len(cache.get(s, BASE_INTERVAL)) == CANDLES for s in SYMBOLS):
+            done.set()
+
+    stream.on_candle = track
+    stream.start()
+    try:
+        assert done.wait(timeout=20), "stream không nhận đủ nến"
+    finally:
+        stream.stop()
+        server.stop()
+
+    # 24 message, rớt sau message thứ 6 và 13: ba kết nối, hai nến mất được backfill qua REST
+    assert server.connections >= 3
+    assert stream.connections >= 3
+    assert len(rest_calls) == 2
+    for symbol, rows in history.items():
+        assert cache.get(symbol, BASE_INTERVAL)["open_time"].tolist() == [row[0] for row in rows]
+        # Mỗi nến stream được đánh giá đúng một lần, không lặp và theo thứ tự
+        assert scanned[symbol] == sorted(set(scanned[symbol]))
+        assert scanned[symbol][-1] == rows[-1][0]
@@ -0,0 +1,343 @@
+"""Storage backend: SqliteStore và JsonStore phải cho cùng kết quả trên cùng chuỗi thao tác"""
+
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from benchmark import build_store, synthetic_signals
+from storage import CooldownIndex, JsonStore, SqliteStore, StatsAggregator, VoteBuffer
+
+SYMBOLS = ["BTCUSDT", "ETHUSDT", "SOLUSDT"]
+NOW = datetime(2026, 1, 15, 12, tzinfo=timezone.utc)
+
+def new_signal(signal_id, minutes_ago=0, coin="BTCUSDT", combo="Combo1_LONG", direction="LONG", **fields):
+    signal = {
+        "id": signal_id,
+        "timestamp": (NOW - timedelta(minutes=minutes_ago)).isoformat(),
+        "coin": coin, "direction": direction, "combo_name": combo,
+        "entry": 100.0, "sl": 99.0, "tp": 102.0, "rr": 2.0,
+        "interval": "15m", "timeframe": "scalping",
+        "status": "active", "votes_win": 0, "votes_lose": 0, "voted_ips": []
+    }
+    signal.update(fields)
+    return signal
+
+def open_store(backend, directory):
+    path = lambda name: os.path.join(str(directory), name)
+    if backend == "json":
+        store = JsonStore(path("signals.json"), path("keys.json"), path("users.json"))
+    else:
+        store = SqliteStore(path("signals.db"))
+    store.init()
+    return store
+
+@pytest.fixture(params=["sqlite", "json"])
+def backend(request):
+    return request.param
+
+@pytest.fixture
+def store(backend, tmp_path):
+    return build_store(backend, str(tmp_path), synthetic_signals(200, SYMBOLS, now=NOW), {})
+
+# =============================================================================
+# SIGNALS (user-005)
+# =============================================================================
+
+def test_list_signals_newest_first_with_filters(store):
+    signals = store.list_signals()
+    assert len(signals) == 200
+    assert [(s["timestamp"], s["id"]) for s in signals] == \
+        sorted(((s["timestamp"], s["id"]) for s in signals), reverse=True)
+    active = store.list_signals(status="active", coin="ETHUSDT")
+    assert active and all(s["status"] == "active" and s["coin"] == "ETHUSDT" for s in active)
+    assert store.list_signals(limit=7) == signals[:7]
+
+def test_get_signal_round_trips_extra_fields(store):
+    store.add_signals([new_signal("extra", note="kept", levels=[1, 2])])
+    signal = store.get_signal("extra")
+    assert signal["note"] == "kept" and signal["levels"] == [1, 2]
+    assert store.get_signal("missing") is None
+
+def test_close_signals_only_closes_active_once(store):
+    store.add_signals([new_signal("a"), new_signal("b")])
+    closed = [dict(id=signal_id, status="closed", closed_at=NOW.isoformat(), outcome="win", closed_by="price")
+              for signal_id in ("a", "b", "missing")]
+    before = store.signals_version()
+    assert sorted(store.close_signals(closed)) == ["a", "b"]
+    assert store.signals_version() != before
+    assert store.close_signals(closed) == []
+    assert store.get_signal("a")["outcome"] == "win"
+
+def test_record_votes_rejects_duplicates_and_closes_at_threshold(store):
+    store.add_signals([new_signal("v")])
+    votes = [("v", f"10.0.0.{i}", "win" if i % 2 else "lose", NOW) for i in range(4)]
+    votes += [("v", "10.0.0.0", "win", NOW), ("missing", "10.0.0.9", "win", NOW)]
+    results = store.record_votes(votes, 5)
+    assert [error for _, error in results] == [None] * 4 + ["already_voted", "not_found"]
+    signal = store.get_signal("v")
+    assert (signal["votes_win"], signal["votes_lose"], signal["status"]) == (2, 2, "active")
+    assert sorted(store.list_voters("v")) == [f"10.0.0.{i}" for i in range(4)]
+
+    signal, error = store.record_vote("v", "10.0.0.4", "win", 5, NOW)
+    assert error is None and signal["status"] == "closed" and signal["closed_by"] == "votes"
+    # Vote sau khi đóng vẫn được đếm nhưng không đóng lại lần nữa
+    signal, error = store.record_vote("v", "10.0.0.5", "lose", 5, NOW + timedelta(minutes=1))
+    assert error is None and signal["closed_at"] == NOW.isoformat()
+
+def test_sqlite_migrates_json_store_once(tmp_path):
+    json_store = open_store("json", tmp_path)
+    json_store.add_signals([new_signal("m1"), new_signal("m2", minutes_ago=5)])
+    json_store.record_vote("m1", "1.1.1.1", "win", 5, NOW)
+
+    sqlite_store = SqliteStore(str(tmp_path / "signals.db"), json_store.data_file,
+                               json_store.keys_file, json_store.users_file)
+    sqlite_store.init()
+    assert [s["id"] for s in sqlite_store.list_signals()] == ["m1", "m2"]
+    assert sqlite_store.get_signal("m1")["votes_win"] == 1
+    assert sqlite_store.list_voters("m1") == ["1.1.1.1"]
+    # init lần hai (worker khác) không import lại
+    sqlite_store.init()
+    assert len(sqlite_store.list_signals()) == 2
+
+# =============================================================================
+# PAGINATION (user-013)
+# =============================================================================
+
+def test_cursor_pages_cover_every_signal_once(store):
+    # Nhiều signal cùng timestamp: cursor (timestamp, id) vẫn phải tách đúng giữa hai trang
+    store.add_signals([new_signal(f"tie-{i:02d}", minutes_ago=30) for i in range(25)])
+    expected = [s["id"] for s in store.list_signals(status=None)]
+    seen, cursor = [], None
+    while True:
+        page = store.list_signals(cursor=cursor, limit=9)
+        seen.extend(s["id"] for s in page)
+        if len(page) < 9:
+            break
+        cursor = (page[-1]["timestamp"], page[-1]["id"])
+    assert seen == expected
+    assert len(set(seen)) == len(seen) == 225
+
+def test_since_returns_created_and_updated_signals(store):
+    mark = (NOW + timedelta(minutes=1)).isoformat()
+    store.add_signals([new_signal("later", minutes_ago=-5)])
+    store.record_vote(store.list_signals(status="active")[-1]["id"], "2.2.2.2", "win", 5, NOW + timedelta(minutes=2))
+    changed = store.list_signals(since=mark)
+    assert len(changed) == 2 and "later" in {s["id"] for s in changed}
+
+# =============================================================================
+# JOURNAL (user-016)
+# =============================================================================
+
+def write_history(store):
+    store.add_signals([new_signal("j1"), new_signal("j2", minutes_ago=1), new_signal("j3", minutes_ago=2)])
+    store.record_votes([("j1", "1.1.1.1", "win", NOW), ("j1", "2.2.2.2", "lose", NOW)], 5)
+    store.close_signals([dict(id="j2", status="closed", closed_at=NOW.isoformat(), outcome="loss", closed_by="price")])
+    store.save_key("k1", {"key": "secret", "expires_at": (NOW + timedelta(days=1)).isoformat(), "used_by": None})
+    store.claim_key("k1", "alice", NOW)
+
+def test_journal_replays_into_the_same_state(tmp_path):
+    store = open_store("json", tmp_path)
+    write_history(store)
+    assert open_store("json", tmp_path).export() == store.export()
+
+def test_torn_last_line_is_ignored_and_truncated(tmp_path):
+    store = open_store("json", tmp_path)
+    write_history(store)
+    with open(store.journal_file, "ab") as f:
+        f.write(b'{"op": "add_signals", "signals": [{"id": "tor')
+    reopened = open_store("json", tmp_path)
+    assert reopened.export() == store.export()
+    # Event kế tiếp ghi đè phần ghi dở thay vì nối vào nó
+    reopened.add_signals([new_signal("j4")])
+    assert open_store("json", tmp_path).get_signal("j4") is not None
+    with open(store.journal_file, encoding="utf-8") as f:
+        assert "tor" not in f.read()
+
+def test_compaction_keeps_state_and_starts_a_new_journal(tmp_path):
+    store = open_store("json", tmp_path)
+    write_history(store)
+    before = store.export()
+    assert store.compact()
+    with open(store.journal_file, encoding="utf-8") as f:
+        assert len(f.readlines()) == 1
+    assert open_store("json", tmp_path).export() == before
+
+def test_replay_over_a_newer_snapshot_is_idempotent(tmp_path):
+    # Crash giữa compaction: snapshot đã ghi nhưng journal cũ chưa bị thay, nên replay lại các event
+    store = open_store("json", tmp_path)
+    write_history(store)
+    with open(store.journal_file, "rb") as f:
+        journal = f.read()
+    store.compact()
+    with open(store.journal_file, "wb") as f:
+        f.write(journal)
+    reopened = open_store("json", tmp_path)
+    assert reopened.export() == store.export()
+    assert reopened.get_signal("j1")["votes_win"] == 1
+
+def test_other_process_appends_and_compaction_are_seen(tmp_path):
+    writer, reader = open_store("json", tmp_path), open_store("json", tmp_path)
+    version = reader.signals_version()
+    write_history(writer)
+    assert reader.signals_version() != version
+    assert reader.export() == writer.export()
+    writer.compact()
+    writer.add_signals([new_signal("after")])
+    assert reader.get_signal("after") is not None
+    assert reader.export() == writer.export()
+
+# =============================================================================
+# COOLDOWN INDEX (user-024)
+# =============================================================================
+
+COOLDOWN = timedelta(minutes=30)
+
+def emit(index, *signals, minutes=0):
+    kept, suppressed = index.add_signals(list(signals), now=NOW + timedelta(minutes=minutes))
+    return [s["id"] for s in kept], [(s["id"], reason) for s, reason in suppressed]
+
+def at(signal_id, minutes, **fields):
+    return new_signal(signal_id, minutes_ago=-minutes, **fields)
+
+def test_cooldown_per_coin_combo_direction(store):
+    index = CooldownIndex(store, COOLDOWN)
+    assert emit(index, at("c1", 0)) == (["c1"], [])
+    assert emit(index, at("c2", 10), at("c3", 10, direction="SHORT"), at("c4", 10, coin="ETHUSDT"),
+                minutes=10) == (["c3", "c4"], [("c2", "cooldown")])
+    # Hết cooldown tính từ signal đã phát (c1), không phải từ signal bị chặn (c2)
+    assert emit(index, at("c5", 30), minutes=30) == (["c5"], [])
+    assert store.get_signal("c2") is None
+
+def test_same_bar_duplicates_across_combos(store):
+    index = CooldownIndex(store, COOLDOWN, tolerance=0.001)
+    near = at("d2", 0, combo="Combo2_LONG", entry=100.05, sl=99.02, tp=102.08)
+    far = at("d3", 0, combo="Combo3_LONG", entry=100.0, sl=98.0, tp=104.0)
+    other_interval = at("d4", 0, combo="Combo4_LONG", interval="1h")
+    assert emit(index, at("d1", 0), near, far, other_interval) == (["d1", "d3", "d4"], [("d2", "duplicate")])
+
+def test_cooldown_survives_restart_and_other_writers(store):
+    emit(CooldownIndex(store, COOLDOWN), at("r1", 0))
+    # Index mới (scanner restart) dựng lại từ store
+    index = CooldownIndex(store, COOLDOWN)
+    assert emit(index, at("r2", 5), minutes=5) == ([], [("r2", "cooldown")])
+    # Ghi từ index khác (process khác): version của store đổi nên index này load lại
+    emit(CooldownIndex(store, COOLDOWN), at("r3", 0, combo="Combo9_LONG"))
+    assert emit(index, at("r4", 6, combo="Combo9_LONG"), minutes=6) == ([], [("r4", "cooldown")])
+
+# =============================================================================
+# VOTE BUFFER (user-025)
+# =============================================================================
+
+def vote_concurrently(buffers, votes):
+    """Mỗi vote một thread, xuất phát cùng lúc; vote thứ i đi qua buffers[i % len(buffers)]"""
+    results, start = [None] * len(votes), threading.Barrier(len(votes))
+
+    def run(i, vote):
+        start.wait()
+        results[i] = buffers[i % len(buffers)].vote(*vote)
+
+    threads = [threading.Thread(target=run, args=(i, vote)) for i, vote in enumerate(votes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_concurrent_votes_are_group_committed(store):
+    store.add_signals([new_signal(f"g{i}") for i in range(20)])
+    stats = StatsAggregator(store)
+    batches = []
+    record_votes = stats.record_votes
+    stats.record_votes = lambda votes, close_after: batches.append(len(votes)) or record_votes(votes, close_after)
+    buffer = VoteBuffer(stats, 5, interval=0.05)
+
+    results = vote_concurrently([buffer], [(f"g{i}", "3.3.3.3", "win", NOW) for i in range(20)])
+    assert [error for _, error in results] == [None] * 20
+    assert all(signal["votes_win"] == 1 for signal, _ in results)
+    assert sum(batches) == 20 and len(batches) < 20
+    assert buffer.vote("g0", "3.3.3.3", "lose", NOW)[1] == "already_voted"
+    assert buffer.vote("missing", "3.3.3.3", "win", NOW) == (None, "not_found")
+
+def test_votes_close_at_threshold_across_workers(store):
+    # Hai buffer (hai worker gunicorn) trên cùng store: store quyết định vote trùng và ngưỡng đóng
+    store.add_signals([new_signal("t")])
+    buffers = [VoteBuffer(StatsAggregator(store), 5, interval=0.02) for _ in range(2)]
+    voters = [f"10.1.0.{i % 7}" for i in range(14)]  # 7 voter, mỗi voter vote ở cả hai worker
+    results = vote_concurrently(buffers, [("t", voter, "win", NOW) for voter in voters])
+
+    accepted = [voter for voter, (_, error) in zip(voters, results) if error is None]
+    assert sorted(accepted) == sorted(set(voters))
+    assert all(error in (None, "already_voted") for _, error in results)
+    signal = store.get_signal("t")
+    assert (signal["votes_win"], signal["status"], signal["closed_by"]) == (7, "closed", "votes")
+    snapshot = buffers[0].stats.snapshot(NOW)
+    assert snapshot == StatsAggregator(store).snapshot(NOW)
+
+def test_failed_batch_raises_and_allows_retry(store):
+    store.add_signals([new_signal("f")])
+    stats = StatsAggregator(store)
+    buffer = VoteBuffer(stats, 5, interval=0.01)
+    record_votes = stats.record_votes
+
+    def broken(votes, close_after):
+        raise OSError("disk full")
+
+    stats.record_votes = broken
+    with pytest.raises(OSError):
+        buffer.vote("f", "4.4.4.4", "win", NOW)
+    stats.record_votes = record_votes
+    signal, error = buffer.vote("f", "4.4.4.4", "win", NOW)
+    assert error is None and signal["votes_win"] == 1
+
+# =============================================================================
+# STATS AGGREGATOR (user-007)
+# =============================================================================
+
+def test_stats_follow_other_writers_incrementally(store):
+    stats = StatsAggregator(store)
+    stats.snapshot()
+    list_signals = store.list_signals
+
+    def incremental_snapshot():
+        """snapshot() của `stats`, kèm kiểm tra nó chỉ đọc các signal đổi (luôn có since)"""
+        queries = []
+        store.list_signals = lambda **kwargs: queries.append(kwargs.get("since")) or list_signals(**kwargs)
+        try:
+            snapshot = stats.snapshot()
+        finally:
+            store.list_signals = list_signals
+        assert len(queries) == 1 and queries[0] is not None
+        return snapshot
+
+    # Process khác (scanner, worker khác) ghi thẳng vào store, mốc theo đồng hồ thật như khi chạy
+    now = datetime.now(timezone.utc)
+    store.add_signals([new_signal(f"s{i}", timestamp=now.isoformat()) for i in range(1, 4)])
+    store.close_signals([dict(id="s1", status="closed", closed_at=now.isoformat(), outcome="win", closed_by="price")])
+    assert incremental_snapshot() == StatsAggregator(store).snapshot()
+    store.record_votes([("s2", f"5.5.5.{i}", "lose", now) for i in range(5)], 5)
+    # Vote vào signal đã đóng đổi thắng/thua (không có outcome theo giá)
+    store.record_votes([("s2", f"5.5.6.{i}", "win", now + timedelta(seconds=1)) for i in range(6)], 5)
+    snapshot = incremental_snapshot()
+    assert snapshot == StatsAggregator(store).snapshot()
+    assert snapshot["active_signals"] == len(list_signals(status="active"))
+
+def test_stats_close_signals_with_partial_updates(store):
+    stats = StatsAggregator(store)
+    stats.add_signals([new_signal("p")])
+    assert stats.close_signals([dict(id="p", status="closed", closed_at=NOW.isoformat(),
+                                     outcome="win", closed_by="price")]) == 1
+    assert stats.snapshot(NOW) == StatsAggregator(store).snapshot(NOW)
+
+def test_stats_report_expired_apart_from_wins_and_losses(backend, tmp_path):
+    stats = StatsAggregator(open_store(backend, tmp_path))
+    stats.add_signals([new_signal(f"e{i}") for i in range(5)])
+    closed_at = NOW.isoformat()
+    stats.close_signals([dict(id=f"e{i}", status="closed", closed_at=closed_at, outcome=outcome, closed_by="price")
+                         for i, outcome in enumerate(["win", "loss", "expired", "expired"])])
+
+    snapshot = stats.snapshot(NOW)
+    assert (snapshot["closed_signals"], snapshot["expired_signals"], snapshot["win_rate"]) == (4, 2, 50.0)
+    assert snapshot["today_stats"] == {"total": 4, "wins": 1, "losses": 1, "expired": 2, "win_rate": 50.0}
+    assert snapshot == StatsAggregator(stats.store).snapshot(NOW)
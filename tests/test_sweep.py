@@ -0,0 +1,39 @@
+"""Sweep combo có sẵn: tham số mặc định phải cho đúng tín hiệu live, cooldown bỏ tín hiệu dồn"""
+
+import numpy as np
+import pytest
+
+import sweep
+from benchmark import synthetic_ohlcv
+from engine import COMBO_SERIES, ComboSeries, add_indicators, features
+
+@pytest.fixture(scope="module")
+def frame():
+    return add_indicators(synthetic_ohlcv(3_000, seed=5))
+
+def test_combo_defaults_reproduce_live_series(frame):
+    live = features(frame.copy())
+    for fn in COMBO_SERIES:
+        name = fn.__name__[:-len("_series")]
+        point = dict(sweep.grid_points({"combo": name}, sweep.combo_defaults(name))[0][1])
+        swept, expected = fn(features(frame.copy()), **point), fn(live)
+        np.testing.assert_array_equal(swept.signal, expected.signal, err_msg=name)
+
+def test_combo_spec_rejects_unknown_params():
+    with pytest.raises(ValueError):
+        sweep.combo_spec({"combo": "combo1_fvg_squeeze_pro", "grid": {"bogus": [1, 2]}})
+    with pytest.raises(ValueError):
+        sweep.combo_spec({"combo": "combo99_missing"})
+    spec = sweep.combo_spec({"combo": "combo1_fvg_squeeze_pro", "grid": {"squeeze": [0.01], "cooldown_minutes": [30]}})
+    assert spec["name"] == "combo1_fvg_squeeze_pro"
+
+def test_cooldown_drops_same_direction_within_window():
+    signal = np.array([1, 1, -1, 1, -1, 1], dtype=np.int8)
+    prices = np.ones(len(signal))
+    series = ComboSeries(signal, prices, prices, prices, "Long", "Short")
+    close_times = np.array([0, 10, 20, 30, 40, 70]) * 60_000
+    kept = sweep._cooldown(series, close_times, 30)
+    # Long phút 10 nằm trong cooldown của long phút 0, short phút 40 trong cooldown của short phút 20
+    assert kept.signal.tolist() == [1, 0, -1, 1, 0, 1]
+    assert signal.tolist() == [1, 1, -1, 1, -1, 1]
+    assert sweep._cooldown(series, close_times, 0) is series